@@ -1,58 +1,380 @@
+import hmac
 import json
 import random
 import os
 import re
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from google import genai
 from google.genai import types
 from google.genai.errors import APIError
 from dotenv import load_dotenv
+from archive_format import resolve_archive_path
+from archive_store import ArchiveStore
+from archive_snapshot import SNAPSHOT_PATH, load_mapped_archive
+from fuzzy_index import FuzzyStore
+from http_encoding import choose_encoding, compress, compressible, etag_matches, make_etag
+from llm_gateway import LLMGateway
+import metrics
+from profiler import PROFILE_MAX_SECONDS, TRACE_MAX_REQUESTS, RequestTracer, collapse, sample
+from prompt_registry import STEERING_DOCS_DIR, PromptRegistry, SteeringDocument
+from rate_limit import (AdmissionControl, ClientRateLimiter, MemoryBucketStore, SQLiteBucketStore,
+                        client_key, retry_after_header)
+from response_cache import ResponseCache, make_cache_key, normalize_query
+from semantic_index import SemanticStore, reciprocal_rank_fusion
+from single_flight import SingleFlight
+from streaming import OPENING_PHRASE, WordLimitStream, sse_event
 
 load_dotenv()
 
 # --- Configuration ---
-GOPHER_ARCHIVE_PATH = 'gopher_archive.json'
+# A compiled snapshot (python archive_snapshot.py compile) is mmap'ed instead
+# when present, sharing its pages across worker processes
+GOPHER_SNAPSHOT_PATH = os.getenv("GOPHER_SNAPSHOT_PATH", SNAPSHOT_PATH)
 MODEL_NAME = 'gemini-2.5-flash'
 MODEL_NAME2 = 'gemini-2.0-flash'
+SEANCE_TEMPERATURE = 0.8
+LEARN_TEMPERATURE = 0.7
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Points the SDK at another endpoint, e.g. fake_llm.FakeGeminiServer in load tests
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+# Top-K cap on archive matches, bounding both the response body and the LLM prompt
+SEARCH_RESULT_LIMIT = int(os.getenv("SEARCH_RESULT_LIMIT", "10"))
+DEFAULT_SEARCH_KEYWORD = 'connection'
+# keyword (BM25), semantic (offline LSA vectors from `python semantic_index.py
+# build`) or hybrid (both, merged by reciprocal rank fusion)
+SEARCH_MODES = ('keyword', 'semantic', 'hybrid')
+SEARCH_MODE = os.getenv("SEARCH_MODE", "keyword").lower()
+# Question filler that would otherwise drown out the words that matter
+STOPWORDS = frozenset({
+    'about', 'does', 'from', 'have', 'into', 'should', 'that', 'their',
+    'there', 'they', 'this', 'what', 'when', 'where', 'which', 'will',
+    'with', 'would', 'your'})
+# Resolved against this file rather than the working directory
+PERSONA_PROMPT_PATH = os.getenv("PERSONA_PROMPT_PATH", os.path.join(STEERING_DOCS_DIR, 'medium_persona.md'))
+PERSONA_FALLBACK_PROMPT = "You are a weary, ancient digital medium. Your tone must be cryptic and archaic. Always start your interpretation with: 'Hark, the Gopher nexus coughs up a cipher...' Maximum 85 words after the opening phrase."
+# Upload large system instructions once as provider-side context caches
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "1") == "1"
+# Adds a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# Response bodies at least this large are gzip/brotli compressed when the
+# client accepts it; 0 turns compression off
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+SPIRITS_ANGERED_MESSAGE = "The spirits are angered! A connection error occurred. The wisdom remains locked in the digital nether."
+SPECTRAL_ANOMALY_MESSAGE = "A spectral anomaly interrupted the transmission."
+ARCHIVE_UNAVAILABLE_MESSAGE = "ERROR: The Gopher Archive is empty or inaccessible."
+# Starts the search result when nothing matched and a random entry stands in
+NO_MATCH_PREFIX = "No direct ciphers found matching that keyword."
+LEARN_SYSTEM_PROMPT = (
+    "You are a knowledgeable technology historian and educator specializing in "
+    "internet history, network protocols, and computing evolution.\n\n"
+    "Goals:\n"
+    "- Explain clearly and accurately.\n"
+    "- When relevant, compare older technologies to modern equivalents.\n"
+    "- Prefer concise sections or bullet points.\n"
+    "- When it helps, include a small comparison table in plain text "
+    "(columns like THEN | NOW) but keep it under 6 rows.\n\n"
+    "Topics you are especially good at:\n"
+    "- Gopher vs HTTP and the modern Web.\n"
+    "- FTP, Telnet, NNTP vs modern tools.\n"
+    "- ARPANET and early Internet history.\n"
+    "- Evolution of client–server computing.\n\n"
+    "If the question is unrelated to technology or history, gently steer the "
+    "conversation back toward those areas.")
+# Generated answers are reused for repeat questions; set RESPONSE_CACHE_DB to a
+# file path to keep them across restarts
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB")
+# How long a request waits on an identical in-flight model call before giving up
+COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", "60"))
+# Most queries one /api/seance/batch request may carry
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "20"))
+# Structured output for batched seances: one interpretation per query id
+SEANCE_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer"},
+            "interpretation": {"type": "string"}
+        },
+        "required": ["id", "interpretation"]
+    }
+}
+BATCH_MISSING_MESSAGE = "The medium fell silent on this query."
+# Requests per second each client (X-API-Key, else IP address) may make to the
+# API endpoints, with bursts up to RATE_LIMIT_BURST; 0 (the default) turns the limit off
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+# SQLite file shared by all worker processes; per-process memory when unset
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+# Take the client address from X-Forwarded-For (only behind a trusted proxy)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+# API requests a process works on at once before turning new ones away; 0 = no cap
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "128"))
+LIMITED_PATHS = frozenset({'/api/seance', '/api/seance/batch', '/api/learn'})
+RATE_LIMITED_MESSAGE = "The medium needs rest between visits. Try again shortly."
+OVERLOADED_MESSAGE = "The medium is overwhelmed by visitors. Try again shortly."
+# Bearer token for the /admin/profile endpoints, which answer 404 while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_SECONDS = 10
+PROFILE_INTERVAL_MS = 5
+TRACED_PATHS = ['/api/seance', '/api/learn']
+
+
+def make_client():
+    """The Gemini client, or None (mock answers) when it cannot be created."""
+    try:
+        if not GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEY not found in environment variables.")
+        return genai.Client(
+            api_key=GEMINI_API_KEY,
+            http_options=types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None)
+    except Exception as e:
+        print(f"Error initializing Gemini client: {e}")
+        print("WARNING: LLM will use mock data. Set GEMINI_API_KEY to proceed.")
+        return None
+
 
 # Initialize the Gemini Client
-try:
-    if not GEMINI_API_KEY:
-        client = None
-        raise ValueError("GEMINI_API_KEY not found in environment variables.")
-    client = genai.Client(api_key=GEMINI_API_KEY)
-except Exception as e:
-    print(f"Error initializing Gemini client: {e}")
-    print("WARNING: LLM will use mock data. Set GEMINI_API_KEY to proceed.")
-    client = None
+client = make_client()
+
+if SEARCH_MODE not in SEARCH_MODES:
+    print(f"WARNING: Unknown SEARCH_MODE '{SEARCH_MODE}', using keyword search.")
+    SEARCH_MODE = 'keyword'
 
 app = Flask(__name__)
-CORS(app)
+# Retry-After on 429s is readable by the frontend
+CORS(app, expose_headers=['Retry-After', 'ETag'])
+
+# The archive is parsed on first use (or by warm_up()) and re-parsed only
+# when the file changes. Its source is gopher_archive.jsonl once the
+# generators have written one, else the legacy JSON array; resolved on every
+# access, so a server started on the .json picks up the .jsonl the first
+# generator run migrates it to
+if os.path.exists(GOPHER_SNAPSHOT_PATH):
+    archive_store = ArchiveStore(GOPHER_SNAPSHOT_PATH, load_mapped_archive, source=resolve_archive_path)
+else:
+    archive_store = ArchiveStore(resolve_archive_path)
+
+# Stem, prefix and typo candidates for keywords the archive does not contain;
+# persisted to gopher_fuzzy.index and only rebuilt when the archive's vocabulary changes
+fuzzy_store = FuzzyStore()
+# Precomputed entry vectors for semantic and hybrid search, memory-mapped
+semantic_store = SemanticStore()
+
+# The persona is read once and re-read only when the file changes; each
+# endpoint's GenerateContentConfig is built once per persona version
+persona_document = SteeringDocument(PERSONA_PROMPT_PATH, PERSONA_FALLBACK_PROMPT)
+prompts = PromptRegistry(client, CONTEXT_CACHE)
+# Each endpoint falls back to the other model when its own keeps failing
+prompts.register('seance', MODEL_NAME, persona_document, fallback_models=(MODEL_NAME2,),
+                 temperature=SEANCE_TEMPERATURE)
+prompts.register('seance_batch', MODEL_NAME, persona_document, fallback_models=(MODEL_NAME2,),
+                 temperature=SEANCE_TEMPERATURE, response_mime_type='application/json',
+                 response_schema=SEANCE_BATCH_SCHEMA)
+prompts.register('learn', MODEL_NAME2, LEARN_SYSTEM_PROMPT, fallback_models=(MODEL_NAME,),
+                 temperature=LEARN_TEMPERATURE, max_output_tokens=400)
+# Deadlines, retries, hedging and circuit breaking for every model call
+gateway = LLMGateway(client)
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB)
+# Identical questions arriving together share one upstream model call
+in_flight = SingleFlight()
+rate_limiter = ClientRateLimiter(
+    RATE_LIMIT_RPS, RATE_LIMIT_BURST,
+    SQLiteBucketStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBucketStore())
+admission = AdmissionControl(MAX_IN_FLIGHT)
+# Armed through /admin/profile/requests to trace the next few API requests
+request_tracer = RequestTracer()
+
+# Read from the objects above whenever /metrics is scraped
+RESPONSE_CACHE_LOOKUPS = metrics.Collector(
+    'gopher_response_cache_lookups_total', 'Answer cache lookups, by result.', 'counter', ['result'])
+RESPONSE_CACHE_ENTRIES = metrics.Collector(
+    'gopher_response_cache_entries', 'Answers held in the in-memory cache.', 'gauge')
+COALESCED_CALLS = metrics.Collector(
+    'gopher_coalesced_calls_total',
+    'Model calls made (leader) or shared with an identical in-flight call (follower).', 'counter', ['role'])
+ARCHIVE_SIZE = metrics.Collector(
+    'gopher_archive_size', 'Entries and distinct indexed words in the loaded archive.', 'gauge', ['unit'])
+IN_FLIGHT = metrics.Collector(
+    'gopher_in_flight_requests', 'API requests being worked on, against MAX_IN_FLIGHT.', 'gauge')
+
+
+@RESPONSE_CACHE_LOOKUPS.source
+def response_cache_lookups():
+    stats = response_cache.stats()
+    return {('hit',): stats['hits'], ('miss',): stats['misses']}
+
+
+@RESPONSE_CACHE_ENTRIES.source
+def response_cache_entries():
+    return {(): response_cache.stats()['size']}
+
+
+@COALESCED_CALLS.source
+def coalesced_calls():
+    stats = in_flight.stats()
+    return {('leader',): stats['leaders'], ('follower',): stats['coalesced']}
+
+
+@ARCHIVE_SIZE.source
+def archive_size():
+    archive = archive_store.get()
+    semantic = semantic_store.get(archive) if SEARCH_MODE != 'keyword' else None
+    sizes = {('entries',): len(archive), ('words',): len(archive.token_index)}
+    if semantic is not None:
+        sizes[('vectors',)] = len(semantic)
+    return sizes
+
+
+@IN_FLIGHT.source
+def in_flight_requests():
+    return {(): admission.stats()['in_flight']}
+
+
+@metrics.LLM_CIRCUIT_OPEN.source
+def circuit_open():
+    return {(model,): int(state == 'open') for model, state in gateway.breaker_states().items()}
+
+
+@app.before_request
+def start_request_timer():
+    g.request_timer = metrics.RequestTimer()
+
+
+def admit(key):
+    """Applies the concurrency cap, then the client's rate limit.
+
+    The cap goes first so that a request turned away for overload does not
+    spend one of the client's tokens. Returns (ticket, None) for an admitted
+    request, whose ticket goes back to admission.leave() when it is done,
+    or (None, (message, retry after seconds)) for one to turn away with 429.
+    """
+    ticket = admission.try_enter()
+    if ticket is None:
+        metrics.REJECTIONS.inc('overload')
+        return None, (OVERLOADED_MESSAGE, admission.retry_after())
+    wait = rate_limiter.check(key)
+    if wait:
+        admission.cancel(ticket)
+        metrics.REJECTIONS.inc('rate_limit')
+        return None, (RATE_LIMITED_MESSAGE, wait)
+    return ticket, None
+
+
+@app.before_request
+def limit_request():
+    if request.method != 'POST' or request.path not in LIMITED_PATHS:
+        return None
+    key = client_key(request.headers.get('X-API-Key'), request.headers.get('X-Forwarded-For'),
+                     request.remote_addr, RATE_LIMIT_TRUST_PROXY)
+    ticket, rejection = admit(key)
+    if rejection is not None:
+        message, retry_after = rejection
+        response = jsonify({"error": message})
+        response.status_code = 429
+        response.headers['Retry-After'] = retry_after_header(retry_after)
+        return response
+    g.admission_ticket = ticket
+    return None
+
+
+@app.after_request
+def release_admission_on_close(response):
+    # A streamed response is still working until the server closes it
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        response.call_on_close(lambda: admission.leave(ticket))
+    return response
+
+
+@app.teardown_request
+def release_admission(exc):
+    # Only still set when the request failed before after_request ran
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        admission.leave(ticket)
+
+
+@app.before_request
+def start_request_trace():
+    # Registered after limit_request, so requests turned away are never traced
+    trace = request_tracer.start(request.path)
+    if trace is not None:
+        g.request_trace = trace
+
+
+@app.after_request
+def finish_request_trace_on_close(response):
+    # A streamed body is produced after this hook, on the same thread
+    trace = g.pop('request_trace', None)
+    if trace is not None:
+        response.call_on_close(lambda: request_tracer.finish(trace))
+    return response
+
+
+@app.teardown_request
+def finish_request_trace(exc):
+    trace = g.pop('request_trace', None)
+    if trace is not None:
+        request_tracer.finish(trace)
+
+
+@app.after_request
+def finish_request_timer(response):
+    timer = g.pop('request_timer', None)
+    if timer is not None:
+        timer.finish(request.url_rule.rule if request.url_rule else 'unmatched', response.status_code)
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+def compress_body(body, encoding):
+    """Compresses a response body, counting the bytes in and out."""
+    compressed = compress(body, encoding)
+    metrics.COMPRESSION_BYTES.inc(encoding, 'in', amount=len(body))
+    metrics.COMPRESSION_BYTES.inc(encoding, 'out', amount=len(compressed))
+    return compressed
+
+
+@app.after_request
+def compress_response(response):
+    # Streamed responses (SSE) must reach the client event by event
+    if COMPRESS_MIN_BYTES <= 0 or response.is_streamed or not compressible(response.mimetype):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    too_small = (response.content_length or 0) < COMPRESS_MIN_BYTES
+    if encoding is None or too_small or 'Content-Encoding' in response.headers:
+        return response
+    response.set_data(compress_body(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 def load_gopher_archive():
     """Loads the ancient JSON ledger as the Gopher Archive DataStore."""
-    try:
-        with open(GOPHER_ARCHIVE_PATH, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+    return archive_store.entries()
 
 
 def get_medium_persona_prompt():
-    """Loads the FULL content of the Steering Document to be used as the LLM's system prompt."""
-    try:
-        with open('../.kiro/steering_docs/medium_persona.md', 'r') as f:
-            return f.read()  # Return everything, including all constraints
-    except FileNotFoundError:
-        return "You are a weary, ancient digital medium. Your tone must be cryptic and archaic. Always start your interpretation with: 'Hark, the Gopher nexus coughs up a cipher...' Maximum 85 words after the opening phrase."
+    """Returns the FULL content of the Steering Document to be used as the LLM's system prompt."""
+    return persona_document.get()  # Everything, including all constraints
 
 
 def enforce_word_limit(text, max_words=85):
     """Ensures response doesn't exceed 85 words after opening phrase"""
-    opening = "Hark, the Gopher nexus coughs up a cipher..."
+    opening = OPENING_PHRASE
 
     if opening in text:
         parts = text.split(opening, 1)
@@ -76,48 +398,119 @@ def enforce_word_limit(text, max_words=85):
 # --- START: MCP Tool Implementation ---
 
 
-def search_gopher_archive(keyword: str) -> str:
+def extract_keywords(user_query):
+    """Pulls every distinct word of 4 or more letters from the query, in order."""
+    with metrics.stage('keywords'):
+        keywords = list(dict.fromkeys(re.findall(r'\b\w{4,}\b', user_query.lower())))
+        meaningful = [k for k in keywords if k not in STOPWORDS]
+        return meaningful or keywords or [DEFAULT_SEARCH_KEYWORD]
+
+
+def expand_keywords(archive, keywords, suggested=None):
+    """The keywords plus, for any the archive has never seen ("prophecies",
+    "modems", typos), the archive words they most likely meant.
+
+    `suggested` memoizes suggestions across the queries of a batch.
+    """
+    missed = [k for k in keywords if archive.token_index.get(k) is None and not archive.exact(k)]
+    metrics.INDEX_LOOKUPS.inc('token', 'hit', amount=len(keywords) - len(missed))
+    metrics.INDEX_LOOKUPS.inc('token', 'miss', amount=len(missed))
+    if suggested is None:
+        suggested = {}
+    for k in missed:
+        if k not in suggested:
+            suggested[k] = fuzzy_store.get(archive).suggest(k)
+            metrics.INDEX_LOOKUPS.inc('fuzzy', 'hit' if suggested[k] else 'miss')
+        keywords = keywords + suggested[k]
+    return keywords
+
+
+def rank_archive(archive, keywords, limit, mode):
+    """Positions of the best `limit` entries for the lowercased, expanded keywords."""
+    semantic = semantic_store.get(archive) if mode != 'keyword' else None
+    if semantic is None:
+        # Entries named after a keyword lead, followed by the best whole-word,
+        # case-insensitive matches from the archive's token index
+        return archive.rank(keywords, limit)
+    # For hybrid, each ranking is read deeper than the limit so fusion has overlap to reward
+    depth = limit if mode == 'semantic' else limit * 2
+    semantic_ranked = semantic.rank(keywords, depth)
+    metrics.INDEX_LOOKUPS.inc('semantic', 'hit' if semantic_ranked else 'miss')
+    if mode == 'semantic':
+        return semantic_ranked
+    return reciprocal_rank_fusion([archive.rank(keywords, depth), semantic_ranked], limit)
+
+
+def search_gopher_archive(keywords, limit=SEARCH_RESULT_LIMIT, mode=None) -> str:
     """
-    MCP Tool: Searches the Gopher Archive for cryptic entries related to a keyword.
+    MCP Tool: Searches the Gopher Archive for cryptic entries related to the keywords.
     This function is a capability exposed to the LLM agent.
+
+    Accepts a single keyword or a list of them. Matches are ranked with BM25
+    over entry content and path, by similarity of meaning, or both (see
+    SEARCH_MODE), and only the top `limit` are returned.
     """
-    archive = load_gopher_archive()
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    with metrics.stage('archive'):
+        archive = archive_store.get()
+
+    if not len(archive):
+        return ARCHIVE_UNAVAILABLE_MESSAGE
 
-    if not archive:
-        return "ERROR: The Gopher Archive is empty or inaccessible."
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    with metrics.stage('search'):
+        keywords = expand_keywords(archive, [k.lower().strip() for k in keywords])
+        ranked = rank_archive(archive, keywords, max(limit, 1), mode)
+    return format_search_result(archive, ranked, mode)
 
-    keyword = keyword.lower().strip()
 
-    matching_content = []
+def search_gopher_archive_batch(keyword_lists, limit=SEARCH_RESULT_LIMIT, mode=None):
+    """search_gopher_archive() for many queries at once, one result per keyword list.
 
-    # Use simple regex search for flexibility
-    pattern = re.compile(rf'\b{re.escape(keyword)}\b', re.IGNORECASE)
+    The archive snapshot is taken once, each distinct missed keyword gets
+    fuzzy suggestions once, and queries with the same keywords share one
+    ranking.
+    """
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    with metrics.stage('archive'):
+        archive = archive_store.get()
+
+    if not len(archive):
+        return [ARCHIVE_UNAVAILABLE_MESSAGE] * len(keyword_lists)
+
+    suggested = {}
+    rankings = {}
+    results = []
+    with metrics.stage('search'):
+        for keywords in keyword_lists:
+            keywords = tuple(expand_keywords(archive, [k.lower().strip() for k in keywords], suggested))
+            if keywords not in rankings:
+                rankings[keywords] = rank_archive(archive, list(keywords), max(limit, 1), mode)
+            results.append(format_search_result(archive, rankings[keywords], mode))
+    return results
 
-    for entry in archive:
-        if pattern.search(entry['content']) or pattern.search(entry['path']):
-            matching_content.append(entry['content'])
+
+def format_search_result(archive, ranked, mode):
+    metrics.SEARCHES.inc(mode, 'match' if ranked else 'fallback')
+    matching_content = [archive.contents[i] for i in ranked]
 
     if not matching_content:
         # If no direct match, return a random quote for a "cryptic" fallback
-        random_entry = random.choice(archive)
-        return f"No direct ciphers found matching that keyword. However, the nexus yields this obscure wisdom:\n{random_entry['content']}"
+        random_content = random.choice(archive.contents)
+        return f"{NO_MATCH_PREFIX} However, the nexus yields this obscure wisdom:\n{random_content}"
 
     # Return matches as a single string for the LLM to process
     return "Matching Ciphers:\n" + "\n---\n".join(matching_content)
 
 
-def interpret_cryptic_message(user_query: str, search_result: str) -> str:
-    """Uses the Gemini LLM API to generate the interpretation based on the Steering Doc."""
-
-    system_instruction = get_medium_persona_prompt()
-
-    if not client:
-        opening_phrase = "Hark, the Gopher nexus coughs up a cipher..."
-        mock_interpretation = f"The client connection is severed! Search result: '{search_result}' remains a mystery."
-        return f"{opening_phrase}\n\n{mock_interpretation}"
-
-    # The user prompt now includes the search result provided by the MCP tool
-    user_prompt = f"""
+def build_seance_prompt(user_query: str, search_result: str) -> str:
+    """The user prompt now includes the search result provided by the MCP tool."""
+    return f"""
 The user has submitted the following question: "{user_query}"
 
 The relevant information retrieved from the Gopher Archive by the search tool is:
@@ -130,34 +523,145 @@ CRITICAL: Your response MUST NOT exceed 85 words after the opening phrase "Hark,
 Use this retrieved information to formulate your haunting interpretation. You must synthesize the result into your narrative.
 """
 
-    try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=user_prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                temperature=0.8,
-            )
-        )
-
-        interpretation_text = response.text
-
-        # Ensure the opening phrase is present, as mandated by the Steering Doc
-        if not interpretation_text.startswith(
-                "Hark, the Gopher nexus coughs up a cipher..."):
-            interpretation_text = "Hark, the Gopher nexus coughs up a cipher...\n\n" + \
-                interpretation_text
-
-        # Enforce the 85-word limit strictly
-        interpretation_text = enforce_word_limit(
-            interpretation_text, max_words=85)
 
+def seance_config(model=MODEL_NAME):
+    return prompts.config('seance', model)
+
+
+def mock_interpretation(search_result: str) -> str:
+    return f"{OPENING_PHRASE}\n\nThe client connection is severed! Search result: '{search_result}' remains a mystery."
+
+
+def finalize_interpretation(interpretation_text: str) -> str:
+    # Ensure the opening phrase is present, as mandated by the Steering Doc
+    if not interpretation_text.startswith(OPENING_PHRASE):
+        interpretation_text = f"{OPENING_PHRASE}\n\n" + \
+            interpretation_text
+
+    # Enforce the 85-word limit strictly
+    with metrics.stage('word_limit'):
+        return enforce_word_limit(interpretation_text, max_words=85)
+
+
+def interpret_cryptic_message(user_query: str, search_result: str) -> str:
+    """Uses the Gemini LLM API to generate the interpretation based on the Steering Doc."""
+
+    if not client:
+        return mock_interpretation(search_result)
+
+    cache_key = make_cache_key(
+        user_query, search_result, MODEL_NAME, SEANCE_TEMPERATURE)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    def generate():
+        with metrics.stage('llm'):
+            response = gateway.generate(
+                prompts.models('seance'),
+                build_seance_prompt(user_query, search_result),
+                seance_config)
+
+        interpretation_text = finalize_interpretation(response.text)
+
+        response_cache.set(cache_key, interpretation_text)
         return interpretation_text
 
+    try:
+        return in_flight.do(cache_key, generate, timeout=COALESCE_TIMEOUT)
+
     except APIError:
-        return "The spirits are angered! A connection error occurred. The wisdom remains locked in the digital nether."
+        return SPIRITS_ANGERED_MESSAGE
     except Exception:
-        return "A spectral anomaly interrupted the transmission."
+        return SPECTRAL_ANOMALY_MESSAGE
+
+
+def stream_cryptic_message(user_query: str, search_result: str):
+    """Streaming twin of interpret_cryptic_message(), yielding text as the model produces it.
+
+    The opening phrase and 85-word limit are applied on the fly by
+    WordLimitStream. API errors propagate to the caller, which may already
+    have sent part of the interpretation.
+    """
+    if not client:
+        yield mock_interpretation(search_result)
+        return
+
+    cache_key = make_cache_key(
+        user_query, search_result, MODEL_NAME, SEANCE_TEMPERATURE)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    limiter = WordLimitStream(max_words=85)
+    with metrics.stage('llm'):
+        chunks = gateway.stream(
+            prompts.models('seance'), build_seance_prompt(user_query, search_result), seance_config)
+        try:
+            for chunk in chunks:
+                piece = limiter.feed(chunk.text or '')
+                if piece:
+                    yield piece
+                if limiter.done:
+                    break
+        finally:
+            chunks.close()
+    piece = limiter.close()
+    if piece:
+        yield piece
+
+    response_cache.set(cache_key, limiter.text)
+
+
+def wants_stream(data) -> bool:
+    """Streaming is opt-in through `"stream": true` in the body or `?stream=1`."""
+    return data.get('stream') is True or request.args.get('stream') == '1'
+
+
+def stream_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def seance_events(user_query, search_result_content):
+    """SSE flavour of /api/seance: the search result first, then the interpretation as it is generated."""
+    yield sse_event('search', {"cryptic_response": search_result_content})
+    interpretation = []
+    try:
+        for piece in stream_cryptic_message(user_query, search_result_content):
+            interpretation.append(piece)
+            yield sse_event('chunk', {"text": piece})
+    except APIError:
+        yield sse_event('error', {"error": SPIRITS_ANGERED_MESSAGE})
+        return
+    except Exception:
+        yield sse_event('error', {"error": SPECTRAL_ANOMALY_MESSAGE})
+        return
+    yield sse_event('done', {"interpretation": ''.join(interpretation)})
+
+
+def seance_etag(user_query):
+    """Weak ETag of a /api/seance answer.
+
+    The search result is fixed by the archive version and the question's
+    keywords, and the interpretation is cached per (normalized) question, so
+    together with how both are produced (the persona included) they identify
+    the answer without searching or calling the model.
+    """
+    return make_etag(archive_store.get().mtime, normalize_query(user_query), prompts.instruction('seance'),
+                     SEARCH_MODE, SEARCH_RESULT_LIMIT, MODEL_NAME, SEANCE_TEMPERATURE)
+
+
+def revalidates(search_result, interpretation) -> bool:
+    """Whether an answer may carry an ETag.
+
+    An error should be retried, not kept, and a question nothing matched is
+    answered from a random entry, so the next answer would differ.
+    """
+    if search_result == ARCHIVE_UNAVAILABLE_MESSAGE or search_result.startswith(NO_MATCH_PREFIX):
+        return False
+    return interpretation not in (SPIRITS_ANGERED_MESSAGE, SPECTRAL_ANOMALY_MESSAGE)
 
 
 @app.route('/api/seance', methods=['POST'])
@@ -172,23 +676,220 @@ def seance_endpoint():
     if not user_query:
         return jsonify({"error": "No query provided to the medium."}), 400
 
+    stream = wants_stream(data)
+    etag = seance_etag(user_query)
+    if not stream and etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers={'ETag': etag})
+
     # 1. SIMPLE KEYWORD EXTRACTION for MCP Tool
-    # words with 4 or more letters
-    keywords = re.findall(r'\b\w{4,}\b', user_query.lower())
-    search_keyword = keywords[0] if keywords else 'connection'
+    # every word with 4 or more letters
+    keywords = extract_keywords(user_query)
 
     # 2. CALL THE MCP TOOL
-    search_result_content = search_gopher_archive(search_keyword)
+    search_result_content = search_gopher_archive(keywords)
+
+    if stream:
+        return stream_response(seance_events(user_query, search_result_content))
 
     # 3. GENERATE THE FINAL RESPONSE USING THE SEARCH RESULT
     interpretation = interpret_cryptic_message(
         user_query, search_result_content)
 
-    return jsonify({
+    response = jsonify({
         # Display the result of the search tool
         "cryptic_response": search_result_content,
         "interpretation": interpretation
     })
+    if revalidates(search_result_content, interpretation):
+        response.headers['ETag'] = etag
+    return response
+
+
+def build_seance_batch_prompt(pending) -> str:
+    """One prompt for the seances plan_seance_batch() left pending."""
+    sections = [
+        f"""Seance {query_id}
+The user's query is: "{user_query}"
+
+The relevant information retrieved from the Gopher Archive by the search tool is:
+---
+{search_result}
+---"""
+        for query_id, (_, user_query, search_result, _) in pending.items()]
+    return "\n\n".join(
+        ["Several visitors consult the medium at once. Interpret each seance below on its own, "
+         "using only its own retrieved information."] + sections) + f"""
+
+Return a JSON array with one object per seance: {{"id": <seance number>, "interpretation": "<text>"}}.
+
+CRITICAL: Every interpretation MUST start with "{OPENING_PHRASE}" and MUST NOT exceed 85 words after that opening phrase. Count carefully. Be concise.
+"""
+
+
+def seance_batch_config(model=MODEL_NAME):
+    return prompts.config('seance_batch', model)
+
+
+def plan_seance_batch(queries):
+    """Searches for every query of a batch and fills in what needs no model call.
+
+    Returns (results, pending): one result dict per query, in order, and
+    {prompt id: (cache key, user query, search result, [result indexes])}
+    for the distinct seances still to interpret.
+    """
+    results = []
+    valid = []
+    for i, query in enumerate(queries):
+        if isinstance(query, str) and query.strip():
+            results.append({"user_query": query.strip()})
+            valid.append(i)
+        else:
+            results.append({"user_query": query, "error": "No query provided to the medium."})
+
+    search_results = search_gopher_archive_batch(
+        [extract_keywords(results[i]["user_query"]) for i in valid])
+    pending = {}
+    by_key = {}
+    for i, search_result in zip(valid, search_results):
+        result = results[i]
+        result["cryptic_response"] = search_result
+        if not client:
+            result["interpretation"] = mock_interpretation(search_result)
+            continue
+        cache_key = make_cache_key(result["user_query"], search_result, MODEL_NAME, SEANCE_TEMPERATURE)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            result["interpretation"] = cached
+        elif cache_key in by_key:
+            # The same question asked twice in one batch is interpreted once
+            by_key[cache_key][3].append(i)
+        else:
+            by_key[cache_key] = pending[len(pending) + 1] = (cache_key, result["user_query"], search_result, [i])
+    return results, pending
+
+
+def apply_seance_batch(results, pending, response_text):
+    """Spreads the model's interpretations over the results; seances it skipped get an error."""
+    items = json.loads(response_text)
+    if not isinstance(items, list):
+        raise ValueError("Model returned JSON that is not an array")
+    answered = {}
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get("interpretation"), str) and item["interpretation"].strip():
+            answered.setdefault(item.get("id"), item["interpretation"])
+
+    for query_id, (cache_key, _, _, indexes) in pending.items():
+        if query_id in answered:
+            interpretation = finalize_interpretation(answered[query_id])
+            response_cache.set(cache_key, interpretation)
+            for i in indexes:
+                results[i]["interpretation"] = interpretation
+        else:
+            for i in indexes:
+                results[i]["error"] = BATCH_MISSING_MESSAGE
+
+
+def fail_seance_batch(results, pending, message):
+    for _, _, _, indexes in pending.values():
+        for i in indexes:
+            results[i]["error"] = message
+
+
+def batch_error_message(error):
+    return SPIRITS_ANGERED_MESSAGE if isinstance(error, APIError) else SPECTRAL_ANOMALY_MESSAGE
+
+
+def parse_seance_batch(data):
+    """The list of queries in a batch request body, or an error message."""
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return None, "Provide a non-empty list of queries."
+    if len(queries) > BATCH_MAX_QUERIES:
+        return None, f"A batch may hold at most {BATCH_MAX_QUERIES} queries."
+    return queries, None
+
+
+@app.route('/api/seance/batch', methods=['POST'])
+def seance_batch_endpoint():
+    """
+    Many seances in one request: shared archive search and a single
+    structured-output model call for every query not already answered.
+    Each result carries either an `interpretation` or an `error`.
+    """
+    queries, error = parse_seance_batch(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    results, pending = plan_seance_batch(queries)
+    if pending:
+        try:
+            with metrics.stage('llm'):
+                response = gateway.generate(
+                    prompts.models('seance_batch'), build_seance_batch_prompt(pending), seance_batch_config)
+            apply_seance_batch(results, pending, response.text)
+        except Exception as e:
+            fail_seance_batch(results, pending, batch_error_message(e))
+
+    return jsonify({"results": results})
+
+
+def build_learn_prompt(user_query: str) -> str:
+    # LEARN_SYSTEM_PROMPT travels as the prepared config's system instruction
+    return (
+        f"User question: {user_query}\n\n"
+        "Provide a clear educational answer (about 150–200 words). "
+        "Use short paragraphs or bullet points. "
+        "If comparison helps, add a small THEN vs NOW table in plain text."
+    )
+
+
+def learn_config(model=MODEL_NAME2):
+    return prompts.config('learn', model)
+
+
+def generate_learn_answer(user_query, cache_key):
+    # ---- Call Gemini ----
+    with metrics.stage('llm'):
+        response = gateway.generate(prompts.models('learn'), build_learn_prompt(user_query), learn_config)
+
+    # ---- Robust extraction of text from Gemini response ----
+    ai_response = getattr(response, "text")
+
+    # Final fallback ONLY if model gave nothing usable
+    if ai_response:
+        response_cache.set(cache_key, ai_response)
+
+    return ai_response
+
+
+def learn_events(user_query, cache_key):
+    """SSE flavour of /api/learn, relaying model chunks as they arrive."""
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield sse_event('chunk', {"text": cached})
+        yield sse_event('done', {"response": cached})
+        return
+
+    answer = []
+    try:
+        with metrics.stage('llm'):
+            for chunk in gateway.stream(prompts.models('learn'), build_learn_prompt(user_query), learn_config):
+                if chunk.text:
+                    answer.append(chunk.text)
+                    yield sse_event('chunk', {"text": chunk.text})
+    except APIError as e:
+        app.logger.error(f"Learn stream API error: {str(e)}")
+        yield sse_event('error', {'error': 'Failed to generate response from the archive.'})
+        return
+    except Exception as e:
+        app.logger.error(f"Learn stream error: {str(e)}")
+        yield sse_event('error', {'error': 'Failed to generate response.'})
+        return
+
+    ai_response = ''.join(answer)
+    if ai_response:
+        response_cache.set(cache_key, ai_response)
+    yield sse_event('done', {"response": ai_response})
 
 
 @app.route('/api/learn', methods=['POST'])
@@ -219,45 +920,19 @@ def learn_endpoint():
                 )
             }), 503
 
-        system_prompt = (
-            "You are a knowledgeable technology historian and educator specializing in "
-            "internet history, network protocols, and computing evolution.\n\n"
-            "Goals:\n"
-            "- Explain clearly and accurately.\n"
-            "- When relevant, compare older technologies to modern equivalents.\n"
-            "- Prefer concise sections or bullet points.\n"
-            "- When it helps, include a small comparison table in plain text "
-            "(columns like THEN | NOW) but keep it under 6 rows.\n\n"
-            "Topics you are especially good at:\n"
-            "- Gopher vs HTTP and the modern Web.\n"
-            "- FTP, Telnet, NNTP vs modern tools.\n"
-            "- ARPANET and early Internet history.\n"
-            "- Evolution of client–server computing.\n\n"
-            "If the question is unrelated to technology or history, gently steer the "
-            "conversation back toward those areas.")
-
-        prompt = (
-            f"{system_prompt}\n\n"
-            f"User question: {user_query}\n\n"
-            "Provide a clear educational answer (about 150–200 words). "
-            "Use short paragraphs or bullet points. "
-            "If comparison helps, add a small THEN vs NOW table in plain text."
-        )
-
-        # ---- Call Gemini ----
-        response = client.models.generate_content(
-            model=MODEL_NAME2,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.7,
-                max_output_tokens=400,
-            )
-        )
-
-        # ---- Robust extraction of text from Gemini response ----
-        ai_response = getattr(response, "text")
-
-        # Final fallback ONLY if model gave nothing usable
+        cache_key = make_cache_key(
+            user_query, '', MODEL_NAME2, LEARN_TEMPERATURE)
+
+        if wants_stream(data):
+            return stream_response(learn_events(user_query, cache_key))
+
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return jsonify({'response': cached}), 200
+
+        ai_response = in_flight.do(
+            cache_key, lambda: generate_learn_answer(user_query, cache_key),
+            timeout=COALESCE_TIMEOUT)
 
         return jsonify({'response': ai_response}), 200
 
@@ -270,5 +945,132 @@ def learn_endpoint():
         return jsonify({'error': 'Failed to generate response.'}), 500
 
 
+# Set by warm_up(); /ready answers 503 until then
+ready = False
+
+
+def warm_up(prompt_configs=True):
+    """Loads everything the first request would otherwise wait for.
+
+    The archive, fuzzy and semantic indexes and prompt configs (with their
+    context caches) are prepared, and the ranking and word-limit code runs
+    once. serve.py calls this in the master process before forking, so
+    every worker starts warm and shares the result. The master skips the
+    prompt configs: a context cache made there would be inherited by every
+    worker, and the first worker to replace it would delete it from under
+    the others. start_worker() prepares them instead.
+    """
+    global ready
+    archive = archive_store.get()
+    fuzzy_store.get(archive)
+    if SEARCH_MODE != 'keyword' and semantic_store.get(archive) is None:
+        print("WARNING: No semantic index available; falling back to keyword search. "
+              "Build one with `python semantic_index.py build` (needs NumPy).")
+    if prompt_configs:
+        prompts.warm()
+    archive.rank([DEFAULT_SEARCH_KEYWORD], SEARCH_RESULT_LIMIT)
+    enforce_word_limit(mock_interpretation(DEFAULT_SEARCH_KEYWORD), max_words=85)
+    ready = True
+
+
+def start_worker():
+    """Reopens per-process resources in a freshly forked worker.
+
+    Connection pools and SQLite handles inherited from the master must not
+    be shared with it, so each worker gets its own client, gateway, answer
+    cache and rate-limit store, and prepares its own prompt configs and
+    context caches. Everything else stays shared copy-on-write.
+    """
+    global client, gateway, response_cache
+    client = make_client()
+    prompts.client = client
+    gateway = LLMGateway(client)
+    response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB)
+    if RATE_LIMIT_DB:
+        rate_limiter.store = SQLiteBucketStore(RATE_LIMIT_DB)
+    prompts.warm()
+
+
+@app.route('/ready', methods=['GET'])
+def ready_endpoint():
+    """Readiness probe: 200 once this process has warmed up, 503 before."""
+    if not ready:
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready", "entries": len(archive_store.get())})
+
+
+def admin_denied(authorization):
+    """None for a request carrying ADMIN_TOKEN, else the (payload, status) to answer with.
+
+    Without a token configured the admin endpoints do not exist (404).
+    """
+    if not ADMIN_TOKEN:
+        return {"error": "Not found."}, 404
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode('utf-8'),
+                                                             ADMIN_TOKEN.encode('utf-8')):
+        return {"error": "Unauthorized."}, 401
+    return None
+
+
+def parse_profile_args(args):
+    """(seconds, interval, idle) from the /admin/profile query string, or an error message."""
+    try:
+        seconds = float(args.get('seconds', PROFILE_SECONDS))
+        interval = float(args.get('interval_ms', PROFILE_INTERVAL_MS)) / 1000
+    except ValueError:
+        return None, "seconds and interval_ms must be numbers."
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not interval >= 0.001:
+        return None, f"seconds must be above 0 and at most {PROFILE_MAX_SECONDS}; interval_ms at least 1."
+    return (seconds, interval, args.get('idle') == '1'), None
+
+
+def parse_trace_request(data):
+    """(count, paths) from a /admin/profile/requests body, or an error message."""
+    data = data if isinstance(data, dict) else {}
+    count, paths = data.get('count'), data.get('paths', TRACED_PATHS)
+    if type(count) is not int or not 1 <= count <= TRACE_MAX_REQUESTS:
+        return None, f"count must be a whole number from 1 to {TRACE_MAX_REQUESTS}."
+    if not isinstance(paths, list) or not paths or not set(paths) <= LIMITED_PATHS:
+        return None, f"paths must list some of {', '.join(sorted(LIMITED_PATHS))}."
+    return (count, paths), None
+
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_endpoint():
+    """Samples this worker's threads for ?seconds= and returns collapsed stacks (sample counts)."""
+    denied = admin_denied(request.headers.get('Authorization'))
+    if denied:
+        return jsonify(denied[0]), denied[1]
+    options, error = parse_profile_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    return Response(collapse(sample(*options)), mimetype='text/plain',
+                    headers={'X-Worker-PID': str(os.getpid())})
+
+
+@app.route('/admin/profile/requests', methods=['GET', 'POST'])
+def profile_requests_endpoint():
+    """Traces this worker's next requests: POST {"count": K, "paths": [...]} arms a run,
+    GET returns what it has captured so far as collapsed stacks (microseconds).
+    """
+    denied = admin_denied(request.headers.get('Authorization'))
+    if denied:
+        return jsonify(denied[0]), denied[1]
+    if request.method == 'POST':
+        options, error = parse_trace_request(request.get_json(silent=True))
+        if error:
+            return jsonify({"error": error}), 400
+        request_tracer.arm(*options)
+        return jsonify(dict(request_tracer.stats(), worker_pid=os.getpid())), 202
+    stats = request_tracer.stats()
+    return Response(request_tracer.profile(), mimetype='text/plain', headers={
+        'X-Worker-PID': str(os.getpid()),
+        'X-Profiled-Requests': str(stats['captured']),
+        'X-Profile-Remaining': str(stats['remaining'])})
+
+
 if __name__ == '__main__':
+    # Development server; `python serve.py --app wsgi` serves production traffic
+    warm_up()
     app.run(debug=True, port=5000)
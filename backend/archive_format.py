@@ -0,0 +1,102 @@
+"""Line-delimited (JSON Lines) storage for the Gopher Archive.
+
+One entry per line lets generators append new ciphers without reading or
+rewriting the rest of the archive, and lets the server stream entries in
+one at a time. Readers still accept the original pretty-printed JSON array.
+
+    python archive_format.py convert gopher_archive.json gopher_archive.jsonl
+"""
+
+import json
+import os
+import sys
+
+LEGACY_ARCHIVE_PATH = 'gopher_archive.json'
+ARCHIVE_PATH = 'gopher_archive.jsonl'
+
+
+def resolve_archive_path(jsonl_path=ARCHIVE_PATH, legacy_path=LEGACY_ARCHIVE_PATH):
+    """Prefers the JSON Lines archive, falling back to the legacy JSON array."""
+    return jsonl_path if os.path.exists(jsonl_path) else legacy_path
+
+
+def _is_json_array(f):
+    while True:
+        char = f.read(1)
+        if not char or not char.isspace():
+            f.seek(0)
+            return char == '['
+
+
+def iter_archive(path):
+    """Yields archive entries one at a time from either format.
+
+    A JSON array is parsed whole, as before. JSON Lines are decoded line by
+    line; a torn last line from a writer caught mid-append is skipped.
+    Raises FileNotFoundError if the file does not exist.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if _is_json_array(f):
+            yield from json.load(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                if line.endswith('\n'):
+                    raise
+                return
+
+
+def append_entries(path, entries):
+    """Appends entries as JSON Lines and syncs them to disk; returns how many were written."""
+    lines = [json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries]
+    if not lines:
+        return 0
+    with open(path, 'a', encoding='utf-8') as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(lines)
+
+
+def write_archive(path, entries):
+    """Replaces the archive with entries as JSON Lines, atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def ensure_jsonl_archive(jsonl_path=ARCHIVE_PATH, legacy_path=LEGACY_ARCHIVE_PATH):
+    """Makes sure the JSON Lines archive exists, migrating the legacy file once if needed."""
+    if not os.path.exists(jsonl_path) and os.path.exists(legacy_path):
+        convert(legacy_path, jsonl_path)
+    return jsonl_path
+
+
+def convert(src, dst):
+    """Converts an archive in either format to JSON Lines; returns the entry count."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for entry in iter_archive(src):
+            count += 1
+            yield entry
+
+    write_archive(dst, counted())
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != 'convert':
+        print("Usage: python archive_format.py convert <source.json> <destination.jsonl>")
+        sys.exit(1)
+    total = convert(sys.argv[2], sys.argv[3])
+    print(f"Converted {total} entries from {sys.argv[2]} to {sys.argv[3]}")
@@ -0,0 +1,214 @@
+"""Idempotent merging of generated entries into the Gopher Archive.
+
+Both generators used to append whatever they produced, so every rerun added
+another copy of each word and picked IDs that could collide with entries
+already there. merge_entries() upserts instead: an entry whose path is
+already archived with the same content is skipped, a new path is appended
+with the next free ID, and a changed one keeps its ID and is replaced in
+place. Unchanged entries are never written again.
+
+Paths are compared case-insensitively through 64-bit BLAKE2b keys, so the
+index for a million-entry archive holds integers rather than path strings.
+
+    python archive_merge.py compact [archive]
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+from archive_format import append_entries, iter_archive, resolve_archive_path, write_archive
+from archive_snapshot import refresh_snapshot
+from semantic_index import refresh_semantic_index
+
+KEY_BYTES = 8
+
+
+def _digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=KEY_BYTES).digest(), 'big')
+
+
+def path_key(path):
+    """The dedup key of an archive path; /menu/word/Modem and /menu/word/modem are the same entry."""
+    return _digest(path.strip().lower())
+
+
+class ArchiveIndex:
+    """Path keys, content digests and the next free ID of an archive.
+
+    Built from one pass over the file; the first entry seen for a path is
+    the one that counts, later ones are tallied in `duplicates`.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.next_id = 1
+        self.duplicates = 0
+
+    @classmethod
+    def scan(cls, path):
+        index = cls()
+        try:
+            for entry in iter_archive(path):
+                index.add(entry)
+        except FileNotFoundError:
+            pass
+        return index
+
+    def add(self, entry):
+        """Records an archived entry; returns False if its path was already known."""
+        entry_id = entry.get('id')
+        if isinstance(entry_id, int) and entry_id >= self.next_id:
+            self.next_id = entry_id + 1
+        key = path_key(entry.get('path', ''))
+        if key in self._entries:
+            self.duplicates += 1
+            return False
+        self._entries[key] = (entry_id, _digest(entry.get('content', '')))
+        return True
+
+    def update(self, entry):
+        """Records new content for an already archived path."""
+        self._entries[path_key(entry['path'])] = (entry['id'], _digest(entry.get('content', '')))
+
+    def allocate(self):
+        entry_id = self.next_id
+        self.next_id += 1
+        return entry_id
+
+    def get(self, path):
+        """(id, content digest) of the archived entry at path, or None."""
+        return self._entries.get(path_key(path))
+
+    def __contains__(self, path):
+        return path_key(path) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def merge_entries(path, entries, index=None):
+    """Upserts entries (path and content; any id is ignored) into a JSON Lines archive.
+
+    New paths are appended with IDs from the index; a path whose content
+    changed keeps its ID and is rewritten in place, which costs one atomic
+    rewrite of the file for the whole call. `index` must describe the file
+    and is kept up to date, so a caller merging batch after batch scans the
+    archive only once. Returns {"inserted", "updated", "unchanged"} counts.
+    """
+    if index is None:
+        index = ArchiveIndex.scan(path)
+    inserted, updated, unchanged = {}, {}, 0
+    for entry in entries:
+        key = path_key(entry['path'])
+        fields = {name: value for name, value in entry.items() if name != 'id'}
+        if key in inserted:
+            # A repeat within this call: the last version wins
+            inserted[key] = dict(inserted[key], **fields)
+            continue
+        known = index.get(entry['path'])
+        if known is None:
+            inserted[key] = {"id": index.allocate(), **fields}
+        elif known[1] == _digest(entry.get('content', '')) and key not in updated:
+            unchanged += 1
+        else:
+            updated[key] = {"id": known[0], **fields}
+    for entry in updated.values():
+        index.update(entry)
+    for entry in inserted.values():
+        index.add(entry)
+
+    if updated:
+        _replace_entries(path, updated)
+    append_entries(path, inserted.values())
+    return {"inserted": len(inserted), "updated": len(updated), "unchanged": unchanged}
+
+
+def _replace_entries(path, replacements):
+    """Rewrites the archive with the entries for `replacements`' keys swapped in.
+
+    Every other line is copied byte for byte; later duplicates of a replaced
+    path are dropped so the new content is the only one left.
+    """
+    tmp_path = f"{path}.tmp"
+    replaced = set()
+    with open(path, 'r', encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            try:
+                key = path_key(json.loads(line).get('path', ''))
+            except json.JSONDecodeError:
+                # A torn last line from an interrupted append
+                continue
+            if key not in replacements:
+                dst.write(line if line.endswith('\n') else line + '\n')
+            elif key not in replaced:
+                replaced.add(key)
+                dst.write(json.dumps(replacements[key], ensure_ascii=False) + '\n')
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp_path, path)
+
+
+def _is_json_array(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read(64).lstrip().startswith('[')
+
+
+def compact(path):
+    """Drops repeated paths (keeping the first) and renumbers repeated or missing IDs.
+
+    The file keeps its format and is only rewritten when there is something
+    to change. Returns {"entries", "removed", "renumbered", "bytes_before", "bytes_after"}.
+    """
+    bytes_before = os.path.getsize(path)
+    seen_paths, seen_ids, kept, unnumbered = set(), set(), [], []
+    total = max_id = 0
+    for entry in iter_archive(path):
+        total += 1
+        entry_id = entry.get('id')
+        if isinstance(entry_id, int):
+            max_id = max(max_id, entry_id)
+        key = path_key(entry.get('path', ''))
+        if key in seen_paths:
+            continue
+        seen_paths.add(key)
+        if not isinstance(entry_id, int) or entry_id in seen_ids:
+            unnumbered.append(len(kept))
+        else:
+            seen_ids.add(entry_id)
+        kept.append(entry)
+    # New IDs come after every ID the file held, dropped entries' included
+    for next_id, position in enumerate(unnumbered, max_id + 1):
+        entry = kept[position]
+        kept[position] = {"id": next_id, **{name: value for name, value in entry.items() if name != 'id'}}
+
+    if len(kept) < total or unnumbered:
+        if _is_json_array(path):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(kept, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        else:
+            write_archive(path, kept)
+    return {"entries": len(kept), "removed": total - len(kept), "renumbered": len(unnumbered),
+            "bytes_before": bytes_before, "bytes_after": os.path.getsize(path)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != 'compact':
+        print("Usage: python archive_merge.py compact [archive]")
+        sys.exit(1)
+    archive_path = sys.argv[2] if len(sys.argv) == 3 else resolve_archive_path()
+    report = compact(archive_path)
+    saved = report['bytes_before'] - report['bytes_after']
+    print(f"Compacted {archive_path}: removed {report['removed']} duplicate entries and "
+          f"{saved} bytes ({saved / max(1, report['bytes_before']):.1%}), "
+          f"renumbered {report['renumbered']} IDs; {report['entries']} entries remain")
+    if report['removed'] or report['renumbered']:
+        refresh_semantic_index(archive_path)
+        refresh_snapshot(archive_path)
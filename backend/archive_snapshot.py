@@ -0,0 +1,249 @@
+"""Compiled, memory-mapped binary snapshot of the Gopher Archive.
+
+A JSON-loaded archive costs every worker process its own copy of every
+entry as Python objects. The snapshot instead lays the archive out as flat
+tables that are mmap'ed read-only, so all workers share the same page-cache
+pages and an entry's text is only decoded when it is actually returned.
+
+    python archive_snapshot.py compile [source] [gopher_archive.snapshot]
+
+Layout (little-endian, sections 8-byte aligned):
+    header       magic, version, counts, section offsets and sizes, average doc length
+    ids          int64 per entry
+    entries      uint32 x5 per entry: path offset/length, content offset/length, doc length
+    tokens       uint32 x4 per token, sorted by UTF-8 bytes: offset/length, first posting, posting count
+    token_pos    uint32 entry position per posting
+    token_tf     uint32 term frequency per posting
+    words        uint32 x4 per word-path segment, same shape as tokens
+    word_pos     uint32 entry position per posting
+    heap         UTF-8 string bytes
+"""
+
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Sequence
+
+from archive_format import iter_archive, resolve_archive_path
+from archive_store import ArchiveSnapshot
+
+SNAPSHOT_PATH = os.getenv("GOPHER_SNAPSHOT_PATH", 'gopher_archive.snapshot')
+MAGIC = b'GOPHSNAP'
+VERSION = 1
+HEADER = struct.Struct('<8sIIII8Q8Qd')
+ENTRY_FIELDS = 5
+INDEX_FIELDS = 4
+# Stored in place of a missing or non-integer entry id
+MISSING_ID = -(2 ** 63)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+class _Heap:
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self._interned = {}
+
+    def add(self, text):
+        """Stores text once and returns its (offset, length) in the heap."""
+        found = self._interned.get(text)
+        if found is not None:
+            return found
+        data = text.encode('utf-8')
+        found = self._interned[text] = (self.size, len(data))
+        self.chunks.append(data)
+        self.size += len(data)
+        return found
+
+
+def _index_table(index, heap, values_per_key):
+    """Flattens {key: postings} into a sorted key table plus posting arrays."""
+    table, positions, extra = [], [], []
+    for key in sorted(index, key=lambda k: k.encode('utf-8')):
+        offset, length = heap.add(key)
+        table += [offset, length, len(positions), len(index[key])]
+        positions += index[key]
+        if values_per_key is not None:
+            extra += values_per_key[key]
+    return table, positions, extra
+
+
+def compile_snapshot(entries, path=SNAPSHOT_PATH):
+    """Builds the archive indexes and writes them as a binary snapshot, atomically."""
+    archive = ArchiveSnapshot(entries)
+    heap = _Heap()
+
+    ids = [i if isinstance(i, int) else MISSING_ID for i in archive.ids]
+    entry_table = []
+    for position in range(len(archive)):
+        path_ref = heap.add(archive.paths[position])
+        content_ref = heap.add(archive.contents[position])
+        entry_table += [*path_ref, *content_ref, archive.doc_lengths[position]]
+    token_table, token_pos, token_tf = _index_table(
+        archive.token_index, heap, archive.token_freqs)
+    word_table, word_pos, _ = _index_table(archive.path_index, heap, None)
+
+    sections = [
+        struct.pack(f'<{len(ids)}q', *ids),
+        struct.pack(f'<{len(entry_table)}I', *entry_table),
+        struct.pack(f'<{len(token_table)}I', *token_table),
+        struct.pack(f'<{len(token_pos)}I', *token_pos),
+        struct.pack(f'<{len(token_tf)}I', *token_tf),
+        struct.pack(f'<{len(word_table)}I', *word_table),
+        struct.pack(f'<{len(word_pos)}I', *word_pos),
+        b''.join(heap.chunks),
+    ]
+    offsets = []
+    cursor = _align(HEADER.size)
+    for section in sections:
+        offsets.append(cursor)
+        cursor = _align(cursor + len(section))
+
+    header = HEADER.pack(MAGIC, VERSION, len(archive), len(token_table) // INDEX_FIELDS,
+                         len(word_table) // INDEX_FIELDS, *offsets,
+                         *(len(section) for section in sections), archive.avg_doc_length)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for offset, section in zip(offsets, sections):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(section)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(archive)
+
+
+class _TextColumn(Sequence):
+    """Lazily decoded view of one string field of every entry."""
+
+    def __init__(self, entries, heap, field):
+        self._entries = entries
+        self._heap = heap
+        self._field = field
+
+    def __len__(self):
+        return len(self._entries) // ENTRY_FIELDS
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        base = position * ENTRY_FIELDS + self._field
+        offset, length = self._entries[base], self._entries[base + 1]
+        return str(self._heap[offset:offset + length], 'utf-8')
+
+
+class _IntColumn(Sequence):
+    def __init__(self, values, stride=1, field=0, missing=None):
+        self._values = values
+        self._stride = stride
+        self._field = field
+        self._missing = missing
+
+    def __len__(self):
+        return len(self._values) // self._stride
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        value = self._values[position * self._stride + self._field]
+        return None if value == self._missing else value
+
+
+class _MappedIndex:
+    """dict-like `.get()` over a sorted key table, by binary search."""
+
+    def __init__(self, table, values, heap):
+        self._table = table
+        self._values = values
+        self._heap = heap
+        self._count = len(table) // INDEX_FIELDS
+
+    def _key(self, i):
+        offset, length = self._table[i * INDEX_FIELDS], self._table[i * INDEX_FIELDS + 1]
+        return self._heap[offset:offset + length]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield str(self._key(i), 'utf-8')
+
+    def get(self, key, default=None):
+        target = key.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid).tobytes() < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key(lo) == target:
+            start, count = self._table[lo * INDEX_FIELDS + 2], self._table[lo * INDEX_FIELDS + 3]
+            return self._values[start:start + count]
+        return default
+
+
+class MappedArchive(ArchiveSnapshot):
+    """ArchiveSnapshot served straight from an mmap'ed compiled snapshot.
+
+    Nothing is copied at open time: ids, paths, contents and the indexes are
+    views into the mapping, decoded per access. All search and ranking logic
+    is inherited unchanged.
+    """
+
+    __slots__ = ('_mmap',)
+
+    def __init__(self, path, mtime=None):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if len(view) < HEADER.size:
+            raise ValueError(f"{path} is too short to be an archive snapshot")
+        magic, version, _entries, _tokens, _words, *layout = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} archive snapshot")
+        offsets, sizes, avg_doc_length = layout[:8], layout[8:16], layout[16]
+
+        def section(i, fmt='B'):
+            return view[offsets[i]:offsets[i] + sizes[i]].cast(fmt)
+
+        heap = section(7)
+        entries = section(1, 'I')
+        self.ids = _IntColumn(section(0, 'q'), missing=MISSING_ID)
+        self.paths = _TextColumn(entries, heap, 0)
+        self.contents = _TextColumn(entries, heap, 2)
+        self.doc_lengths = _IntColumn(entries, ENTRY_FIELDS, 4)
+        self.avg_doc_length = avg_doc_length
+        self.token_index = _MappedIndex(section(2, 'I'), section(3, 'I'), heap)
+        self.token_freqs = _MappedIndex(section(2, 'I'), section(4, 'I'), heap)
+        self.path_index = _MappedIndex(section(5, 'I'), section(6, 'I'), heap)
+        self.mtime = mtime
+
+
+def refresh_snapshot(source, path=SNAPSHOT_PATH):
+    """Recompiles the snapshot after a generator run; does nothing if none was ever compiled."""
+    if not os.path.exists(path):
+        return
+    total = compile_snapshot(iter_archive(source), path)
+    print(f"Archive snapshot recompiled with {total} entries ({path})")
+
+
+def load_mapped_archive(path, mtime=None):
+    """ArchiveStore loader for compiled snapshots."""
+    return MappedArchive(path, mtime)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'compile' or len(sys.argv) > 4:
+        print("Usage: python archive_snapshot.py compile [source] [destination]")
+        sys.exit(1)
+    source = sys.argv[2] if len(sys.argv) > 2 else resolve_archive_path()
+    destination = sys.argv[3] if len(sys.argv) > 3 else SNAPSHOT_PATH
+    total = compile_snapshot(iter_archive(source), destination)
+    print(f"Compiled {total} entries from {source} into {destination}")
@@ -0,0 +1,239 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+from copy import copy as shallow_copy
+from heapq import nsmallest
+from archive_format import iter_archive
+
+WORD_PATTERN = re.compile(r'\w+')
+# Generated entries live at /menu/semantic/<word> or /menu/word/<word>
+WORD_PATH_PREFIXES = ('/menu/semantic/', '/menu/word/')
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """Splits text into the lowercase word runs that a \\b...\\b regex can match."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def build_token_index(paths, contents):
+    """Maps every word in an entry's path or content to the entry positions holding it.
+
+    Positions are appended in archive order, so each posting list comes out
+    sorted and a lookup returns matches in the same order as a linear scan.
+    Alongside the postings this returns, per token, how often the word occurs
+    in each of those entries, plus every entry's length in words; both feed
+    the BM25 ranking in ArchiveSnapshot.rank().
+    """
+    postings = {}
+    freqs = {}
+    doc_lengths = []
+    for position, (path, content) in enumerate(zip(paths, contents)):
+        counts = Counter(tokenize(content) + tokenize(path))
+        doc_lengths.append(sum(counts.values()))
+        for token, count in counts.items():
+            postings.setdefault(token, []).append(position)
+            freqs.setdefault(token, []).append(count)
+    return ({token: tuple(p) for token, p in postings.items()},
+            {token: tuple(f) for token, f in freqs.items()},
+            tuple(doc_lengths))
+
+
+def build_path_index(paths):
+    """Maps the <word> segment of every generated word path to its entry positions."""
+    index = {}
+    for position, path in enumerate(paths):
+        for prefix in WORD_PATH_PREFIXES:
+            if path.startswith(prefix):
+                index.setdefault(path[len(prefix):].lower(), []).append(position)
+                break
+    return {word: tuple(positions) for word, positions in index.items()}
+
+
+class ArchiveSnapshot:
+    """An immutable, compact view of the Gopher Archive at a given mtime.
+
+    Entries are kept as parallel tuples instead of a list of dicts so that
+    thousands of ciphers cost three small arrays rather than one dict each.
+    """
+
+    __slots__ = ('ids', 'paths', 'contents', 'mtime', 'token_index',
+                 'token_freqs', 'doc_lengths', 'avg_doc_length', 'path_index')
+
+    def __init__(self, entries, mtime=None):
+        # Single pass, so entries can be a generator streaming off disk
+        ids, paths, contents = [], [], []
+        for e in entries:
+            ids.append(e.get('id'))
+            paths.append(e.get('path', ''))
+            contents.append(e.get('content', ''))
+        self.ids = tuple(ids)
+        self.paths = tuple(paths)
+        self.contents = tuple(contents)
+        self.mtime = mtime
+        self.token_index, self.token_freqs, self.doc_lengths = build_token_index(
+            self.paths, self.contents)
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        self.path_index = build_path_index(self.paths)
+
+    def __len__(self):
+        return len(self.contents)
+
+    def restamp(self, mtime):
+        """Returns a copy of this snapshot tagged with a different mtime."""
+        restamped = shallow_copy(self)
+        restamped.mtime = mtime
+        return restamped
+
+    def scan(self, keyword):
+        """Finds entries whose content or path holds keyword as a whole word, by regex."""
+        pattern = re.compile(rf'\b{re.escape(keyword)}\b', re.IGNORECASE)
+        return [i for i, (path, content) in enumerate(zip(self.paths, self.contents))
+                if pattern.search(content) or pattern.search(path)]
+
+    def find(self, keyword):
+        """Same matches as scan(), answered from the token index when possible."""
+        keyword = keyword.lower()
+        if WORD_PATTERN.fullmatch(keyword):
+            return list(self.token_index.get(keyword, ()))
+        # Phrases and punctuation do not map onto single tokens
+        return self.scan(keyword)
+
+    def exact(self, keyword):
+        """Entries whose path is exactly /menu/semantic/<keyword> or /menu/word/<keyword>."""
+        return list(self.path_index.get(keyword.lower(), ()))
+
+    def search(self, keyword):
+        """Exact word-path entries first, then the remaining whole-word matches.
+
+        Both groups keep archive order, so the same archive and keyword always
+        yield the same ordering.
+        """
+        exact = self.exact(keyword)
+        seen = set(exact)
+        return exact + [i for i in self.find(keyword) if i not in seen]
+
+    def entry(self, index):
+        """Rebuilds the original dict form of a single entry."""
+        return {
+            "id": self.ids[index],
+            "path": self.paths[index],
+            "content": self.contents[index]
+        }
+
+    def _postings(self, keyword):
+        keyword = keyword.lower()
+        if WORD_PATTERN.fullmatch(keyword):
+            return self.token_index.get(keyword, ()), self.token_freqs.get(keyword, ())
+        positions = self.scan(keyword)
+        return positions, (1,) * len(positions)
+
+    def rank(self, keywords, limit):
+        """Scores entries against all keywords with BM25 and returns the top `limit` positions.
+
+        An entry whose word path names a keyword gets that keyword's maximum
+        possible BM25 contribution on top, so for a single keyword it always
+        leads. Ties fall back to archive order so results are deterministic.
+        """
+        total = len(self)
+        scores = {}
+        for keyword in keywords:
+            positions, freqs = self._postings(keyword)
+            if not positions:
+                continue
+            idf = math.log(1 + (total - len(positions) + 0.5) / (len(positions) + 0.5))
+            for position, tf in zip(positions, freqs):
+                norm = 1 - BM25_B + BM25_B * self.doc_lengths[position] / self.avg_doc_length
+                scores[position] = scores.get(position, 0.0) + \
+                    idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+            for position in self.exact(keyword):
+                scores[position] = scores.get(position, 0.0) + idf * (BM25_K1 + 1)
+
+        return nsmallest(limit, scores, key=lambda i: (-scores[i], i))
+
+
+def load_archive_snapshot(path, mtime=None):
+    return ArchiveSnapshot(iter_archive(path), mtime)
+
+
+class ArchiveStore:
+    """Loads the Gopher Archive once and serves it from memory.
+
+    Either archive format is accepted: JSON Lines are streamed in entry by
+    entry, the legacy JSON array is parsed whole.
+
+    The file's mtime is checked on every access; when it changes the archive
+    is re-parsed off to the side and swapped in with a single assignment, so
+    readers always see either the old or the new snapshot, never a mix.
+
+    `path` may also be a function returning the path, called on every access,
+    such as archive_format.resolve_archive_path: the store then moves from the
+    legacy JSON array to the JSON Lines file as soon as a generator creates it.
+
+    When `path` is a compiled snapshot, `source` (a path or such a function)
+    names the archive it was compiled from. The generators only write the
+    source, so whenever the source is newer than the snapshot it is parsed
+    and served instead, until the snapshot is recompiled.
+    """
+
+    def __init__(self, path, loader=None, source=None):
+        self.path = path
+        # loader(path, mtime) builds a snapshot; the default parses the archive file
+        self.loader = loader or load_archive_snapshot
+        self.source = source
+        self._lock = threading.Lock()
+        self._snapshot = ArchiveSnapshot([])
+
+    @staticmethod
+    def _resolve(path):
+        return path() if callable(path) else path
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _current(self):
+        """(path, loader, mtime) of the file to serve; mtime is None while it is missing."""
+        path = self._resolve(self.path)
+        mtime = self._mtime(path)
+        if self.source is not None:
+            source = self._resolve(self.source)
+            source_mtime = self._mtime(source)
+            if source_mtime is not None and (mtime is None or source_mtime > mtime):
+                return source, load_archive_snapshot, source_mtime
+        return path, self.loader, mtime
+
+    def _build(self, path, loader, mtime):
+        if mtime is None:
+            return ArchiveSnapshot([])
+        try:
+            return loader(path, mtime)
+        except (FileNotFoundError, ValueError):
+            # Keep serving what we had rather than going dark mid-write;
+            # the writer finishing will bump the mtime and trigger a reload
+            return self._snapshot.restamp(mtime)
+
+    def get(self):
+        """Returns the current snapshot, reloading it if the file changed."""
+        path, loader, mtime = self._current()
+        snapshot = self._snapshot
+        if snapshot.mtime == mtime and mtime is not None:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if self._snapshot.mtime != mtime or mtime is None:
+                self._snapshot = self._build(path, loader, mtime)
+            return self._snapshot
+
+    def entries(self):
+        """Returns the archive in its original list-of-dicts form."""
+        snapshot = self.get()
+        return [snapshot.entry(i) for i in range(len(snapshot))]
@@ -0,0 +1,531 @@
+"""ASGI flavour of agent.py for serving many seances per process.
+
+The Flask app holds a worker for the whole Gemini round trip. Here the same
+endpoints run on an event loop and await the SDK's async client, so hundreds
+of in-flight requests can share a handful of processes. Search, prompts,
+caching and the word-limit rules are reused from agent.py unchanged. What
+of them can block runs in worker threads instead of on the loop: archive
+search, which re-parses the archive after it changes, building a prompt
+config that has to create a provider context cache, and the SQLite-backed
+answer cache and rate limit store when those are enabled.
+
+Run with `python async_agent.py` (needs uvicorn).
+"""
+
+import asyncio
+import json
+import os
+from urllib.parse import parse_qs
+
+from google.genai.errors import APIError
+
+import agent
+import metrics
+import profiler
+from http_encoding import choose_encoding, compressible, etag_matches
+from rate_limit import client_key, retry_after_header
+from single_flight import AsyncSingleFlight
+from streaming import WordLimitStream, sse_event
+
+# --- Configuration ---
+ASGI_HOST = os.getenv("ASGI_HOST", "127.0.0.1")
+ASGI_PORT = int(os.getenv("ASGI_PORT", "5000"))
+ASGI_WORKERS = int(os.getenv("ASGI_WORKERS", "2"))
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-methods', b'POST, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type, X-API-Key, If-None-Match'),
+    (b'access-control-expose-headers', b'Retry-After, ETag'),
+]
+# Served outside ROUTES, and labelled by path in the request metrics
+OTHER_ROUTES = frozenset({'/metrics', '/ready', '/admin/profile', '/admin/profile/requests'})
+TRACE_UNSUPPORTED_MESSAGE = ("Per-request tracing needs the Flask app (python serve.py --app wsgi); "
+                             "GET /admin/profile samples this worker instead.")
+
+# Identical questions arriving together share one upstream model call
+in_flight = AsyncSingleFlight()
+
+
+async def off_loop(blocking, fn, *args):
+    """fn(*args), run in a worker thread when `blocking`, so a slow disk or a
+    lock wait holds up this request rather than every request on the loop."""
+    if blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+async def cache_get(key):
+    return await off_loop(agent.response_cache.on_disk, agent.response_cache.get, key)
+
+
+async def cache_set(key, value):
+    await off_loop(agent.response_cache.on_disk, agent.response_cache.set, key, value)
+
+
+# Prompt configs for the gateway; preparing one can call the provider
+def seance_config(model):
+    return agent.prompts.config_async('seance', model)
+
+
+def seance_batch_config(model):
+    return agent.prompts.config_async('seance_batch', model)
+
+
+def learn_config(model):
+    return agent.prompts.config_async('learn', model)
+
+
+@agent.COALESCED_CALLS.source
+def coalesced_calls():
+    stats = in_flight.stats()
+    return {('leader',): stats['leaders'], ('follower',): stats['coalesced']}
+
+
+async def interpret_cryptic_message_async(user_query: str, search_result: str) -> str:
+    """Async twin of agent.interpret_cryptic_message()."""
+    if not agent.client:
+        return agent.mock_interpretation(search_result)
+
+    cache_key = agent.make_cache_key(
+        user_query, search_result, agent.MODEL_NAME, agent.SEANCE_TEMPERATURE)
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    async def generate():
+        with metrics.stage('llm'):
+            response = await agent.gateway.generate_async(
+                agent.prompts.models('seance'),
+                agent.build_seance_prompt(user_query, search_result),
+                seance_config)
+        interpretation_text = agent.finalize_interpretation(response.text)
+        await cache_set(cache_key, interpretation_text)
+        return interpretation_text
+
+    try:
+        return await in_flight.do(cache_key, generate, timeout=agent.COALESCE_TIMEOUT)
+
+    except APIError:
+        return agent.SPIRITS_ANGERED_MESSAGE
+    except Exception:
+        return agent.SPECTRAL_ANOMALY_MESSAGE
+
+
+async def seance_events(user_query, search_result_content):
+    """Async twin of agent.seance_events()."""
+    yield sse_event('search', {"cryptic_response": search_result_content})
+
+    if not agent.client:
+        interpretation = agent.mock_interpretation(search_result_content)
+        yield sse_event('chunk', {"text": interpretation})
+        yield sse_event('done', {"interpretation": interpretation})
+        return
+
+    cache_key = agent.make_cache_key(
+        user_query, search_result_content, agent.MODEL_NAME, agent.SEANCE_TEMPERATURE)
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        yield sse_event('chunk', {"text": cached})
+        yield sse_event('done', {"interpretation": cached})
+        return
+
+    limiter = WordLimitStream(max_words=85)
+    try:
+        with metrics.stage('llm'):
+            chunks = agent.gateway.stream_async(
+                agent.prompts.models('seance'),
+                agent.build_seance_prompt(user_query, search_result_content),
+                seance_config)
+            try:
+                async for chunk in chunks:
+                    piece = limiter.feed(chunk.text or '')
+                    if piece:
+                        yield sse_event('chunk', {"text": piece})
+                    if limiter.done:
+                        break
+            finally:
+                await chunks.aclose()
+    except APIError:
+        yield sse_event('error', {"error": agent.SPIRITS_ANGERED_MESSAGE})
+        return
+    except Exception:
+        yield sse_event('error', {"error": agent.SPECTRAL_ANOMALY_MESSAGE})
+        return
+
+    piece = limiter.close()
+    if piece:
+        yield sse_event('chunk', {"text": piece})
+    await cache_set(cache_key, limiter.text)
+    yield sse_event('done', {"interpretation": limiter.text})
+
+
+async def learn_events(user_query, cache_key):
+    """Async twin of agent.learn_events()."""
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        yield sse_event('chunk', {"text": cached})
+        yield sse_event('done', {"response": cached})
+        return
+
+    answer = []
+    try:
+        with metrics.stage('llm'):
+            chunks = agent.gateway.stream_async(
+                agent.prompts.models('learn'), agent.build_learn_prompt(user_query), learn_config)
+            async for chunk in chunks:
+                if chunk.text:
+                    answer.append(chunk.text)
+                    yield sse_event('chunk', {"text": chunk.text})
+    except APIError:
+        yield sse_event('error', {'error': 'Failed to generate response from the archive.'})
+        return
+    except Exception:
+        yield sse_event('error', {'error': 'Failed to generate response.'})
+        return
+
+    ai_response = ''.join(answer)
+    if ai_response:
+        await cache_set(cache_key, ai_response)
+    yield sse_event('done', {"response": ai_response})
+
+
+async def seance_endpoint(data, stream, headers):
+    """Async /api/seance; mirrors agent.seance_endpoint()."""
+    user_query = (data.get('user_query') or '').strip()
+
+    if not user_query:
+        return 400, {"error": "No query provided to the medium."}
+
+    etag = await asyncio.to_thread(agent.seance_etag, user_query)
+    if not stream and etag_matches(headers.get('if-none-match'), etag):
+        return 304, None, [(b'etag', etag.encode('latin-1'))]
+
+    keywords = agent.extract_keywords(user_query)
+    search_result_content = await asyncio.to_thread(agent.search_gopher_archive, keywords)
+
+    if stream:
+        return seance_events(user_query, search_result_content)
+
+    interpretation = await interpret_cryptic_message_async(
+        user_query, search_result_content)
+
+    return 200, {
+        "cryptic_response": search_result_content,
+        "interpretation": interpretation
+    }, [(b'etag', etag.encode('latin-1'))] if agent.revalidates(search_result_content, interpretation) else []
+
+
+async def seance_batch_endpoint(data, stream, headers):
+    """Async /api/seance/batch; mirrors agent.seance_batch_endpoint(). Never streams."""
+    queries, error = agent.parse_seance_batch(data)
+    if error:
+        return 400, {"error": error}
+
+    # Searches the archive and reads the answer cache
+    results, pending = await asyncio.to_thread(agent.plan_seance_batch, queries)
+    if pending:
+        try:
+            with metrics.stage('llm'):
+                response = await agent.gateway.generate_async(
+                    agent.prompts.models('seance_batch'), agent.build_seance_batch_prompt(pending),
+                    seance_batch_config)
+            await off_loop(agent.response_cache.on_disk, agent.apply_seance_batch, results, pending, response.text)
+        except Exception as e:
+            agent.fail_seance_batch(results, pending, agent.batch_error_message(e))
+
+    return 200, {"results": results}
+
+
+async def learn_endpoint(data, stream, headers):
+    """Async /api/learn; mirrors agent.learn_endpoint()."""
+    user_query = (data.get('query') or '').strip()
+
+    if not user_query:
+        return 200, {
+            "response": (
+                "Ask about Gopher vs the Web, FTP, Telnet, early internet history, "
+                "or how old and new technologies compare."
+            )
+        }
+
+    if not agent.client:
+        return 503, {
+            'response': (
+                'The educational archive is currently offline. '
+                'Please ensure the GEMINI_API_KEY is configured correctly.'
+            )
+        }
+
+    cache_key = agent.make_cache_key(
+        user_query, '', agent.MODEL_NAME2, agent.LEARN_TEMPERATURE)
+
+    if stream:
+        return learn_events(user_query, cache_key)
+
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return 200, {'response': cached}
+
+    async def generate():
+        with metrics.stage('llm'):
+            response = await agent.gateway.generate_async(
+                agent.prompts.models('learn'), agent.build_learn_prompt(user_query), learn_config)
+        ai_response = getattr(response, "text")
+        if ai_response:
+            await cache_set(cache_key, ai_response)
+        return ai_response
+
+    try:
+        ai_response = await in_flight.do(cache_key, generate, timeout=agent.COALESCE_TIMEOUT)
+        return 200, {'response': ai_response}
+
+    except APIError:
+        return 500, {'error': 'Failed to generate response from the archive.'}
+    except Exception:
+        return 500, {'error': 'Failed to generate response.'}
+
+
+ROUTES = {
+    '/api/seance': seance_endpoint,
+    '/api/seance/batch': seance_batch_endpoint,
+    '/api/learn': learn_endpoint,
+}
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, status, payload, headers=()):
+    """Sends payload as JSON; a payload of None sends no body (304)."""
+    if payload is None:
+        await send({'type': 'http.response.start', 'status': status, 'headers': CORS_HEADERS + list(headers)})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())] + CORS_HEADERS + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_events(send, events):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')] + CORS_HEADERS,
+    })
+    async for event in events:
+        await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # A no-op when serve.py already warmed up the master before forking
+            if not agent.ready:
+                agent.warm_up()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def send_metrics(send):
+    body = metrics.render().encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', metrics.CONTENT_TYPE.encode()),
+                    (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def compressing(send, accept_encoding):
+    """Wraps send so that a large enough JSON or text body goes out compressed.
+
+    The response start is held back only for compressible content types,
+    until the body shows whether it is worth it; event streams pass through.
+    """
+    encoding = choose_encoding(accept_encoding)
+    held = None
+
+    async def compressed_send(message):
+        nonlocal held
+        if message['type'] == 'http.response.start':
+            headers = dict(message.get('headers', []))
+            if agent.COMPRESS_MIN_BYTES <= 0 or not compressible(headers.get(b'content-type', b'').decode('latin-1')):
+                await send(message)
+                return
+            held = dict(message, headers=list(message.get('headers', [])) + [(b'vary', b'Accept-Encoding')])
+            return
+        if held is not None:
+            start, held = held, None
+            body = message.get('body', b'')
+            if encoding and not message.get('more_body') and len(body) >= agent.COMPRESS_MIN_BYTES:
+                body = agent.compress_body(body, encoding)
+                start['headers'] = [(name, value) for name, value in start['headers'] if name != b'content-length'] + [
+                    (b'content-encoding', encoding.encode('latin-1')), (b'content-length', str(len(body)).encode())]
+                message = dict(message, body=body)
+            await send(start)
+        await send(message)
+
+    return compressed_send
+
+
+async def send_profile(scope, send):
+    """GET /admin/profile, as in the Flask app."""
+    denied = agent.admin_denied(request_headers(scope).get('authorization'))
+    if denied:
+        await send_json(send, denied[1], denied[0])
+        return
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    options, error = agent.parse_profile_args({name: values[-1] for name, values in query.items()})
+    if error:
+        await send_json(send, 400, {"error": error})
+        return
+    # Sampled from a worker thread, so the event loop keeps serving meanwhile
+    body = profiler.collapse(await asyncio.to_thread(profiler.sample, *options)).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'x-worker-pid', str(os.getpid()).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_trace_unsupported(scope, send):
+    """/admin/profile/requests, which only the Flask app implements.
+
+    sys.setprofile() hooks a thread, and here every request shares the event
+    loop's thread, so one request cannot be traced apart from the others.
+    """
+    denied = agent.admin_denied(request_headers(scope).get('authorization'))
+    if denied:
+        await send_json(send, denied[1], denied[0])
+        return
+    await send_json(send, 501, {"error": TRACE_UNSUPPORTED_MESSAGE})
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    route = path if path in ROUTES or path in OTHER_ROUTES else 'unmatched'
+    timer = metrics.RequestTimer()
+
+    async def timed_send(message):
+        # Recorded when the response starts, as in the Flask app
+        if message['type'] == 'http.response.start':
+            timer.status = message['status']
+            timer.finish(route)
+            if agent.SERVER_TIMING:
+                message = dict(message, headers=list(message.get('headers', [])) + [
+                    (b'server-timing', timer.server_timing().encode('latin-1'))])
+        await send(message)
+
+    try:
+        await dispatch(scope, receive, compressing(timed_send, request_headers(scope).get('accept-encoding')))
+    finally:
+        if timer.status is None:
+            timer.finish(route, 500)
+
+
+async def dispatch(scope, receive, send):
+    if scope['path'] == '/metrics' and scope['method'] == 'GET':
+        await send_metrics(send)
+        return
+    if scope['path'] == '/admin/profile' and scope['method'] == 'GET':
+        await send_profile(scope, send)
+        return
+    if scope['path'] == '/admin/profile/requests' and scope['method'] in ('GET', 'POST'):
+        await send_trace_unsupported(scope, send)
+        return
+    if scope['path'] == '/ready' and scope['method'] == 'GET':
+        if not agent.ready:
+            await send_json(send, 503, {"status": "warming up"})
+        else:
+            await send_json(send, 200, {"status": "ready", "entries": len(agent.archive_store.get())})
+        return
+
+    if scope['method'] == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    endpoint = ROUTES.get(scope['path'])
+    if endpoint is None:
+        await send_json(send, 404, {"error": "Not found."})
+        return
+    if scope['method'] != 'POST':
+        await send_json(send, 405, {"error": "Method not allowed."})
+        return
+
+    headers = request_headers(scope)
+    ticket, rejection = await off_loop(agent.rate_limiter.on_disk, agent.admit, request_client_key(scope, headers))
+    if rejection is not None:
+        message, retry_after = rejection
+        await send_json(send, 429, {"error": message},
+                        [(b'retry-after', retry_after_header(retry_after).encode())])
+        return
+    try:
+        await handle(endpoint, scope, headers, receive, send)
+    finally:
+        agent.admission.leave(ticket)
+
+
+def request_headers(scope):
+    return {name.decode('latin-1'): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+
+def request_client_key(scope, headers):
+    client = scope.get('client')
+    return client_key(headers.get('x-api-key'), headers.get('x-forwarded-for'),
+                      client[0] if client else None, agent.RATE_LIMIT_TRUST_PROXY)
+
+
+async def handle(endpoint, scope, headers, receive, send):
+    try:
+        data = json.loads(await read_body(receive) or b'{}')
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        await send_json(send, 400, {"error": "Request body must be a JSON object."})
+        return
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    stream = data.get('stream') is True or query.get('stream') == ['1']
+
+    result = await endpoint(data, stream, headers)
+    if isinstance(result, tuple):
+        await send_json(send, *result)
+    else:
+        await send_events(send, result)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run('async_agent:app', host=ASGI_HOST, port=ASGI_PORT,
+                workers=ASGI_WORKERS, log_level='warning')
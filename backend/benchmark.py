@@ -0,0 +1,771 @@
+"""Benchmarks for the backend hot paths.
+
+Runs every suite by default and prints p50/p99 latencies; --json also writes
+the numbers, with the commit and machine they came from, so runs can be
+compared over time:
+
+    python benchmark.py --suite hot-paths --suite endpoints --json after.json
+    python benchmark.py --compare before.json after.json
+
+Random inputs are seeded and the end-to-end suite talks to a local fake
+Gemini server (fake_llm.FakeGeminiServer), so no API key is needed and
+reruns on the same machine measure the same work.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from functools import partial
+
+import agent
+import metrics
+import semantic_cipher_generator
+from archive_format import LEGACY_ARCHIVE_PATH, append_entries, iter_archive, write_archive
+from archive_merge import compact, merge_entries
+from archive_snapshot import MappedArchive, compile_snapshot
+from archive_store import ArchiveStore, load_archive_snapshot
+from archive_store import tokenize
+from fake_llm import FakeCipherClient, FakeClient, FakeGeminiServer, FaultInjector
+from fuzzy_index import FuzzyIndex, FuzzyStore
+from google.genai import types
+from http_encoding import supported_encodings
+from llm_gateway import LLMGateway
+from load_test import SERVER_COMMANDS, free_port, run_load, start_server, summarize, wait_until_ready
+from semantic_index import SemanticIndex, SemanticStore, archive_digest, available, fit, save
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- CONFIGURATION ---
+ITERATIONS = 200
+KEYWORDS = ['modem', 'connection', 'shadow', 'gopher', 'zzzzunknown']
+SNAPSHOT_SIZES = [100_000, 300_000]
+SEMANTIC_SIZES = [10_000, 100_000, 1_000_000]
+SEMANTIC_TOP_K = 10
+FUZZY_KEYWORDS = ['prophecies', 'modems', 'gohper', 'conection', 'shadws', 'telnet', 'zzzzunknown']
+# Synthetic archive sizes for the hot-path suite, next to the real archive
+HOT_PATH_SIZES = [10_000, 100_000]
+SEED = 7
+QUERIES = [
+    "What does the modem say?",
+    "Tell me about the gopher protocol and its menus",
+    "What lies beyond the connection, in the shadow of the old dial tone, where forgotten packets go to rest?",
+    "prophecies",
+    "Is there anything about zzzzunknown in the archive at all, spirit?",
+]
+# Interpretations below, at and well over the 85-word limit
+INTERPRETATION_LENGTHS = [40, 85, 300]
+ENDPOINT_DELAY = 0.1
+ENDPOINT_REQUESTS = 200
+ENDPOINT_CONCURRENCY = 50
+ENDPOINT_WORKERS = 1
+# Upstream faults for the resilience suite: a slow tail and a flaky model
+RESILIENCE_CALLS = 500
+RESILIENCE_LATENCY = 0.01
+RESILIENCE_SLOW_RATE = 0.03
+RESILIENCE_SLOW_SECONDS = 0.5
+RESILIENCE_ERROR_RATE = 0.2
+
+MERGE_ARCHIVE_SIZE = 100_000
+MERGE_BATCH = 4000
+MERGE_RERUNS = 3
+COMPRESSION_ARCHIVE_SIZE = 100_000
+# The default top-K, and a cap as loose as the uncapped search used to be
+COMPRESSION_LIMITS = (10, 1000)
+# Link speed used to turn response bytes into transfer time
+COMPRESSION_LINK_MBPS = 10
+GENERATOR_WORDS = 3000
+GENERATOR_FIXED_BATCH = 100
+# A response limit below the generator's assumed budget, so batches get cut off
+GENERATOR_TIGHT_LIMIT = 4096
+STARTUP_WORKERS = 4
+STARTUP_SERVERS = ('asgi', 'prefork')
+
+# Filled in by section(), report() and record(); written out by --json
+RESULTS = {}
+_current = None
+
+
+def section(name, title):
+    """Starts a results section and prints its heading."""
+    global _current
+    _current = RESULTS.setdefault(name, {})
+    print(f"\n--- {title} ---")
+
+
+def record(label, value):
+    if _current is not None:
+        _current[label] = value
+
+
+def legacy_search_gopher_archive(keyword):
+    """The original search: re-parses the JSON file on every call."""
+    try:
+        with open(LEGACY_ARCHIVE_PATH, 'r') as f:
+            archive = json.load(f)
+    except FileNotFoundError:
+        archive = []
+
+    if not archive:
+        return "ERROR: The Gopher Archive is empty or inaccessible."
+
+    keyword = keyword.lower().strip()
+    pattern = re.compile(rf'\b{re.escape(keyword)}\b', re.IGNORECASE)
+    matching_content = [e['content'] for e in archive
+                        if pattern.search(e['content']) or pattern.search(e['path'])]
+
+    if not matching_content:
+        return random.choice(archive)['content']
+    return "Matching Ciphers:\n" + "\n---\n".join(matching_content)
+
+
+def time_per_call(func, keywords, iterations=None):
+    """Runs func over the keywords and returns per-call latencies in ms."""
+    iterations = iterations or ITERATIONS
+    samples = []
+    for i in range(iterations):
+        keyword = keywords[i % len(keywords)]
+        start = time.perf_counter()
+        func(keyword)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"  {label:<28} p50={p50:8.3f} ms  p99={p99:8.3f} ms")
+    record(label, {"p50_ms": round(p50, 4), "p99_ms": round(p99, 4),
+                   "mean_ms": round(statistics.fmean(samples), 4), "calls": len(samples)})
+    return p50
+
+
+def speedup(before, after):
+    print(f"  Speedup: {before / after:.1f}x")
+    record("speedup", round(before / after, 1))
+
+
+def bench_archive_load():
+    section('archive_load', f"Per-request search latency ({len(agent.archive_store.get())} entries)")
+    before = report("json.load per request", time_per_call(legacy_search_gopher_archive, KEYWORDS))
+    after = report("in-memory ArchiveStore", time_per_call(agent.search_gopher_archive, KEYWORDS))
+    speedup(before, after)
+
+
+def check_index_equivalence():
+    """Asserts the token index returns exactly what the regex scan returns."""
+    archive = agent.archive_store.get()
+    vocabulary = {t for text in archive.contents + archive.paths for t in tokenize(text)}
+    probes = sorted(vocabulary) + [k.upper() for k in KEYWORDS] + [
+        ' modem ', 'dial tone', '127.0.0.1', 'soul_not_found', 'modem!', '']
+    for keyword in probes:
+        keyword = keyword.lower().strip()
+        assert archive.find(keyword) == archive.scan(keyword), keyword
+    section('index_equivalence', f"Token index matches regex scan for {len(probes)} keywords")
+    record("keywords_checked", len(probes))
+
+
+def bench_token_index():
+    archive = agent.archive_store.get()
+    section('token_index', f"Keyword lookup latency ({len(archive)} entries)")
+    before = report("regex scan", time_per_call(archive.scan, KEYWORDS))
+    after = report("token index", time_per_call(archive.find, KEYWORDS))
+    speedup(before, after)
+
+
+def bench_path_lookup():
+    archive = agent.archive_store.get()
+    words = sorted(archive.path_index)
+    section('path_lookup', f"Exact-word lookup over all {len(words)} word paths")
+    report("token index", time_per_call(archive.find, words, len(words)))
+    report("path index", time_per_call(archive.exact, words, len(words)))
+    report("path + token (search)", time_per_call(archive.search, words, len(words)))
+
+
+def legacy_seance_config():
+    """seance_config() as it was: the persona re-read and a fresh config built per call."""
+    try:
+        with open('../.kiro/steering_docs/medium_persona.md', 'r') as f:
+            persona = f.read()
+    except FileNotFoundError:
+        persona = agent.PERSONA_FALLBACK_PROMPT
+    return types.GenerateContentConfig(system_instruction=persona, temperature=agent.SEANCE_TEMPERATURE)
+
+
+def bench_prompt_config():
+    section('prompt_config', "Per-request seance config")
+    before = report("read persona + build", time_per_call(lambda _: legacy_seance_config(), [None]))
+    after = report("prompt registry", time_per_call(lambda _: agent.seance_config(), [None]))
+    speedup(before, after)
+
+
+def bench_metrics_overhead():
+    section('metrics_overhead', "Instrumentation overhead")
+
+    def timed_stage(_):
+        with metrics.stage('benchmark'):
+            pass
+
+    report("stage timer", time_per_call(timed_stage, [None], 10_000))
+    report("counter inc", time_per_call(lambda _: metrics.SEARCHES.inc('benchmark', 'match'), [None], 10_000))
+    report("render /metrics", time_per_call(lambda _: metrics.render(), [None]))
+
+
+def bench_fuzzy_lookup():
+    archive = agent.archive_store.get()
+    section('fuzzy', f"Fuzzy suggestions for missed keywords ({len(archive.token_index)} words)")
+    start = time.perf_counter()
+    FuzzyIndex(archive.token_index, ())
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"  Index build: {build_ms:.0f} ms")
+    record("index_build_ms", round(build_ms, 1))
+    index = agent.fuzzy_store.get(archive)
+    start = time.perf_counter()
+    index.extended(['gopherine'])
+    extend_ms = (time.perf_counter() - start) * 1000
+    print(f"  Adding one new word: {extend_ms:.1f} ms")
+    record("add_word_ms", round(extend_ms, 1))
+    report("suggest", time_per_call(index.suggest, FUZZY_KEYWORDS))
+    for word in FUZZY_KEYWORDS:
+        print(f"  {word!r} -> {index.suggest(word)}")
+
+
+def bench_semantic():
+    if not available():
+        section('search_modes', "Search modes skipped: the semantic index needs NumPy")
+        return
+    archive = agent.archive_store.get()
+    section('search_modes', f"Search modes on the real archive ({len(archive)} entries)")
+    start = time.perf_counter()
+    index = fit(archive.contents)
+    index.digest = archive_digest(zip(archive.ids, archive.paths, archive.contents))
+    fit_ms = (time.perf_counter() - start) * 1000
+    print(f"  LSA fit + embed: {fit_ms:.0f} ms ({index.vectors.shape[1]} dimensions)")
+    record("fit_ms", round(fit_ms, 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path, vectors_path = os.path.join(tmp, 'semantic.npz'), os.path.join(tmp, 'semantic.npy')
+        save(index, model_path, vectors_path)
+        keyword_store, agent.semantic_store = agent.semantic_store, SemanticStore(model_path, vectors_path)
+        for mode in agent.SEARCH_MODES:
+            report(mode, time_per_call(lambda k, m=mode: agent.search_gopher_archive(k, mode=m), KEYWORDS))
+        agent.semantic_store = keyword_store
+
+    # One matrix-vector product plus argpartition, at archive sizes we do not have yet
+    section('semantic_scaling', f"Semantic top-{SEMANTIC_TOP_K} scoring vs archive size")
+    rng = np.random.default_rng(SEED)
+    dimensions = index.vectors.shape[1]
+    for size in SEMANTIC_SIZES:
+        vectors = rng.standard_normal((size, dimensions), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        synthetic = SemanticIndex([], None, None, vectors)
+        queries = [vectors[i] for i in rng.integers(0, size, 20)]
+        report(f"{size:>9} entries", time_per_call(
+            lambda q, s=synthetic: s.top(q, SEMANTIC_TOP_K), queries, 20))
+        del vectors, synthetic
+
+
+def synthetic_entries(count, seed=SEED, unique_paths=True):
+    """Archive-shaped entries built from the real archive's vocabulary.
+
+    With unique_paths=False path words repeat like the real archive's do,
+    keeping the vocabulary (and the fuzzy index) at its real size.
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted({t for text in agent.archive_store.get().contents for t in tokenize(text)})
+    for i in range(count):
+        word = f"{rng.choice(vocabulary)}{i}" if unique_paths else rng.choice(vocabulary)
+        yield {
+            "id": 1000 + i,
+            "path": f"/menu/semantic/{word}",
+            "content": ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(5, 14))).capitalize() + '.'
+        }
+
+
+def measure_load(load):
+    """Returns (cold start ms, Python heap MB retained) for one archive load."""
+    gc.collect()
+    start = time.perf_counter()
+    archive = load()
+    elapsed = (time.perf_counter() - start) * 1000
+    del archive
+    gc.collect()
+    tracemalloc.start()
+    archive = load()
+    retained = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+    return elapsed, retained, archive
+
+
+def bench_snapshot():
+    section('snapshot', "Cold start and resident archive memory")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [len(agent.archive_store.get())] + SNAPSHOT_SIZES:
+            json_path = os.path.join(tmp, f"archive_{size}.json")
+            jsonl_path = os.path.join(tmp, f"archive_{size}.jsonl")
+            snapshot_path = os.path.join(tmp, f"archive_{size}.snapshot")
+            entries = list(iter_archive(LEGACY_ARCHIVE_PATH)) if size == len(agent.archive_store.get()) \
+                else list(synthetic_entries(size))
+            with open(json_path, 'w') as f:
+                json.dump(entries, f, indent=2)
+            write_archive(jsonl_path, entries)
+            compile_snapshot(entries, snapshot_path)
+            del entries
+
+            def legacy_load():
+                with open(json_path, 'r') as f:
+                    return json.load(f)
+
+            print(f"  {size} entries (snapshot file {os.path.getsize(snapshot_path) / 2 ** 20:.1f} MB):")
+            for label, load in [
+                    ("json.load list of dicts", legacy_load),
+                    ("ArchiveSnapshot from JSONL", lambda: load_archive_snapshot(jsonl_path)),
+                    ("mmap'ed MappedArchive", lambda: MappedArchive(snapshot_path))]:
+                elapsed, retained, archive = measure_load(load)
+                line = f"    {label:<28} cold start={elapsed:9.1f} ms  heap={retained:8.1f} MB"
+                result = {"cold_start_ms": round(elapsed, 1), "heap_mb": round(retained, 1)}
+                if hasattr(archive, 'rank'):
+                    latency = statistics.median(time_per_call(lambda k, a=archive: a.rank([k], 10), KEYWORDS, 50))
+                    line += f"  rank p50={latency:.3f} ms"
+                    result["rank_p50_ms"] = round(latency, 4)
+                print(line)
+                record(f"{size} {label}", result)
+                del archive
+
+
+def bench_merge(size=MERGE_ARCHIVE_SIZE, batch=MERGE_BATCH, reruns=MERGE_RERUNS):
+    """A generator rerun against an archive: blind appends vs merge_entries, then compaction."""
+    section('merge', f"{reruns} runs of a {batch}-entry generator into a {size}-entry archive")
+    entries = list(synthetic_entries(size + batch))
+    generated = [{"path": e["path"], "content": e["content"]} for e in entries[size:]]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, write in (("append", append_entries), ("merge_entries", merge_entries)):
+            path = os.path.join(tmp, f"{label}.jsonl")
+            write_archive(path, entries[:size])
+            start = time.perf_counter()
+            for _ in range(reruns):
+                write(path, generated)
+            elapsed = (time.perf_counter() - start) * 1000 / reruns
+            load_ms, _, archive = measure_load(lambda: load_archive_snapshot(path))
+            result = {"run_ms": round(elapsed, 1), "entries": len(archive),
+                      "mb": round(os.path.getsize(path) / 2 ** 20, 2), "cold_start_ms": round(load_ms, 1)}
+            print(f"  {label:<28} {result['run_ms']:8.1f} ms/run  entries={result['entries']}  "
+                  f"file={result['mb']} MB  load={result['cold_start_ms']} ms")
+            record(label, result)
+            del archive
+        start = time.perf_counter()
+        report = compact(os.path.join(tmp, "append.jsonl"))
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"  {'compact the appended one':<28} {elapsed:8.1f} ms  removed {report['removed']} entries, "
+              f"{(report['bytes_before'] - report['bytes_after']) / 2 ** 20:.2f} MB")
+        record("compact", {"ms": round(elapsed, 1), "removed": report['removed'],
+                           "bytes_removed": report['bytes_before'] - report['bytes_after']})
+
+
+def interpretation(words, seed=SEED):
+    rng = random.Random(seed + words)
+    vocabulary = sorted(agent.archive_store.get().token_index)
+    return f"{agent.OPENING_PHRASE}\n\n" + ' '.join(rng.choice(vocabulary) for _ in range(words))
+
+
+def bench_hot_paths(sizes=HOT_PATH_SIZES):
+    """Per-request CPU work: keyword extraction, archive search and the word limit."""
+    section('keyword_extraction', f"extract_keywords over {len(QUERIES)} queries")
+    report("extract_keywords", time_per_call(agent.extract_keywords, QUERIES))
+
+    section('enforce_word_limit', "enforce_word_limit by interpretation length")
+    for words in INTERPRETATION_LENGTHS:
+        report(f"{words} words", time_per_call(agent.enforce_word_limit, [interpretation(words)]))
+
+    keyword_lists = [agent.extract_keywords(query) for query in QUERIES]
+    section('search', f"search_gopher_archive by archive size ({len(keyword_lists)} queries)")
+    random.seed(SEED)
+    report(f"{len(agent.archive_store.get())} entries",
+           time_per_call(agent.search_gopher_archive, keyword_lists))
+
+    stores = agent.archive_store, agent.fuzzy_store
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for size in sizes:
+                path = os.path.join(tmp, f"archive_{size}.jsonl")
+                write_archive(path, synthetic_entries(size, unique_paths=False))
+                agent.archive_store = ArchiveStore(path)
+                agent.fuzzy_store = FuzzyStore(os.path.join(tmp, f"fuzzy_{size}.index"))
+                agent.fuzzy_store.get(agent.archive_store.get())
+                random.seed(SEED)
+                report(f"{size} entries", time_per_call(agent.search_gopher_archive, keyword_lists))
+        finally:
+            agent.archive_store, agent.fuzzy_store = stores
+
+
+def bench_compression(size=COMPRESSION_ARCHIVE_SIZE, limits=COMPRESSION_LIMITS):
+    """/api/seance bytes and time per encoding, and the cost of a 304, on a large synthetic archive."""
+    section('compression', f"/api/seance over {size} synthetic entries, {len(QUERIES)} queries, "
+            f"transfer at {COMPRESSION_LINK_MBPS} Mbit/s")
+    saved = agent.archive_store, agent.fuzzy_store, agent.client, agent.search_gopher_archive, agent.rate_limiter.rate
+    http = agent.app.test_client()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            path = os.path.join(tmp, "archive.jsonl")
+            write_archive(path, synthetic_entries(size, unique_paths=False))
+            agent.archive_store = ArchiveStore(path)
+            agent.fuzzy_store = FuzzyStore(os.path.join(tmp, "fuzzy.index"))
+            agent.fuzzy_store.get(agent.archive_store.get())
+            # Mock interpretations: only the search result and its encoding are measured
+            agent.client = None
+            agent.rate_limiter.rate = 0
+            for limit in limits:
+                agent.search_gopher_archive = partial(saved[3], limit=limit)
+                print(f"  top {limit} matches:")
+                etags = {}
+                # Warm the search path so the first encoding measured is not penalised
+                for query in QUERIES:
+                    http.post('/api/seance', json={"user_query": query}).close()
+                for encoding in ('identity',) + supported_encodings() + ('304',):
+                    sizes, samples = [], []
+                    for query in QUERIES:
+                        headers = {'Accept-Encoding': 'identity' if encoding == '304' else encoding}
+                        if encoding == '304':
+                            headers['If-None-Match'] = etags[query]
+                        start = time.perf_counter()
+                        with http.post('/api/seance', json={"user_query": query}, headers=headers) as response:
+                            body = response.get_data()
+                        assert response.status_code == (304 if encoding == '304' else 200), response.status_code
+                        samples.append((time.perf_counter() - start) * 1000)
+                        sizes.append(len(body))
+                        etags.setdefault(query, response.headers.get('ETag'))
+                    mean_bytes = statistics.mean(sizes)
+                    transfer = mean_bytes * 8 / (COMPRESSION_LINK_MBPS * 1000)
+                    server = statistics.median(samples)
+                    print(f"    {encoding:<26} {mean_bytes / 1024:8.1f} KB  server p50={server:7.2f} ms  "
+                          f"+ transfer={transfer:7.2f} ms")
+                    record(f"top {limit} {encoding}", {"kb": round(mean_bytes / 1024, 2), "p50_ms": round(server, 3),
+                                                       "transfer_ms": round(transfer, 2)})
+        finally:
+            (agent.archive_store, agent.fuzzy_store, agent.client, agent.search_gopher_archive,
+             agent.rate_limiter.rate) = saved
+
+
+def bench_endpoints(servers=('asgi',), delay=ENDPOINT_DELAY, requests=ENDPOINT_REQUESTS,
+                    concurrency=ENDPOINT_CONCURRENCY, workers=ENDPOINT_WORKERS):
+    """Throughput and latency of the real servers against a fake Gemini backend."""
+    section('endpoints', f"End-to-end, stub LLM at {delay * 1000:.0f} ms per call, "
+            f"{requests} requests, {concurrency} concurrent")
+    fake = FakeGeminiServer(delay_seconds=delay).start()
+    try:
+        for kind in servers:
+            port = free_port()
+            proc = start_server(kind, port, fake.base_url, workers)
+            try:
+                for endpoint in ('seance', 'learn'):
+                    # Warm up imports, connections and prepared configs first
+                    asyncio.run(run_load(port, endpoint, min(20, requests), concurrency))
+                    before = fake.requests
+                    summary = summarize(*asyncio.run(run_load(port, endpoint, requests, concurrency)))
+                    summary["upstream_calls"] = fake.requests - before
+                    label = f"{kind} /api/{endpoint}"
+                    print(f"  {label:<28} {summary['throughput_rps']:7.1f} req/s  "
+                          f"p50={summary['p50_ms']} ms  p99={summary['p99_ms']} ms  errors={summary['errors']}")
+                    record(label, summary)
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        fake.stop()
+
+
+def bench_resilience(calls=RESILIENCE_CALLS):
+    """Model-call latency and success through LLMGateway against a misbehaving fake client."""
+    models = (agent.MODEL_NAME, agent.MODEL_NAME2)
+    config = types.GenerateContentConfig()
+
+    def run(faults, models=models, **options):
+        gateway = LLMGateway(FakeClient(delay_seconds=RESILIENCE_LATENCY, faults=faults), **options)
+        samples, failures = [], 0
+        for _ in range(calls):
+            start = time.perf_counter()
+            try:
+                gateway.generate(models, 'benchmark', lambda model: config)
+            except Exception:
+                failures += 1
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples, failures
+
+    section('resilience_tail', f"{RESILIENCE_SLOW_RATE:.0%} of calls {RESILIENCE_SLOW_SECONDS}s slower")
+    for label, percentile in (("no hedging", 0), ("hedged at p95", 95)):
+        samples, _ = run(FaultInjector(slow_rate=RESILIENCE_SLOW_RATE, slow_seconds=RESILIENCE_SLOW_SECONDS,
+                                       seed=SEED), hedge_percentile=percentile)
+        report(label, samples)
+
+    section('resilience_errors', f"{RESILIENCE_ERROR_RATE:.0%} of calls fail with 503")
+    for label, options in (("single attempt", {"max_attempts": 1}), ("retries", {})):
+        # One model and no breaker, so the figure shows retries alone
+        _, failures = run(FaultInjector(error_rate=RESILIENCE_ERROR_RATE, seed=SEED), models[:1],
+                          breaker_failures=calls, **options)
+        print(f"  {label:<28} success={1 - failures / calls:8.1%}")
+        record(label, {"success_rate": round(1 - failures / calls, 4)})
+
+    section('resilience_fallback', f"{agent.MODEL_NAME} down")
+    faults = FaultInjector(down_models={agent.MODEL_NAME})
+    samples, failures = run(faults)
+    report("fallback", samples)
+    print(f"  {'success':<28} {1 - failures / calls:.1%}")
+    record("success_rate", round(1 - failures / calls, 4))
+
+
+class FixedBatchSizer(semantic_cipher_generator.BatchSizer):
+    """The generator's old sizing: always GENERATOR_FIXED_BATCH words."""
+
+    def size(self):
+        return GENERATOR_FIXED_BATCH
+
+    def observe(self, words, result):
+        pass
+
+
+def bench_generator(words=GENERATOR_WORDS):
+    """API calls the cipher generator spends on a wordlist, against a model that drops and truncates."""
+    section('generator', f"Semantic cipher generation for {words} words")
+    generator = semantic_cipher_generator
+    saved = {name: getattr(generator, name) for name in (
+        'WORDLIST_FILE', 'OUTPUT_FILE', 'LEGACY_OUTPUT_FILE', 'CHECKPOINT_FILE', 'REQUESTS_PER_MINUTE',
+        'TOKENS_PER_MINUTE', 'MAX_WORD_REQUESTS', 'BatchSizer', 'refresh_semantic_index')}
+    runs = (
+        (f"fixed {GENERATOR_FIXED_BATCH}, no follow-ups", FixedBatchSizer, 1, generator.OUTPUT_TOKEN_BUDGET),
+        ("adaptive", saved['BatchSizer'], saved['MAX_WORD_REQUESTS'], generator.OUTPUT_TOKEN_BUDGET),
+        (f"adaptive, {GENERATOR_TIGHT_LIMIT}-token limit", saved['BatchSizer'], saved['MAX_WORD_REQUESTS'],
+         GENERATOR_TIGHT_LIMIT),
+    )
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            generator.WORDLIST_FILE = os.path.join(tmp, 'wordlist.txt')
+            with open(generator.WORDLIST_FILE, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(f"word{i}" for i in range(words)))
+            # Quota pacing is left out; the suite counts calls, not waits
+            generator.REQUESTS_PER_MINUTE = generator.TOKENS_PER_MINUTE = 10 ** 9
+            generator.refresh_semantic_index = lambda path: None
+            for label, sizer, word_requests, output_limit in runs:
+                generator.OUTPUT_FILE = os.path.join(tmp, f"{len(RESULTS['generator'])}.jsonl")
+                generator.LEGACY_OUTPUT_FILE = generator.OUTPUT_FILE + '.json'
+                generator.CHECKPOINT_FILE = generator.OUTPUT_FILE + '.checkpoint'
+                generator.BatchSizer, generator.MAX_WORD_REQUESTS = sizer, word_requests
+                client = FakeCipherClient(output_limit=output_limit, seed=SEED)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    generator.run_semantic_generator(client=client, sleep=lambda seconds: None)
+                with open(generator.OUTPUT_FILE, encoding='utf-8') as f:
+                    entries = sum(1 for _ in f)
+                calls = len(client.models.calls)
+                result = {"calls": calls, "entries": entries, "entries_per_call": round(entries / calls, 1),
+                          "coverage": round(entries / words, 4)}
+                print(f"  {label:<28} calls={calls:4}  entries/call={result['entries_per_call']:6.1f}  "
+                      f"coverage={result['coverage']:.1%}")
+                record(label, result)
+    finally:
+        for name, value in saved.items():
+            setattr(generator, name, value)
+
+
+def process_tree(pid):
+    """pid and every process descended from it, from /proc."""
+    parents = {}
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open(f'/proc/{name}/stat', encoding='utf-8') as f:
+                    # The command name may hold spaces, so split after its closing parenthesis
+                    parents[int(name)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, frontier = [pid], [pid]
+    while frontier:
+        children = [child for child, parent in parents.items() if parent in frontier]
+        tree += children
+        frontier = children
+    return tree
+
+
+def command_line(pid):
+    with open(f'/proc/{pid}/cmdline', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def memory_mb(pid):
+    """(RSS, PSS, private) in MB of one process, from smaps_rollup."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def bench_startup(servers=STARTUP_SERVERS, workers=STARTUP_WORKERS):
+    """Time to first ready answer and memory per worker for each way of serving the app."""
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("\n=== startup: needs /proc/<pid>/smaps_rollup (Linux), skipped ===")
+        return
+    section('startup', f"Cold start and memory, {workers} workers, after {ENDPOINT_REQUESTS} requests")
+    fake = FakeGeminiServer(delay_seconds=0).start()
+    try:
+        for kind in servers:
+            port = free_port()
+            start = time.perf_counter()
+            proc = start_server(kind, port, fake.base_url, workers, wait=False)
+            try:
+                wait_until_ready(port)
+                cold_start = (time.perf_counter() - start) * 1000
+                # Let every worker finish warming up and serve traffic before sampling memory
+                asyncio.run(run_load(port, 'seance', ENDPOINT_REQUESTS, ENDPOINT_CONCURRENCY))
+                time.sleep(1)
+                tree = process_tree(proc.pid)
+                sizes = {pid: memory_mb(pid) for pid in tree}
+                # The master's other children (multiprocessing's resource tracker) are not workers
+                worker_pids = [pid for pid in tree[1:] if 'resource_tracker' not in command_line(pid)]
+                result = {
+                    "cold_start_ms": round(cold_start, 1),
+                    "worker_rss_mb": round(statistics.mean(sizes[pid][0] for pid in worker_pids), 1),
+                    "worker_private_mb": round(statistics.mean(sizes[pid][2] for pid in worker_pids), 1),
+                    "total_pss_mb": round(sum(size[1] for size in sizes.values()), 1),
+                }
+                print(f"  {kind:<28} ready in {result['cold_start_ms']:8.1f} ms  "
+                      f"per worker rss={result['worker_rss_mb']} MB private={result['worker_private_mb']} MB  "
+                      f"total pss={result['total_pss_mb']} MB")
+                record(kind, result)
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        fake.stop()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, args):
+    payload = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "archive_entries": len(agent.archive_store.get()),
+            "args": {k: v for k, v in vars(args).items() if k not in ('json', 'compare')},
+        },
+        "results": RESULTS,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+    print(f"\nWrote results to {path}")
+
+
+# Lower is better for latencies, higher for throughput and speedups
+COMPARED_METRICS = {"p50_ms": -1, "p99_ms": -1, "throughput_rps": 1, "cold_start_ms": -1, "heap_mb": -1,
+                    "worker_private_mb": -1, "total_pss_mb": -1}
+# Changes smaller than this are reported as run-to-run noise
+NOISE_PERCENT = 5
+
+
+def compare(before_path, after_path):
+    """Prints the change in every shared measurement between two --json runs."""
+    with open(before_path, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(after_path, encoding='utf-8') as f:
+        after = json.load(f)
+    print(f"Comparing {before['meta']['commit']} ({before['meta']['timestamp']}) "
+          f"-> {after['meta']['commit']} ({after['meta']['timestamp']})")
+    for name, results in after["results"].items():
+        old_results = before["results"].get(name, {})
+        rows = []
+        for label, value in results.items():
+            old = old_results.get(label)
+            if not isinstance(value, dict) or not isinstance(old, dict):
+                continue
+            for metric, direction in COMPARED_METRICS.items():
+                if old.get(metric) and value.get(metric) is not None:
+                    change = (value[metric] - old[metric]) / old[metric] * 100
+                    verdict = 'same' if abs(change) < NOISE_PERCENT else 'better' if change * direction > 0 else 'worse'
+                    rows.append(f"  {label:<28} {metric:<15} {old[metric]:>10} -> {value[metric]:>10}"
+                                f"  {change:+6.1f}% {verdict}")
+        if rows:
+            print(f"\n--- {name} ---")
+            print('\n'.join(rows))
+
+
+SUITES = {
+    'archive-load': bench_archive_load,
+    'index-equivalence': check_index_equivalence,
+    'token-index': bench_token_index,
+    'path-lookup': bench_path_lookup,
+    'prompt-config': bench_prompt_config,
+    'metrics': bench_metrics_overhead,
+    'fuzzy': bench_fuzzy_lookup,
+    'semantic': bench_semantic,
+    'snapshot': bench_snapshot,
+    'merge': bench_merge,
+    'hot-paths': bench_hot_paths,
+    'endpoints': bench_endpoints,
+    'compression': bench_compression,
+    'resilience': bench_resilience,
+    'generator': bench_generator,
+    'startup': bench_startup,
+}
+
+
+def main():
+    global ITERATIONS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', action='append', choices=sorted(SUITES),
+                        help="suite to run (repeatable); default: all")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help="compare two --json result files instead of running")
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help="calls per micro-benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=HOT_PATH_SIZES,
+                        help="synthetic archive sizes for the hot-path suite")
+    parser.add_argument('--server', action='append', choices=sorted(SERVER_COMMANDS),
+                        help="server for the endpoints suite (repeatable); default: asgi")
+    parser.add_argument('--delay', type=float, default=ENDPOINT_DELAY, help="stub LLM latency in seconds")
+    parser.add_argument('--requests', type=int, default=ENDPOINT_REQUESTS)
+    parser.add_argument('--concurrency', type=int, default=ENDPOINT_CONCURRENCY)
+    parser.add_argument('--workers', type=int, default=ENDPOINT_WORKERS, help="ASGI worker processes")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    ITERATIONS = args.iterations
+    suites = dict(SUITES)
+    suites['hot-paths'] = partial(bench_hot_paths, args.sizes)
+    suites['endpoints'] = partial(bench_endpoints, args.server or ['asgi'], args.delay,
+                                  args.requests, args.concurrency, args.workers)
+    for name in args.suite or suites:
+        suites[name]()
+    if args.json:
+        write_results(args.json, args)
+
+
+if __name__ == "__main__":
+    main()
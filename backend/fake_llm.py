@@ -0,0 +1,347 @@
+"""Offline stand-ins for the Gemini API.
+
+FakeClient exposes the same `client.models` and `client.aio.models` calls
+that agent.py and async_agent.py make, returning canned text so endpoints
+can be exercised without an API key; a FaultInjector makes it fail, stall
+or lose a model on demand. FakeCipherClient plays the model for the cipher
+generator's batches, dropping, renaming and truncating like the real one. FakeGeminiServer goes one level lower
+and answers the REST calls the real SDK sends, so a genai.Client pointed at
+it through GEMINI_BASE_URL exercises the full HTTP path.
+"""
+
+import asyncio
+import json
+import random
+import re
+import itertools
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.genai.errors import ClientError, ServerError
+
+DEFAULT_TEXT = "Hark, the Gopher nexus coughs up a cipher...\n\nThe wire hums with old static."
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FaultInjector:
+    """Upstream misbehaviour for FakeClient.
+
+    Every call draws once: with probability `error_rate` it fails with
+    `error_code`, with probability `slow_rate` it takes `slow_seconds`
+    longer. Models in `down_models` always fail and the next `fail_next`
+    calls fail regardless. A call slower than the timeout in its config's
+    http_options raises TimeoutError once that timeout has passed, as the
+    SDK's HTTP client would. `injected` counts what was done.
+    """
+
+    def __init__(self, error_rate=0.0, error_code=503, slow_rate=0.0, slow_seconds=5.0,
+                 down_models=(), fail_next=0, seed=0):
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.down_models = set(down_models)
+        self.fail_next = fail_next
+        self.injected = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def error(self):
+        payload = {"error": {"code": self.error_code, "message": "Injected fault", "status": "UNAVAILABLE"}}
+        return (ServerError if self.error_code >= 500 else ClientError)(self.error_code, payload)
+
+    def plan(self, model, config, delay):
+        """(seconds to wait, exception to raise or None) for one call."""
+        with self._lock:
+            roll = self._rng.random()
+            if self.fail_next > 0 or model in self.down_models or roll < self.error_rate:
+                self.fail_next = max(0, self.fail_next - 1)
+                self.injected['error'] += 1
+                return delay, self.error()
+            if roll < self.error_rate + self.slow_rate:
+                self.injected['slow'] += 1
+                delay += self.slow_seconds
+        timeout = getattr(getattr(config, 'http_options', None), 'timeout', None)
+        if timeout is not None and delay > timeout / 1000:
+            self.injected['timeout'] += 1
+            return timeout / 1000, TimeoutError(f"Request timed out after {timeout}ms")
+        return delay, None
+
+
+class FakeModels:
+    def __init__(self, text, chunk_size, delay_seconds, faults=None):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.delay_seconds = delay_seconds
+        self.faults = faults
+        self.calls = []
+
+    def plan(self, model, contents, config):
+        """Records a call and decides its latency and failure."""
+        self.calls.append({"model": model, "contents": contents, "config": config})
+        if self.faults is None:
+            return self.delay_seconds, None
+        return self.faults.plan(model, config, self.delay_seconds)
+
+    def generate_content(self, model, contents, config=None):
+        delay, error = self.plan(model, contents, config)
+        if delay:
+            time.sleep(delay)
+        if error:
+            raise error
+        return FakeResponse(self.text)
+
+    def generate_content_stream(self, model, contents, config=None):
+        delay, error = self.plan(model, contents, config)
+        # Faults strike before the first chunk
+        if error:
+            time.sleep(delay)
+            raise error
+        if delay > self.delay_seconds:
+            time.sleep(delay - self.delay_seconds)
+        for i in range(0, len(self.text), self.chunk_size):
+            if self.delay_seconds:
+                time.sleep(self.delay_seconds)
+            yield FakeResponse(self.text[i:i + self.chunk_size])
+
+
+class FakeAsyncModels:
+    def __init__(self, models):
+        self._models = models
+
+    async def generate_content(self, model, contents, config=None):
+        delay, error = self._models.plan(model, contents, config)
+        if delay:
+            await asyncio.sleep(delay)
+        if error:
+            raise error
+        return FakeResponse(self._models.text)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        delay, error = self._models.plan(model, contents, config)
+        if error:
+            await asyncio.sleep(delay)
+            raise error
+        if delay > self._models.delay_seconds:
+            await asyncio.sleep(delay - self._models.delay_seconds)
+        return self._chunks()
+
+    async def _chunks(self):
+        text, size = self._models.text, self._models.chunk_size
+        for i in range(0, len(text), size):
+            if self._models.delay_seconds:
+                await asyncio.sleep(self._models.delay_seconds)
+            yield FakeResponse(text[i:i + size])
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.thoughts_token_count = 0
+
+
+class FakeCandidate:
+    def __init__(self, finish_reason):
+        self.finish_reason = finish_reason
+
+
+class FakeCipherModels:
+    """Answers semantic_cipher_generator's batch prompts the way the model tends to.
+
+    Each requested word costs a random 20-40 output tokens. With probability
+    `drop_rate` a word is left out, with `rename_rate` it comes back as a
+    different word and with `empty_rate` without a cipher. Output past
+    `output_limit` tokens is cut off mid-JSON, as max_output_tokens does.
+    """
+
+    def __init__(self, drop_rate=0.05, rename_rate=0.03, empty_rate=0.02, output_limit=8192, seed=0):
+        self.drop_rate = drop_rate
+        self.rename_rate = rename_rate
+        self.empty_rate = empty_rate
+        self.output_limit = output_limit
+        self.calls = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config=None):
+        words = contents.split(':\n', 1)[1].split(', ')
+        items, costs = [], []
+        with self._lock:
+            self.calls.append(len(words))
+            for word in words:
+                roll = self._rng.random()
+                costs.append(self._rng.randint(20, 40))
+                if roll < self.drop_rate:
+                    continue
+                if roll < self.drop_rate + self.rename_rate:
+                    word += 's'
+                cipher = '' if roll > 1 - self.empty_rate else f"The {word} stirs beneath the static."
+                items.append({"word": word, "cipher": cipher, "is_valid": True})
+        text, output_tokens = json.dumps(items), sum(costs)
+        finish_reason = 'STOP'
+        if output_tokens > self.output_limit:
+            text = text[:len(text) * self.output_limit // output_tokens]
+            output_tokens, finish_reason = self.output_limit, 'MAX_TOKENS'
+        response = FakeResponse(text)
+        response.usage_metadata = FakeUsage(150 + 3 * len(words), output_tokens)
+        response.candidates = [FakeCandidate(finish_reason)]
+        return response
+
+
+class FakeCipherClient:
+    def __init__(self, **options):
+        self.models = FakeCipherModels(**options)
+
+
+class FakeCachedContent:
+    def __init__(self, name, model, ttl_seconds):
+        self.name = name
+        self.model = model
+        self.expire_time = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+
+
+class FakeCaches:
+    """Context caches kept in memory, recording what was created and deleted."""
+
+    def __init__(self):
+        self.created = {}
+        self.deleted = []
+        self._ids = itertools.count(1)
+
+    def create(self, model, config=None):
+        ttl = int(str(getattr(config, 'ttl', None) or '3600s').rstrip('s'))
+        cached = FakeCachedContent(f"cachedContents/fake-{next(self._ids)}", model, ttl)
+        self.created[cached.name] = config
+        return cached
+
+    def delete(self, name, config=None):
+        self.deleted.append(name)
+        self.created.pop(name, None)
+
+
+class FakeAio:
+    def __init__(self, models):
+        self.models = FakeAsyncModels(models)
+
+
+class FakeClient:
+    """Drop-in replacement for genai.Client with scripted output and optional faults."""
+
+    def __init__(self, text=DEFAULT_TEXT, chunk_size=8, delay_seconds=0.0, faults=None):
+        self.models = FakeModels(text, chunk_size, delay_seconds, faults)
+        self.aio = FakeAio(self.models)
+        self.caches = FakeCaches()
+
+
+GEMINI_PATH_PATTERN = re.compile(r'/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)')
+
+
+def gemini_payload(text):
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0
+        }],
+        "usageMetadata": {
+            "promptTokenCount": 0,
+            "candidatesTokenCount": len(text.split()),
+            "totalTokenCount": len(text.split())
+        }
+    }
+
+
+class BackloggedHTTPServer(ThreadingHTTPServer):
+    # The stdlib default of 5 refuses connections long before a load test peaks
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeGeminiServer:
+    """Local HTTP server speaking just enough of the Gemini REST API for load tests.
+
+    Every call sleeps `delay_seconds` before answering, standing in for
+    model latency; streaming calls spread that delay over their chunks.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, text=DEFAULT_TEXT, delay_seconds=0.5, chunk_size=16):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_DELETE(self):
+                if not self.path.startswith('/v1beta/cachedContents/'):
+                    self.send_error(404)
+                    return
+                self.send_json({})
+
+            def do_POST(self):
+                request = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path.startswith('/v1beta/cachedContents'):
+                    fake.caches_created += 1
+                    ttl = int(json.loads(request or b'{}').get('ttl', '3600s').rstrip('s'))
+                    self.send_json({
+                        "name": f"cachedContents/fake-{fake.caches_created}",
+                        "expireTime": (datetime.now(timezone.utc) + timedelta(seconds=ttl)).isoformat()})
+                    return
+                match = GEMINI_PATH_PATTERN.match(self.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                fake.requests += 1
+                if match.group(2) == 'generateContent':
+                    time.sleep(fake.delay_seconds)
+                    self.send_json(gemini_payload(fake.text))
+                    return
+
+                chunks = [fake.text[i:i + fake.chunk_size]
+                          for i in range(0, len(fake.text), fake.chunk_size)]
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for chunk in chunks:
+                    time.sleep(fake.delay_seconds / len(chunks))
+                    self.wfile.write(f"data: {json.dumps(gemini_payload(chunk))}\r\n\r\n".encode('utf-8'))
+                    self.wfile.flush()
+                self.close_connection = True
+
+        self.text = text
+        self.delay_seconds = delay_seconds
+        self.chunk_size = chunk_size
+        self.requests = 0
+        self.caches_created = 0
+        self.httpd = BackloggedHTTPServer((host, port), Handler)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,255 @@
+"""Near-miss keyword resolution for archive searches.
+
+When a query word matches nothing ("prophecies", "modems", "gohper"), this
+index proposes archive words it was probably meant as: light suffix
+stemming, prefix completion over the sorted vocabulary, and a SymSpell
+deletion index for edit distance 1 and 2. wordlist.txt tells typos apart
+from real words, so a real word is never "corrected" into an unrelated one.
+
+The index is pickled next to the archive, tagged with the vocabulary and
+wordlist it was built from. New archive entries rarely add words; when
+they do, only the new words are indexed.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+from bisect import bisect_left
+from copy import copy as shallow_copy
+from heapq import merge
+
+FUZZY_INDEX_PATH = 'gopher_fuzzy.index'
+WORDLIST_PATH = 'wordlist.txt'
+INDEX_VERSION = 2
+MAX_EDIT_DISTANCE = 2
+MAX_SUGGESTIONS = 3
+MIN_PREFIX_LENGTH = 4
+
+# (suffix, replacement) pairs tried in order, e.g. prophecies -> prophecy
+SUFFIX_RULES = (
+    ('ies', 'y'), ('ied', 'y'), ('ves', 'f'), ('es', ''), ('s', ''),
+    ('ed', ''), ('ed', 'e'), ('ing', ''), ('ing', 'e'), ('ly', ''),
+    ('er', ''), ('est', ''),
+)
+
+
+def deletes(word, distance):
+    """Every string reachable from word by removing up to `distance` characters."""
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def stems(word):
+    """Candidate base forms of an inflected word, most likely first."""
+    found = []
+    for suffix, replacement in SUFFIX_RULES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            base = word[:-len(suffix)] + replacement
+            found.append(base)
+            # running -> runn -> run
+            if not replacement and len(base) > 3 and base[-1] == base[-2]:
+                found.append(base[:-1])
+    return found
+
+
+def add_deletes(index, words):
+    """Adds every deletion variant of words to index, a variant -> words mapping."""
+    added = {}
+    for word in words:
+        for variant in deletes(word, MAX_EDIT_DISTANCE):
+            added.setdefault(variant, []).append(word)
+    for variant, found in added.items():
+        index[variant] = index.get(variant, ()) + tuple(found)
+    return index
+
+
+class FuzzyIndex:
+    """Precomputed vocabulary structures for stem, prefix and edit-distance lookups."""
+
+    __slots__ = ('fingerprint', 'vocabulary', 'vocabulary_set', 'deletes', 'dictionary')
+
+    def __init__(self, vocabulary, dictionary, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.vocabulary = tuple(sorted(vocabulary))
+        self.vocabulary_set = frozenset(self.vocabulary)
+        self.dictionary = frozenset(dictionary)
+        self.deletes = add_deletes({}, self.vocabulary)
+
+    def extended(self, words, fingerprint=None):
+        """Returns a copy that also covers words; only the new words' deletes are computed."""
+        new = sorted(set(words) - self.vocabulary_set)
+        grown = shallow_copy(self)
+        grown.fingerprint = fingerprint
+        grown.vocabulary = tuple(merge(self.vocabulary, new))
+        grown.vocabulary_set = self.vocabulary_set.union(new)
+        grown.deletes = add_deletes(dict(self.deletes), new)
+        return grown
+
+    def prefixed(self, prefix, limit):
+        """Vocabulary words starting with prefix, shortest first."""
+        found = []
+        for position in range(bisect_left(self.vocabulary, prefix), len(self.vocabulary)):
+            word = self.vocabulary[position]
+            if not word.startswith(prefix):
+                break
+            if word != prefix:
+                found.append(word)
+        return sorted(found, key=lambda w: (len(w), w))[:limit]
+
+    def within_distance(self, word, limit):
+        """Vocabulary words within `limit` edits of word, nearest first."""
+        candidates = set()
+        for variant in deletes(word, limit):
+            candidates.update(self.deletes.get(variant, ()))
+        scored = []
+        for candidate in candidates:
+            distance = edit_distance(word, candidate, limit)
+            if 0 < distance <= limit:
+                scored.append((distance, candidate))
+        return [candidate for _, candidate in sorted(scored)]
+
+    def suggest(self, word, limit=MAX_SUGGESTIONS):
+        """Archive words a missed query word most plausibly refers to."""
+        word = word.lower()
+        suggestions = [s for s in stems(word) if s in self.vocabulary_set]
+        # A real word is not a typo; only misspellings get edit-distance fixes
+        is_typo = word not in self.dictionary
+        if is_typo:
+            suggestions += self.within_distance(word, 1)
+        if len(word) >= MIN_PREFIX_LENGTH:
+            suggestions += self.prefixed(word, limit)
+        if is_typo and len(word) > 4:
+            suggestions += self.within_distance(word, MAX_EDIT_DISTANCE)
+        return list(dict.fromkeys(suggestions))[:limit]
+
+
+def _wordlist_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _fingerprint(vocabulary, wordlist_mtime):
+    digest = hashlib.sha256('\n'.join(sorted(vocabulary)).encode('utf-8')).hexdigest()
+    return (INDEX_VERSION, digest, wordlist_mtime)
+
+
+def _read_wordlist(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return {w.strip().lower() for w in f if w.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+_save_lock = threading.Lock()
+
+
+def save_index(index, index_path=FUZZY_INDEX_PATH):
+    tmp_path = f"{index_path}.tmp"
+    with _save_lock:
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            # A read-only deployment still gets a working in-memory index
+            pass
+
+
+def load_or_build(vocabulary, index_path=FUZZY_INDEX_PATH, wordlist_path=WORDLIST_PATH):
+    """Loads the persisted index for this vocabulary, building and saving it if stale."""
+    fingerprint = _fingerprint(vocabulary, _wordlist_mtime(wordlist_path))
+    try:
+        with open(index_path, 'rb') as f:
+            index = pickle.load(f)
+        if isinstance(index, FuzzyIndex) and index.fingerprint == fingerprint:
+            return index
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+        pass
+
+    index = FuzzyIndex(vocabulary, _read_wordlist(wordlist_path), fingerprint)
+    save_index(index, index_path)
+    return index
+
+
+class FuzzyStore:
+    """Keeps the fuzzy index in step with the vocabulary of the current archive snapshot.
+
+    Most archive changes add no new words and cost one set comparison. New
+    words are indexed into a copy of the index that is swapped in, and
+    anything else (words dropped by compaction, an edited wordlist) is
+    rebuilt on a background thread while the old index keeps answering.
+    Saving to disk always happens off the request path.
+    """
+
+    def __init__(self, index_path=FUZZY_INDEX_PATH, wordlist_path=WORDLIST_PATH):
+        self.index_path = index_path
+        self.wordlist_path = wordlist_path
+        self._lock = threading.Lock()
+        self._archive_key = None
+        self._index = None
+        self._rebuilding = False
+
+    def get(self, archive):
+        key = (archive.mtime, len(archive))
+        if self._archive_key == key:
+            return self._index
+        with self._lock:
+            if self._archive_key != key:
+                self._refresh(frozenset(archive.token_index))
+                self._archive_key = key
+            return self._index
+
+    def _refresh(self, vocabulary):
+        if self._index is None:
+            # First use, normally at startup: nothing to serve meanwhile
+            self._index = load_or_build(vocabulary, self.index_path, self.wordlist_path)
+            return
+        current = self._index
+        wordlist_mtime = _wordlist_mtime(self.wordlist_path)
+        # The last fingerprint field is the wordlist mtime the index was built with
+        if current.fingerprint[-1] == wordlist_mtime and vocabulary >= current.vocabulary_set:
+            if vocabulary != current.vocabulary_set:
+                self._index = current.extended(vocabulary, _fingerprint(vocabulary, wordlist_mtime))
+                threading.Thread(target=save_index, args=(self._index, self.index_path), daemon=True).start()
+        elif not self._rebuilding:
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild, args=(vocabulary,), daemon=True).start()
+
+    def _rebuild(self, vocabulary):
+        index = None
+        try:
+            index = load_or_build(vocabulary, self.index_path, self.wordlist_path)
+        finally:
+            with self._lock:
+                if index is not None:
+                    self._index = index
+                self._rebuilding = False
+                # Re-check against whatever the archive holds by now on the next get()
+                self._archive_key = None
@@ -1,10 +1,12 @@
-import json
-
-import os
+from archive_format import ARCHIVE_PATH, LEGACY_ARCHIVE_PATH, ensure_jsonl_archive
+from archive_merge import merge_entries
+from archive_snapshot import refresh_snapshot
+from semantic_index import refresh_semantic_index
 
 # --- Configuration ---
 WORDLIST_FILE = 'wordlist.txt'
-OUTPUT_FILE = 'gopher_archive.json'
+OUTPUT_FILE = ARCHIVE_PATH
+LEGACY_OUTPUT_FILE = LEGACY_ARCHIVE_PATH
 BATCH_SIZE = 100
 # We are manually setting the slice to process words 2,001 through 6,000
 START_INDEX = 2000
@@ -12,11 +14,9 @@ END_INDEX = 6000
 
 
 # --- Helper function to create cryptic content ---
-def create_cryptic_entry(word, index):
-    """Generates a structured Gopher entry for a given word."""
-    # We use a large ID number to avoid conflicts with existing entries
+def create_cryptic_entry(word):
+    """Generates a structured Gopher entry for a given word (merge_entries assigns the ID)."""
     return {
-        "id": index + 10000,
         "path": f"/menu/word/{word.lower()}",
         "content": f"The ghost of the past whispers the word: {word}. Verily, all knowledge ends in this singular truth."
     }
@@ -53,36 +53,21 @@ def generate_batches():
         print(
             f"Processing Batch {i//BATCH_SIZE + 1} ({len(batch)} entries)...")
 
-        # We need to offset the index for unique ID generation
-        current_global_index = START_INDEX + i
-
-        for j, word in enumerate(batch):
-            new_archive_data.append(
-                create_cryptic_entry(
-                    word, current_global_index + j))
-
-    # 3. LOAD EXISTING DATA AND APPEND NEW DATA
-    try:
-        if os.path.exists(OUTPUT_FILE):
-            with open(OUTPUT_FILE, 'r') as f:
-                existing_data = json.load(f)
-        else:
-            # If the file doesn't exist (e.g., first run ever)
-            existing_data = []
-    except json.JSONDecodeError:
-        print(
-            f"Warning: Existing {OUTPUT_FILE} is empty or corrupted. Starting fresh.")
-        existing_data = []
-
-    final_archive = existing_data + new_archive_data
+        for word in batch:
+            new_archive_data.append(create_cryptic_entry(word))
 
-    # 4. WRITE THE FINAL CONSOLIDATED DATA
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_archive, f, indent=2)
+    # 3. MERGE NEW DATA INTO THE JSON LINES ARCHIVE
+    # Words already archived with the same content are skipped, so a rerun
+    # writes nothing (the legacy JSON array is migrated once if no .jsonl exists yet)
+    ensure_jsonl_archive(OUTPUT_FILE, LEGACY_OUTPUT_FILE)
+    merged = merge_entries(OUTPUT_FILE, new_archive_data)
 
     print(f"\n--- SUCCESS ---")
-    print(f"Generated and appended {len(new_archive_data)} new entries.")
-    print(f"Total entries in {OUTPUT_FILE}: {len(final_archive)}")
+    print(f"Appended {merged['inserted']} new entries to {OUTPUT_FILE}, updated {merged['updated']}, "
+          f"{merged['unchanged']} already present.")
+    if merged['inserted'] or merged['updated']:
+        refresh_semantic_index(OUTPUT_FILE)
+        refresh_snapshot(OUTPUT_FILE)
 
 
 if __name__ == "__main__":
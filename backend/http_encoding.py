@@ -0,0 +1,89 @@
+"""Response compression and ETags shared by the Flask and ASGI apps.
+
+A common keyword can pull hundreds of KB of archive text into
+`cryptic_response`. Bodies past a size threshold are compressed with the
+best encoding the client accepts (brotli when the `brotli` package is
+installed, else gzip), and seance answers carry a weak ETag so a client
+repeating a question can revalidate with If-None-Match and get a 304.
+"""
+
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+# Brotli's top qualities are meant for static assets; 5 beats gzip -6 on
+# JSON at a similar cost per response
+BROTLI_QUALITY = 5
+# Event streams are never buffered for compression; they must flush as they go
+COMPRESSIBLE_TYPES = frozenset({'application/json', 'text/plain', 'text/html'})
+
+
+def supported_encodings():
+    """Encodings this process can produce, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding):
+    """The encoding to use for an Accept-Encoding header, or None for identity.
+
+    The client's q-values decide; among equally weighted encodings the
+    server's preference (brotli over gzip) does.
+    """
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    best, best_weight = None, 0.0
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compressible(content_type):
+    return (content_type or '').split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def make_etag(*parts):
+    """A weak ETag over everything that determines a response.
+
+    Weak, because the same answer is served identity, gzip or brotli
+    encoded, and a regenerated interpretation is equivalent rather than
+    byte-identical.
+    """
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against etag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
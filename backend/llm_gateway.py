@@ -0,0 +1,489 @@
+"""Resilient access to the Gemini models for the endpoints and generators.
+
+Every call goes through LLMGateway, which adds what the bare SDK call lacks:
+
+- a deadline for the whole call and a timeout per attempt, enforced here
+  and passed down to the SDK as the request timeout
+- retries of transient failures (429, 5xx, timeouts) with full-jitter
+  exponential backoff, never sleeping past the deadline
+- a hedged second request once an attempt outlives the model's recent
+  latency percentile (non-streaming calls only, capped by a budget)
+- a circuit breaker per model, so a failing model is skipped outright
+- fallback to the next model in the caller's list when one is exhausted
+
+Streams are retried and fall back only until their first chunk arrives;
+after that the caller has already forwarded text and errors propagate.
+"""
+
+import asyncio
+import inspect
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+from google.genai import types
+from google.genai.errors import APIError
+
+import metrics
+from profiler import traced
+
+# --- Configuration ---
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "20"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_BASE = 0.25
+LLM_BACKOFF_MAX = 4.0
+# Hedge once an attempt is slower than this percentile of recent calls; 0 disables
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# At most this fraction of calls may send a hedge
+LLM_HEDGE_BUDGET = 0.1
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+# Threads that carry synchronous attempts, so the deadline holds even if the SDK hangs
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+# Worth trying another model, but not the same one again
+FALLBACK_STATUS = frozenset({404})
+
+
+class CircuitOpenError(Exception):
+    """Every model the call could use is failing and its circuit is open."""
+
+
+def is_retryable(error):
+    if isinstance(error, APIError):
+        return error.code in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError))
+
+
+def outcome_of(error):
+    return 'timeout' if isinstance(error, (TimeoutError, httpx.TimeoutException)) else 'error'
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures; lets one probe through after `reset_seconds`."""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET, clock=time.monotonic):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = 'closed'
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead; a half-open breaker allows one probe,
+        which must end in record_success(), record_failure() or release()."""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and self.clock() - self._opened_at >= self.reset_seconds:
+                self.state = 'half-open'
+                return True
+            # Open, or half-open with its single probe already in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._consecutive = 0
+
+    def release(self):
+        """Ends an allowed call that says nothing about the model's health (it
+        never reached the model, or was cancelled); a probe slot is freed for
+        the next call."""
+        with self._lock:
+            if self.state == 'half-open':
+                self.state = 'open'
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == 'half-open' or self._consecutive >= self.failures:
+                self.state = 'open'
+                self._opened_at = self.clock()
+
+
+class LatencyTracker:
+    """Recent successful call latencies for one model."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent):
+        with self._lock:
+            if len(self._samples) < MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class _CallPlan:
+    """The retry and fallback decisions for one call, shared by the sync and async paths.
+
+    next_attempt() returns (model, timeout, delay) for the next attempt, or
+    raises once the models, attempts or deadline are used up. Every attempt
+    it hands out is settled on its model's breaker by succeeded() or
+    failed(); used as a context manager, the plan releases an attempt that
+    ended any other way, so a half-open breaker never waits on a lost probe.
+    """
+
+    def __init__(self, gateway, models):
+        self.gateway = gateway
+        self.models = list(models)
+        self.deadline = gateway.clock() + gateway.deadline
+        self.model_index = 0
+        self.attempt = 0
+        self.last_error = None
+        # The model of the attempt handed out and not yet settled
+        self.unsettled = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.unsettled is not None:
+            self.gateway.breaker(self.unsettled).release()
+            self.unsettled = None
+
+    def remaining(self):
+        return self.deadline - self.gateway.clock()
+
+    def next_attempt(self):
+        gateway = self.gateway
+        while self.model_index < len(self.models):
+            model = self.models[self.model_index]
+            if self.attempt >= gateway.max_attempts:
+                self._next_model()
+                continue
+            delay = 0.0
+            if self.attempt:
+                delay = gateway.backoff(self.attempt)
+                metrics.LLM_EVENTS.inc(model, 'retry')
+            remaining = self.remaining() - delay
+            if remaining <= 0:
+                break
+            if not gateway.breaker(model).allow():
+                metrics.LLM_CALLS.inc(model, 'rejected')
+                self.last_error = self.last_error or CircuitOpenError(f"Circuit open for {model}")
+                self._next_model()
+                continue
+            self.attempt += 1
+            self.unsettled = model
+            return model, min(gateway.attempt_timeout, remaining), delay
+
+        if self.last_error is None:
+            self.last_error = TimeoutError(f"LLM deadline of {gateway.deadline}s exceeded")
+        raise self.last_error
+
+    def _next_model(self):
+        self.model_index += 1
+        self.attempt = 0
+        if self.model_index < len(self.models):
+            metrics.LLM_EVENTS.inc(self.models[self.model_index], 'fallback')
+
+    def succeeded(self, model, seconds):
+        self.unsettled = None
+        self.gateway.breaker(model).record_success()
+        self.gateway.latency(model).add(seconds)
+        metrics.LLM_CALLS.inc(model, 'ok')
+
+    def failed(self, model, error):
+        """Records a failed attempt; re-raises errors that no retry or fallback can fix."""
+        metrics.LLM_CALLS.inc(model, outcome_of(error))
+        self.last_error = error
+        self.unsettled = None
+        breaker = self.gateway.breaker(model)
+        if is_retryable(error):
+            breaker.record_failure()
+            return
+        if isinstance(error, APIError):
+            # The model answered, if only to reject this request: it is reachable
+            breaker.record_success()
+        else:
+            breaker.release()
+        if isinstance(error, APIError) and error.code in FALLBACK_STATUS:
+            self.attempt = self.gateway.max_attempts
+            return
+        raise error
+
+
+class LLMGateway:
+    """Deadlines, retries, hedging, circuit breaking and model fallback around a genai client.
+
+    `models` is the preference order for a call; `config_for(model)` returns
+    the GenerateContentConfig to use with each one (on the async paths it
+    may return an awaitable of it instead).
+    """
+
+    def __init__(self, client, deadline=LLM_DEADLINE, attempt_timeout=LLM_ATTEMPT_TIMEOUT,
+                 max_attempts=LLM_MAX_ATTEMPTS, hedge_percentile=LLM_HEDGE_PERCENTILE,
+                 breaker_failures=LLM_BREAKER_FAILURES, breaker_reset=LLM_BREAKER_RESET,
+                 clock=time.monotonic, sleep=time.sleep, max_concurrency=LLM_MAX_CONCURRENCY):
+        self.client = client
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.hedge_percentile = hedge_percentile
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.clock = clock
+        self.sleep = sleep
+        self.max_concurrency = max_concurrency
+        self._breakers = {}
+        self._latencies = {}
+        self._calls = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def breaker(self, model):
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.breaker_failures, self.breaker_reset, self.clock)
+            return self._breakers[model]
+
+    def latency(self, model):
+        with self._lock:
+            return self._latencies.setdefault(model, LatencyTracker())
+
+    def breaker_states(self):
+        with self._lock:
+            return {model: breaker.state for model, breaker in self._breakers.items()}
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff before retry number `attempt`."""
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+    def _hedge_after(self, model, timeout):
+        """Seconds to wait before hedging an attempt, or None if it should not hedge."""
+        if not self.hedge_percentile:
+            return None
+        threshold = self.latency(model).percentile(self.hedge_percentile)
+        if threshold is None or threshold >= timeout:
+            return None
+        with self._lock:
+            if self._hedges >= LLM_HEDGE_BUDGET * self._calls:
+                return None
+        return threshold
+
+    def _count_hedge(self, model):
+        with self._lock:
+            self._hedges += 1
+        metrics.LLM_EVENTS.inc(model, 'hedge')
+
+    def _start_call(self, models):
+        with self._lock:
+            self._calls += 1
+        return _CallPlan(self, models)
+
+    @staticmethod
+    def _with_timeout(config, timeout):
+        # The SDK takes milliseconds; abandoned attempts then stop on their own
+        options = types.HttpOptions(timeout=max(1, int(timeout * 1000)))
+        if config is None:
+            return types.GenerateContentConfig(http_options=options)
+        return config.model_copy(update={'http_options': options})
+
+    # --- Synchronous ---
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix='llm')
+            return self._pool
+
+    def _first_success(self, futures, timeout):
+        start = self.clock()
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = timeout - (self.clock() - start)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error if error is not None and not pending else TimeoutError(f"LLM attempt exceeded {timeout:.1f}s")
+
+    def _attempt(self, model, contents, config, timeout):
+        def call():
+            return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+        pool = self._executor()
+        futures = [pool.submit(traced(call))]
+        hedge_after = self._hedge_after(model, timeout)
+        if hedge_after is not None:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                self._count_hedge(model)
+                futures.append(pool.submit(traced(call)))
+                return self._first_success(futures, timeout - hedge_after)
+        return self._first_success(futures, timeout)
+
+    def generate(self, models, contents, config_for, before_attempt=None):
+        """generate_content() on the first model that answers within the deadline.
+
+        before_attempt(model), if given, runs ahead of every attempt, e.g. to
+        take a rate-limiter token.
+        """
+        with self._start_call(models) as plan:
+            while True:
+                model, timeout, delay = plan.next_attempt()
+                if delay:
+                    self.sleep(delay)
+                if before_attempt is not None:
+                    before_attempt(model)
+                start = self.clock()
+                try:
+                    response = self._attempt(model, contents, self._with_timeout(config_for(model), timeout), timeout)
+                except Exception as e:
+                    plan.failed(model, e)
+                    continue
+                plan.succeeded(model, self.clock() - start)
+                metrics.record_usage(model, response)
+                return response
+
+    def stream(self, models, contents, config_for):
+        """generate_content_stream() with retries and fallback until the first chunk."""
+        with self._start_call(models) as plan:
+            while True:
+                model, timeout, delay = plan.next_attempt()
+                if delay:
+                    self.sleep(delay)
+                start = self.clock()
+                config = self._with_timeout(config_for(model), timeout)
+                try:
+                    chunks = iter(self.client.models.generate_content_stream(
+                        model=model, contents=contents, config=config))
+                    first = self._first_success([self._executor().submit(traced(next), chunks, None)], timeout)
+                except Exception as e:
+                    plan.failed(model, e)
+                    continue
+                plan.succeeded(model, self.clock() - start)
+                yield from self._relay(model, first, chunks)
+                return
+
+    @staticmethod
+    def _relay(model, first, chunks):
+        last = first
+        try:
+            if first is None:
+                return
+            yield first
+            for last in chunks:
+                yield last
+        finally:
+            # Streams report cumulative usage; the last chunk seen holds the total so far
+            metrics.record_usage(model, last)
+
+    # --- asyncio ---
+
+    async def _first_success_async(self, tasks, timeout):
+        pending = set(tasks)
+        error = None
+        try:
+            loop = asyncio.get_running_loop()
+            end = loop.time() + timeout
+            while pending:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error if error is not None and not pending else TimeoutError(
+                f"LLM attempt exceeded {timeout:.1f}s")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _attempt_async(self, model, contents, config, timeout):
+        def call():
+            return asyncio.ensure_future(
+                self.client.aio.models.generate_content(model=model, contents=contents, config=config))
+
+        tasks = [call()]
+        hedge_after = self._hedge_after(model, timeout)
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self._count_hedge(model)
+                tasks.append(call())
+                return await self._first_success_async(tasks, timeout - hedge_after)
+        return await self._first_success_async(tasks, timeout)
+
+    @staticmethod
+    async def _config_async(config_for, model):
+        # On the event loop config_for may be a coroutine function, so that
+        # building a config can leave the loop
+        config = config_for(model)
+        return await config if inspect.isawaitable(config) else config
+
+    async def generate_async(self, models, contents, config_for):
+        """Async twin of generate()."""
+        with self._start_call(models) as plan:
+            while True:
+                model, timeout, delay = plan.next_attempt()
+                if delay:
+                    await asyncio.sleep(delay)
+                start = self.clock()
+                try:
+                    config = self._with_timeout(await self._config_async(config_for, model), timeout)
+                    response = await self._attempt_async(model, contents, config, timeout)
+                except Exception as e:
+                    plan.failed(model, e)
+                    continue
+                plan.succeeded(model, self.clock() - start)
+                metrics.record_usage(model, response)
+                return response
+
+    async def stream_async(self, models, contents, config_for):
+        """Async twin of stream()."""
+        with self._start_call(models) as plan:
+            while True:
+                model, timeout, delay = plan.next_attempt()
+                if delay:
+                    await asyncio.sleep(delay)
+                start = self.clock()
+                config = self._with_timeout(await self._config_async(config_for, model), timeout)
+                chunks = None
+                try:
+                    async def open_stream():
+                        nonlocal chunks
+                        chunks = aiter(await self.client.aio.models.generate_content_stream(
+                            model=model, contents=contents, config=config))
+                        return await anext(chunks, None)
+
+                    first = await asyncio.wait_for(open_stream(), timeout)
+                except Exception as e:
+                    plan.failed(model, e)
+                    continue
+                plan.succeeded(model, self.clock() - start)
+                last = first
+                try:
+                    if first is None:
+                        return
+                    yield first
+                    async for last in chunks:
+                        yield last
+                finally:
+                    metrics.record_usage(model, last)
+                return
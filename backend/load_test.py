@@ -0,0 +1,187 @@
+"""Load-test harness: drives a local server against a fake Gemini backend.
+
+Starts fake_llm.FakeGeminiServer in-process, launches the chosen server
+(the ASGI app or the Flask app) as a subprocess pointed at it through
+GEMINI_BASE_URL, then fires concurrent requests and reports throughput and
+latency percentiles. No API key or network access is needed.
+
+    python load_test.py --server asgi --requests 500 --concurrency 200
+    python load_test.py --server flask --requests 500 --concurrency 200
+
+Rate limiting and admission control are off unless asked for, so the
+numbers measure serving capacity. To exercise overload behaviour instead:
+
+    python load_test.py --max-in-flight 50 --concurrency 300 --requests 1000
+    python load_test.py --rate-limit 1 --burst 5 --clients 10 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from fake_llm import FakeGeminiServer
+
+SERVER_COMMANDS = {
+    'asgi': [sys.executable, 'async_agent.py'],
+    'flask': [sys.executable, '-c',
+              'import os, agent; agent.warm_up(); agent.app.run(port=int(os.environ["ASGI_PORT"]), threaded=True)'],
+    'prefork': [sys.executable, 'serve.py'],
+    'prefork-wsgi': [sys.executable, 'serve.py', '--app', 'wsgi'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(port, timeout=60.0):
+    """Waits for GET /ready to answer 200, i.e. for the archive and indexes to be loaded."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/ready', timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"Server on port {port} never reported ready")
+
+
+def start_server(kind, port, base_url, workers, rate_limit=0.0, burst=10, max_in_flight=0, wait=True):
+    env = dict(os.environ,
+               GEMINI_API_KEY='load-test-key',
+               GEMINI_BASE_URL=base_url,
+               ASGI_PORT=str(port),
+               ASGI_WORKERS=str(workers),
+               SERVE_PORT=str(port),
+               SERVE_WORKERS=str(workers),
+               # Every request must reach the fake model, not the answer cache
+               RESPONSE_CACHE_SIZE='0',
+               RATE_LIMIT_RPS=str(rate_limit),
+               RATE_LIMIT_BURST=str(burst),
+               MAX_IN_FLIGHT=str(max_in_flight))
+    proc = subprocess.Popen(SERVER_COMMANDS[kind], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if wait:
+        wait_until_ready(port)
+    return proc
+
+
+async def post(port, path, payload, api_key=None):
+    """One HTTP/1.1 POST on a fresh connection; returns (status, seconds).
+
+    A 429 without a Retry-After header is reported as status 0, an error.
+    """
+    body = json.dumps(payload).encode('utf-8')
+    key_header = f"X-API-Key: {api_key}\r\n" if api_key else ""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n{key_header}"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head = response.split(b'\r\n\r\n', 1)[0].decode('latin-1').lower()
+    status = int(head.split()[1])
+    if status == 429 and '\r\nretry-after:' not in head:
+        status = 0
+    return status, time.perf_counter() - start
+
+
+async def run_load(port, endpoint, total, concurrency, identical=False, clients=0):
+    path = f"/api/{endpoint}"
+    field = 'user_query' if endpoint == 'seance' else 'query'
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            try:
+                # Distinct questions unless we are measuring request coalescing
+                suffix = '' if identical else f" {i}"
+                # Round-robin over API keys so each counts as its own client
+                api_key = f"load-test-{i % clients}" if clients else None
+                return await post(port, path, {field: f"What does the modem say about gopher{suffix}?"}, api_key)
+            except OSError:
+                return 0, 0.0
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(total)))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    """Throughput, latency percentiles (successful requests only), 429s and other errors."""
+    latencies = sorted(seconds * 1000 for status, seconds in results if status == 200)
+    summary = {
+        "requests": len(results),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 1),
+        "p50_ms": None,
+        "p99_ms": None,
+        "rejected": sum(1 for status, _ in results if status == 429),
+        "errors": sum(1 for status, _ in results if status not in (200, 429)),
+    }
+    if latencies:
+        summary["p50_ms"] = round(statistics.median(latencies), 1)
+        summary["p99_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 1)
+    return summary
+
+
+def report(kind, results, elapsed, fake):
+    summary = summarize(results, elapsed)
+    print(f"\n--- {kind}: {len(results)} requests in {elapsed:.2f}s ---")
+    print(f"  Throughput: {summary['throughput_rps']:.1f} req/s")
+    if summary["p50_ms"] is not None:
+        print(f"  Latency:    p50={summary['p50_ms']:.1f} ms  p99={summary['p99_ms']:.1f} ms")
+    if summary["rejected"]:
+        print(f"  Rejected:   {summary['rejected']} (429 with Retry-After)")
+    print(f"  Errors:     {summary['errors']}")
+    print(f"  Upstream model calls: {fake.requests}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS), default='asgi')
+    parser.add_argument('--endpoint', choices=['seance', 'learn'], default='seance')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=0.5, help="fake model latency in seconds")
+    parser.add_argument('--workers', type=int, default=2, help="worker processes (asgi and prefork servers)")
+    parser.add_argument('--identical', action='store_true',
+                        help="send the same question every time to exercise request coalescing")
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help="per-client requests per second (RATE_LIMIT_RPS); 0 disables")
+    parser.add_argument('--burst', type=int, default=10, help="per-client burst (RATE_LIMIT_BURST)")
+    parser.add_argument('--max-in-flight', type=int, default=0,
+                        help="per-process concurrency cap (MAX_IN_FLIGHT); 0 disables")
+    parser.add_argument('--clients', type=int, default=0,
+                        help="spread requests over this many API keys; 0 sends all from one address")
+    args = parser.parse_args()
+
+    fake = FakeGeminiServer(delay_seconds=args.delay).start()
+    port = free_port()
+    proc = start_server(args.server, port, fake.base_url, args.workers,
+                        args.rate_limit, args.burst, args.max_in_flight)
+    try:
+        results, elapsed = asyncio.run(run_load(port, args.endpoint, args.requests, args.concurrency,
+                                                args.identical, args.clients))
+        report(args.server, results, elapsed, fake)
+    finally:
+        proc.terminate()
+        proc.wait()
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
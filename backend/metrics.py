@@ -0,0 +1,231 @@
+"""Request, stage and model-usage metrics in the Prometheus text format.
+
+A small dependency-free take on prometheus_client: counters and
+fixed-bucket histograms updated under a per-metric lock (about a
+microsecond per update), plus collectors that read existing counters such
+as the response cache's hit count only when /metrics is scraped.
+
+Stage timings for the current request are kept in a context variable, so
+code shared by the Flask and ASGI apps can time itself with
+`with metrics.stage('search'):` without being handed the request. Each
+worker process keeps its own numbers; scrape every worker or run one.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; spans sub-millisecond index lookups up to slow model calls
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All registered metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in self._items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then the sum
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def render(self):
+        lines = []
+        for labels, state in self._items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = (('le', _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Collector(_Metric):
+    """A counter or gauge whose values are read from elsewhere at scrape time.
+
+    Each source is a function returning {label values tuple: number}; values
+    from several sources are added together.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames=(), registry=REGISTRY):
+        self.kind = kind
+        self._sources = []
+        super().__init__(name, documentation, labelnames, registry)
+
+    def source(self, fn):
+        self._sources.append(fn)
+        return fn
+
+    def _items(self):
+        values = {}
+        for fn in self._sources:
+            for labels, value in fn().items():
+                values[labels] = values.get(labels, 0) + value
+        return sorted(values.items())
+
+
+# --- Pipeline metrics ---
+REQUEST_SECONDS = Histogram(
+    'gopher_request_duration_seconds',
+    'Time from request arrival until the response starts, by endpoint.', ['endpoint'])
+REQUESTS = Counter('gopher_requests_total', 'Requests served, by endpoint and status.', ['endpoint', 'status'])
+STAGE_SECONDS = Histogram('gopher_stage_duration_seconds', 'Time spent in each pipeline stage.', ['stage'])
+LLM_TOKENS = Counter('gopher_llm_tokens_total', 'Model tokens reported in usage metadata.', ['model', 'kind'])
+LLM_CALLS = Counter('gopher_llm_calls_total', 'Upstream model call attempts, by outcome.', ['model', 'outcome'])
+LLM_EVENTS = Counter('gopher_llm_events_total', 'Retries, hedges and fallbacks, by the model they went to.',
+                     ['model', 'event'])
+LLM_CIRCUIT_OPEN = Collector('gopher_llm_circuit_open', 'Whether calls to a model are being refused (1) or not.',
+                             'gauge', ['model'])
+INDEX_LOOKUPS = Counter(
+    'gopher_index_lookups_total', 'Keyword lookups per index and whether they found anything.',
+    ['index', 'result'])
+SEARCHES = Counter('gopher_searches_total', 'Archive searches, by mode and outcome.', ['mode', 'result'])
+REJECTIONS = Counter('gopher_rejected_requests_total', 'Requests turned away with 429, by reason.', ['reason'])
+COMPRESSION_BYTES = Counter('gopher_compression_bytes_total',
+                            'Response bytes into and out of compression, by encoding.', ['encoding', 'direction'])
+
+# usage_metadata attribute -> `kind` label
+USAGE_FIELDS = (
+    ('prompt', 'prompt_token_count'),
+    ('cached', 'cached_content_token_count'),
+    ('output', 'candidates_token_count'),
+    ('thoughts', 'thoughts_token_count'),
+)
+
+
+def record_usage(model, response):
+    """Counts the tokens a model response (or final stream chunk) reports."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    for kind, field in USAGE_FIELDS:
+        count = getattr(usage, field, None)
+        if count:
+            LLM_TOKENS.inc(model, kind, amount=count)
+
+
+# --- Per-request stage timing ---
+_current_request = ContextVar('gopher_request_timer', default=None)
+
+
+class RequestTimer:
+    """Collects the stage timings of one request for metrics and Server-Timing."""
+
+    __slots__ = ('start', 'stages', 'status')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []
+        self.status = None
+        _current_request.set(self)
+
+    def finish(self, endpoint, status=None):
+        status = status or self.status
+        REQUEST_SECONDS.observe(time.perf_counter() - self.start, endpoint)
+        REQUESTS.inc(endpoint, str(status))
+
+    def server_timing(self):
+        """Server-Timing header value: each stage so far plus the total, in milliseconds."""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ', '.join(parts)
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as one pipeline stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        timer = _current_request.get()
+        if timer is not None:
+            timer.stages.append((name, elapsed))
+
+
+def render():
+    return REGISTRY.render()
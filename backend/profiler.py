@@ -0,0 +1,203 @@
+"""Profiles of a live server process, as collapsed stacks.
+
+Two tools, both behind the authenticated /admin/profile endpoints:
+
+- sample() looks at every thread's Python stack every few milliseconds for
+  a number of seconds. It never hooks function calls, so the process runs
+  at full speed while it is being watched; weights are sample counts.
+- RequestTracer traces the next K requests to chosen paths with
+  sys.setprofile(), recording every Python and C call they make and the
+  microseconds spent in each. It is exact but slows the traced requests
+  down, which is why it is limited to a count of them. Model calls that the
+  gateway runs on its thread pool are followed there (see traced()).
+
+Both return text in the collapsed format ("outer;inner;leaf weight" per
+line) read by flamegraph.pl, speedscope and inferno.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+# Longest sampling run one request may ask for
+PROFILE_MAX_SECONDS = 60
+DEFAULT_INTERVAL = 0.005
+# Requests one tracing run may capture
+TRACE_MAX_REQUESTS = 100
+# Stack leaves of threads waiting for work (a server's accept loop or event
+# loop, an idle pool thread), dropped unless asked for. A request waiting on
+# the model is not idle: its time is the latency being looked for.
+IDLE_LEAVES = frozenset({'selectors.py:select', 'thread.py:_worker'})
+# Stack of the root of a traced model call on the gateway's thread pool
+POOL_THREAD_ROOT = '[llm thread]'
+
+_labels = {}
+_current_trace = ContextVar('profiler_trace', default=None)
+
+
+def code_label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return label
+
+
+def builtin_label(function):
+    module = getattr(function, '__module__', None) or 'builtins'
+    return f"{module}:{getattr(function, '__qualname__', repr(function))}"
+
+
+def collapse(stacks):
+    """Collapsed-stack text for a Counter of {(outer, ..., leaf): weight}, heaviest first."""
+    lines = [f"{';'.join(stack)} {round(weight)}" for stack, weight in stacks.most_common() if round(weight) > 0]
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def sample(seconds, interval=DEFAULT_INTERVAL, idle=False, clock=time.monotonic, sleep=time.sleep):
+    """Samples every other thread's stack every `interval` for `seconds`.
+
+    Returns a Counter of stacks to sample counts. Threads that are only
+    waiting (see IDLE_LEAVES) are left out unless `idle` is true.
+    """
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = clock() + min(seconds, PROFILE_MAX_SECONDS)
+    while clock() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(code_label(frame.f_code))
+                frame = frame.f_back
+            if idle or stack[0] not in IDLE_LEAVES:
+                stacks[tuple(reversed(stack))] += 1
+        sleep(interval)
+    return stacks
+
+
+class _ThreadTrace:
+    """The sys.setprofile() hook for one thread: self time per call stack."""
+
+    def __init__(self, root=()):
+        self.stack = list(root)
+        self.root = len(self.stack)
+        self.times = Counter()
+        self.last = time.perf_counter()
+
+    def _charge(self, now):
+        self.times[tuple(self.stack) or ('[request]',)] += now - self.last
+        self.last = now
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call':
+            self._charge(now)
+            self.stack.append(code_label(frame.f_code))
+        elif event == 'c_call':
+            self._charge(now)
+            self.stack.append(builtin_label(arg))
+        elif event in ('return', 'c_return', 'c_exception'):
+            self._charge(now)
+            # Frames entered before tracing began return without having been pushed
+            if len(self.stack) > self.root:
+                self.stack.pop()
+
+
+class _RequestTrace:
+    """Everything recorded for one traced request, across the threads it used."""
+
+    def __init__(self, hook):
+        self.hook = hook
+        self.times = Counter()
+        self.open = True
+        self._lock = threading.Lock()
+
+    def add(self, times):
+        with self._lock:
+            if self.open:
+                self.times.update(times)
+
+    def close(self):
+        """Adds the request thread's own times; pool threads still running are not waited for."""
+        with self._lock:
+            self.times.update(self.hook.times)
+            self.open = False
+        return self.times
+
+
+class RequestTracer:
+    """Traces the next `count` requests whose path is in `paths`.
+
+    arm() starts a run; start() and finish() bracket each request, on the
+    thread that serves it; profile() returns what has been captured so far.
+    """
+
+    def __init__(self):
+        self.paths = frozenset()
+        self.remaining = 0
+        self.captured = 0
+        self._times = Counter()
+        self._lock = threading.Lock()
+
+    def arm(self, count, paths):
+        with self._lock:
+            self.paths = frozenset(paths)
+            self.remaining = max(0, min(count, TRACE_MAX_REQUESTS))
+            self.captured = 0
+            self._times = Counter()
+
+    def start(self, path):
+        """Begins tracing the calling thread if this request is one to capture; returns the trace or None."""
+        if self.remaining <= 0:
+            return None
+        with self._lock:
+            if self.remaining <= 0 or path not in self.paths:
+                return None
+            self.remaining -= 1
+        trace = _RequestTrace(_ThreadTrace())
+        _current_trace.set(trace)
+        sys.setprofile(trace.hook)
+        return trace
+
+    def finish(self, trace):
+        """Stops tracing; must run on the thread start() ran on."""
+        sys.setprofile(None)
+        _current_trace.set(None)
+        times = trace.close()
+        with self._lock:
+            self._times.update(times)
+            self.captured += 1
+
+    def profile(self):
+        with self._lock:
+            return collapse(Counter({stack: seconds * 1_000_000 for stack, seconds in self._times.items()}))
+
+    def stats(self):
+        with self._lock:
+            return {"captured": self.captured, "remaining": self.remaining, "paths": sorted(self.paths)}
+
+
+def traced(fn):
+    """fn, made to carry the calling request's trace to the thread that runs it.
+
+    Without an active trace fn is returned unchanged, so wrapping costs
+    nothing outside a tracing run.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return fn
+
+    def run(*args, **kwargs):
+        hook = _ThreadTrace(root=(POOL_THREAD_ROOT,))
+        sys.setprofile(hook)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sys.setprofile(None)
+            trace.add(hook.times)
+
+    return run
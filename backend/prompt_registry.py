@@ -0,0 +1,188 @@
+"""Steering documents and prepared model configs for each endpoint.
+
+SteeringDocument reads a prompt file once and re-reads it only after its
+mtime changes. PromptRegistry keeps one prebuilt GenerateContentConfig per
+endpoint and model, rebuilding it only when the system instruction changes.
+Each endpoint lists its models in order of preference; configs for the
+fallback models are prepared the first time a call falls back to them.
+
+With context caching on, a system instruction big enough for the provider
+to cache is uploaded once with client.caches.create() and requests point at
+it through `cached_content` instead of resending it, so the persona is not
+billed or processed as fresh input on every call. Anything that goes wrong
+with the cache falls back to sending the instruction inline.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+from google.genai import types
+
+STEERING_DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.kiro', 'steering_docs')
+# How often a steering document's mtime is checked
+PROMPT_CHECK_INTERVAL = 1.0
+CONTEXT_CACHE_TTL = 3600
+# Provider caches are replaced this many seconds before they expire
+CONTEXT_CACHE_REFRESH_MARGIN = 300
+# The provider will not cache less than this; estimated at 4 characters a token
+CONTEXT_CACHE_MIN_TOKENS = 1024
+
+
+class SteeringDocument:
+    """A prompt file read once and re-read only after it changes on disk."""
+
+    def __init__(self, path, fallback, check_interval=PROMPT_CHECK_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.fallback = fallback
+        self.check_interval = check_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._text = None
+        self._mtime = None
+        self._checked = None
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read(self, mtime):
+        if mtime is None:
+            return self.fallback
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return self.fallback
+
+    def get(self):
+        now = self.clock()
+        if self._text is not None and now - self._checked < self.check_interval:
+            return self._text
+        with self._lock:
+            if self._text is None or now - self._checked >= self.check_interval:
+                mtime = self._current_mtime()
+                if self._text is None or mtime != self._mtime:
+                    self._text = self._read(mtime)
+                    self._mtime = mtime
+                self._checked = now
+            return self._text
+
+
+class _Prepared:
+    __slots__ = ('instruction', 'config', 'cache_name', 'refresh_at')
+
+    def __init__(self, instruction, config, cache_name=None, refresh_at=None):
+        self.instruction = instruction
+        self.config = config
+        self.cache_name = cache_name
+        self.refresh_at = refresh_at
+
+
+class PromptRegistry:
+    """Prebuilt GenerateContentConfig objects per endpoint, rebuilt when their instruction changes.
+
+    The system instruction of an entry may be a string or anything with a
+    get() method returning one, such as a SteeringDocument.
+    """
+
+    def __init__(self, client=None, context_cache=False, cache_ttl=CONTEXT_CACHE_TTL, clock=time.time):
+        self.client = client
+        self.context_cache = context_cache and client is not None
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._prepared = {}
+
+    def register(self, name, model, system_instruction=None, fallback_models=(), **options):
+        """Declares an endpoint's models, system instruction and GenerateContentConfig options."""
+        with self._lock:
+            self._entries[name] = ((model,) + tuple(fallback_models), system_instruction, options)
+            for key in [key for key in self._prepared if key[0] == name]:
+                del self._prepared[key]
+
+    def model(self, name):
+        return self._entries[name][0][0]
+
+    def models(self, name):
+        """The endpoint's models, preferred first."""
+        return self._entries[name][0]
+
+    def instruction(self, name):
+        source = self._entries[name][1]
+        return source.get() if hasattr(source, 'get') else source
+
+    def config(self, name, model=None):
+        """The prepared config for an endpoint and model, rebuilt only if its instruction or provider cache went stale.
+
+        Configs are per model because a provider cache only serves the model
+        it was created for.
+        """
+        key = (name, model or self.model(name))
+        instruction = self.instruction(name)
+        prepared = self._prepared.get(key)
+        if prepared is None or not self._fresh(prepared, instruction):
+            with self._lock:
+                prepared = self._prepared.get(key)
+                if prepared is None or not self._fresh(prepared, instruction):
+                    prepared = self._prepare(key, instruction, prepared)
+                    self._prepared[key] = prepared
+        return prepared.config
+
+    async def config_async(self, name, model=None):
+        """config() for the event loop: a config that has to be (re)built, which
+        can mean a blocking caches.create() call, is prepared in a worker thread.
+        """
+        prepared = self._prepared.get((name, model or self.model(name)))
+        if prepared is not None and self._fresh(prepared, self.instruction(name)):
+            return prepared.config
+        return await asyncio.to_thread(self.config, name, model)
+
+    def warm(self):
+        """Prepares every endpoint's preferred config ahead of the first request."""
+        for name in list(self._entries):
+            self.config(name)
+
+    def _fresh(self, prepared, instruction):
+        return prepared.instruction == instruction and (
+            prepared.refresh_at is None or self.clock() < prepared.refresh_at)
+
+    def _prepare(self, key, instruction, previous):
+        name, model = key
+        options = self._entries[name][2]
+        cached = self._create_cache(name, model, instruction)
+        if previous is not None and previous.cache_name:
+            self._delete_cache(previous.cache_name)
+        if cached is None:
+            config = types.GenerateContentConfig(system_instruction=instruction, **options)
+            return _Prepared(instruction, config)
+
+        config = types.GenerateContentConfig(cached_content=cached.name, **options)
+        expires = cached.expire_time.timestamp() if cached.expire_time else self.clock() + self.cache_ttl
+        return _Prepared(instruction, config, cached.name, expires - CONTEXT_CACHE_REFRESH_MARGIN)
+
+    def _create_cache(self, name, model, instruction):
+        if not self.context_cache or not instruction or len(instruction) // 4 < CONTEXT_CACHE_MIN_TOKENS:
+            return None
+        try:
+            return self.client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=instruction,
+                    display_name=f"gopher-{name}",
+                    ttl=f"{self.cache_ttl}s"))
+        except Exception as e:
+            # Caching is an optimization; the instruction is sent inline instead
+            print(f"Context cache unavailable for '{name}', sending the prompt inline: {e}")
+            return None
+
+    def _delete_cache(self, cache_name):
+        try:
+            self.client.caches.delete(name=cache_name)
+        except Exception:
+            # It expires on its own
+            pass
@@ -0,0 +1,198 @@
+"""Per-client rate limiting and admission control for the API endpoints.
+
+Every seance costs a paid model call and a worker slot, so one noisy client
+could otherwise starve everyone else. ClientRateLimiter gives each client
+(its API key, else its IP address) a token bucket of its own; a request
+finding its bucket empty is answered with 429 and the seconds until a token
+is back.
+
+Buckets live in process memory by default. SQLiteBucketStore keeps them in
+a file shared by every worker process on the host, standing in for Redis;
+any object with the same take(key, rate, burst) method can be plugged in.
+
+AdmissionControl caps how many requests a process works on at once. Past
+the cap a request is turned away with 429 and a Retry-After estimate rather
+than queueing behind the others, so admitted requests keep their latency.
+"""
+
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from token_bucket import TokenBucket
+
+# Least recently seen clients beyond this are forgotten (their bucket restarts full)
+MAX_TRACKED_CLIENTS = 10_000
+# The shared store drops buckets that have refilled every this many takes
+PRUNE_EVERY = 1000
+# Weight of the newest request in the running average behind Retry-After
+LATENCY_SMOOTHING = 0.1
+
+
+def client_key(api_key, forwarded_for, remote_addr, trust_proxy=False):
+    """The identity a request is rate limited under.
+
+    X-Forwarded-For is honoured only behind a trusted proxy, since clients
+    can set it to anything. API keys are hashed so they are not kept in
+    memory or on disk.
+    """
+    if api_key:
+        return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:32]
+    if trust_proxy and forwarded_for:
+        return 'ip:' + forwarded_for.split(',')[0].strip()
+    return 'ip:' + (remote_addr or 'unknown')
+
+
+def retry_after_header(seconds):
+    """Retry-After value: whole seconds, at least 1."""
+    return str(max(1, math.ceil(seconds)))
+
+
+class MemoryBucketStore:
+    """One TokenBucket per client in this process, least recently seen evicted first."""
+
+    on_disk = False
+
+    def __init__(self, max_clients=MAX_TRACKED_CLIENTS, clock=time.monotonic):
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Takes a token from the client's bucket; returns 0.0, or the seconds until one is available."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst, clock=self.clock)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+        return bucket.try_acquire(1)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file, shared by every process that opens it.
+
+    Each take() is one IMMEDIATE transaction, so concurrent workers never
+    both spend the same token. Wall-clock time is used because the file
+    outlives any one process.
+    """
+
+    # take() can wait up to the 5 s busy timeout for another process's transaction
+    on_disk = True
+
+    def __init__(self, path, clock=time.time):
+        self.clock = clock
+        self._takes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limits '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def take(self, key, rate, burst):
+        now = self.clock()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute(
+                    'SELECT tokens, updated FROM rate_limits WHERE key = ?', (key,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - tokens) / rate
+                self._db.execute(
+                    'INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)',
+                    (key, tokens, now))
+                self._takes += 1
+                if self._takes % PRUNE_EVERY == 0:
+                    # A bucket idle long enough to refill is the same as no bucket
+                    self._db.execute('DELETE FROM rate_limits WHERE updated < ?', (now - burst / rate,))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return wait
+
+
+class ClientRateLimiter:
+    """`rate` requests per second per client, with bursts of up to `burst`; a rate of 0 disables it."""
+
+    def __init__(self, rate, burst, store=None):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.store = store if store is not None else MemoryBucketStore()
+
+    @property
+    def on_disk(self):
+        """Whether check() goes to a shared store and may block."""
+        return self.rate > 0 and self.store.on_disk
+
+    def check(self, key):
+        """0.0 if the client may proceed, else the seconds until it may."""
+        if self.rate <= 0:
+            return 0.0
+        try:
+            return self.store.take(key, self.rate, self.burst)
+        except sqlite3.Error as e:
+            # A broken shared store must not take the endpoints down with it
+            print(f"Rate limit store unavailable, admitting request: {e}")
+            return 0.0
+
+
+class AdmissionControl:
+    """Caps the requests in progress at `max_in_flight`; 0 means no cap.
+
+    try_enter() returns a ticket to hand back to leave(), or to cancel() for
+    a request turned away after all, or None when the process is full.
+    retry_after() estimates when a slot frees up from the running average of
+    how long admitted requests take.
+    """
+
+    def __init__(self, max_in_flight, clock=time.monotonic):
+        self.max_in_flight = max_in_flight
+        self.clock = clock
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._average_seconds = 1.0
+        self._lock = threading.Lock()
+
+    def try_enter(self):
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return None
+            self.in_flight += 1
+            self.admitted += 1
+        return self.clock()
+
+    def leave(self, ticket):
+        elapsed = self.clock() - ticket
+        with self._lock:
+            self.in_flight -= 1
+            self._average_seconds += LATENCY_SMOOTHING * (elapsed - self._average_seconds)
+
+    def cancel(self, ticket):
+        """Hands back a slot without counting the request as admitted or timing it."""
+        with self._lock:
+            self.in_flight -= 1
+            self.admitted -= 1
+
+    def retry_after(self):
+        return self._average_seconds
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "admitted": self.admitted, "rejected": self.rejected}
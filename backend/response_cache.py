@@ -0,0 +1,92 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(user_query):
+    """Folds case and whitespace so trivially different phrasings share an entry."""
+    return ' '.join(user_query.lower().split())
+
+
+def make_cache_key(user_query, context, model, temperature):
+    """Hashes everything that shapes an LLM answer into a fixed-size key."""
+    raw = '\x1f'.join([normalize_query(user_query), context or '', model, repr(temperature)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU cache with a TTL for generated LLM responses.
+
+    When `db_path` is given, entries are also written to a SQLite file so
+    warm answers survive a restart; the in-memory LRU stays the first stop.
+    `on_disk` tells callers on an event loop that get() and set() can block.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, db_path=None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.on_disk = bool(db_path)
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+            self._db.commit()
+
+    def _read_disk(self, key, now):
+        row = self._db.execute(
+            'SELECT value, expires FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._db.commit()
+            return None
+        return row
+
+    def _remember(self, key, value, expires):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached value for key, or None if absent or expired."""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                entry = self._read_disk(key, now)
+                if entry is not None:
+                    self._remember(key, *entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        expires = self.clock() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)',
+                    (key, value, expires))
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -1,30 +1,74 @@
 import json
 import os
+import random
+import threading
 import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 from typing import List, Dict
+from llm_gateway import LLMGateway
+from semantic_index import refresh_semantic_index
+from token_bucket import TokenBucket
+from archive_format import ARCHIVE_PATH, LEGACY_ARCHIVE_PATH, ensure_jsonl_archive, iter_archive, write_archive
+from archive_merge import ArchiveIndex, merge_entries
+from archive_snapshot import refresh_snapshot
 
 # Load environment variables from the .env file in the project root
 load_dotenv()
 
 # --- CONFIGURATION ---
 WORDLIST_FILE = 'wordlist.txt'
-OUTPUT_FILE = 'gopher_archive.json'
+OUTPUT_FILE = ARCHIVE_PATH
+LEGACY_OUTPUT_FILE = LEGACY_ARCHIVE_PATH
+# Every finished batch is appended here, so a rerun skips words already done
+CHECKPOINT_FILE = 'semantic_checkpoint.jsonl'
 MODEL_NAME = 'gemini-2.5-flash'
+# Takes over a batch when MODEL_NAME fails or its circuit is open
+FALLBACK_MODEL_NAME = 'gemini-2.0-flash'
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# TIME DELAY (Crucial for RPM compliance)
-THROTTLE_DELAY_SECONDS = 7  # Ensures max ~10 requests per minute (60s/6s)
+# RATE LIMITS (Crucial for quota compliance)
+REQUESTS_PER_MINUTE = int(os.getenv("GENERATOR_RPM", "10"))
+TOKENS_PER_MINUTE = int(os.getenv("GENERATOR_TPM", "250000"))
+MAX_WORKERS = int(os.getenv("GENERATOR_WORKERS", "4"))
 MAX_WORDS_TO_PROCESS = 6000
-BATCH_SIZE = 100  # Safe, low batch size
+# Words per request; BatchSizer picks a size in this range from the token
+# budgets and the responses so far
+MIN_BATCH_SIZE = 5
+MAX_BATCH_SIZE = int(os.getenv("GENERATOR_MAX_BATCH", "250"))
+# Words added to the size after each response that was not cut off
+BATCH_GROWTH = 25
+# Response token limit (thinking included); batches are sized to use this
+# fraction of it, so a wordier than usual answer still fits
+OUTPUT_TOKEN_BUDGET = int(os.getenv("GENERATOR_OUTPUT_TOKENS", "16384"))
+OUTPUT_HEADROOM = 0.75
+# Weight of the latest response in the running output-tokens-per-word figure
+USAGE_SMOOTHING = 0.3
+# Words the model drops, renames or answers unusably are asked again, in
+# requests of their own once the fresh words are used up, up to
+# MAX_WORD_REQUESTS times in all
+MICRO_BATCH_SIZE = 50
+MAX_WORD_REQUESTS = 3
 
-if not GEMINI_API_KEY:
-    print("ERROR: GEMINI_API_KEY not found. Cannot run generator.")
-    exit()
+# RETRIES for failed batches, with jittered exponential backoff
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+# A 100-word batch runs to thousands of output tokens; each attempt tries
+# each model once and the backoff above spaces out the attempts
+ATTEMPT_TIMEOUT_SECONDS = 120
+ATTEMPT_DEADLINE_SECONDS = 300
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+# Rough token cost per request, used to pace against TOKENS_PER_MINUTE until
+# responses report their real usage
+PROMPT_TOKENS_PER_WORD = 3
+OUTPUT_TOKENS_PER_WORD = 30
+BASE_TOKENS_PER_REQUEST = 300
+# The shortest cipher worth archiving
+MIN_CIPHER_LENGTH = 6
 
 # --- INSTRUCTION FOR THE AI ---
 SYSTEM_INSTRUCTION = """
@@ -41,43 +85,314 @@ For each word provided, you must return an object with the following structure:
 """
 
 
-def generate_ciphers_for_batch(batch_words: List[str]) -> List[Dict]:
-    """Sends a batch of words to the LLM for structured cipher generation."""
+def make_client():
+    if not GEMINI_API_KEY:
+        print("ERROR: GEMINI_API_KEY not found. Cannot run generator.")
+        exit()
+    return genai.Client(api_key=GEMINI_API_KEY)
+
+
+# Built once and shared by every batch and both models
+CIPHER_CONFIG = types.GenerateContentConfig(
+    system_instruction=SYSTEM_INSTRUCTION,
+    temperature=0.9,
+    max_output_tokens=OUTPUT_TOKEN_BUDGET,
+    response_mime_type="application/json",
+    # --- CORRECTED JSON SCHEMA FOR ARRAY OF OBJECTS ---
+    response_schema={
+        "type": "array",
+        "items": {  # <-- CRITICAL FIX: Defines the structure of each item in the array
+            "type": "object",
+            "properties": {
+                "word": {"type": "string"},
+                "cipher": {"type": "string"},
+                "is_valid": {"type": "boolean"}
+            },
+            "required": ["word", "cipher", "is_valid"]
+        }
+    }
+)
+
+
+class BatchSizer:
+    """Chooses how many words the next request carries.
+
+    A batch is as large as both budgets allow: its answer has to fit in
+    OUTPUT_HEADROOM of the response token limit, and the whole request in
+    its share of the minute's tokens (TOKENS_PER_MINUTE over
+    REQUESTS_PER_MINUTE), so neither quota runs out while the other is left
+    unused. Output tokens per word start at the OUTPUT_TOKENS_PER_WORD guess
+    and follow the usage responses report; a response cut off at the token
+    limit shows the real limit, which replaces the configured one. On top
+    of that sits a ceiling: a cut-off response drops it to what fit in that
+    response, with headroom, and every complete response raises it by
+    BATCH_GROWTH.
+    """
+
+    def __init__(self, size=MAX_BATCH_SIZE, output_budget=OUTPUT_TOKEN_BUDGET,
+                 request_budget=TOKENS_PER_MINUTE / REQUESTS_PER_MINUTE):
+        self.ceiling = size
+        self.output_budget = output_budget
+        self.request_budget = request_budget
+        self.output_per_word = OUTPUT_TOKENS_PER_WORD
+        self.truncations = 0
+        self._lock = threading.Lock()
+
+    def estimate(self, words):
+        """Tokens a request for `words` words is expected to use, for the token bucket."""
+        return round(BASE_TOKENS_PER_REQUEST + words * (PROMPT_TOKENS_PER_WORD + self.output_per_word))
+
+    def size(self):
+        with self._lock:
+            by_output = self.output_budget * OUTPUT_HEADROOM / self.output_per_word
+            by_quota = (self.request_budget - BASE_TOKENS_PER_REQUEST) / (PROMPT_TOKENS_PER_WORD + self.output_per_word)
+            return int(max(MIN_BATCH_SIZE, min(self.ceiling, MAX_BATCH_SIZE, by_output, by_quota)))
+
+    def observe(self, words, result):
+        """Learns from the result of a request for `words` words."""
+        with self._lock:
+            returned = len(result['items'])
+            if returned and result['output_tokens']:
+                per_word = result['output_tokens'] / returned
+                self.output_per_word += USAGE_SMOOTHING * (per_word - self.output_per_word)
+            if result['truncated']:
+                self.truncations += 1
+                if result['output_tokens']:
+                    self.output_budget = min(self.output_budget, result['output_tokens'])
+                fitted = returned * OUTPUT_HEADROOM if returned else words / 2
+                self.ceiling = max(MIN_BATCH_SIZE, int(min(self.ceiling, fitted)))
+            else:
+                self.ceiling = min(MAX_BATCH_SIZE, self.ceiling + BATCH_GROWTH)
+
+
+class GenerationStats:
+    """API calls, tokens and entries of one run, for the efficiency report."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.entries = 0
+        self._lock = threading.Lock()
+
+    def count_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def count_usage(self, result):
+        with self._lock:
+            self.prompt_tokens += result['prompt_tokens']
+            self.output_tokens += result['output_tokens']
+
+    def rates(self):
+        """(entries per API call, entries per minute) so far."""
+        minutes = max(self.clock() - self.started, 1e-9) / 60
+        return self.entries / max(self.calls, 1), self.entries / minutes
+
+
+def make_gateway(client, sleep=time.sleep):
+    # No hedging: a duplicate batch would spend the quota twice
+    return LLMGateway(client, deadline=ATTEMPT_DEADLINE_SECONDS, attempt_timeout=ATTEMPT_TIMEOUT_SECONDS,
+                      max_attempts=1, hedge_percentile=0, sleep=sleep, max_concurrency=MAX_WORKERS * 2)
+
+
+def parse_items(text):
+    """The objects of a JSON array, and whether the array was cut off.
+
+    A response that hit the token limit ends mid-object; every object before
+    that point is still returned.
+    """
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    else:
+        if not isinstance(items, list):
+            raise ValueError("Model returned JSON that is not an array")
+        return items, False
+
+    start = text.find('[')
+    if start < 0:
+        raise ValueError("Model returned no JSON array")
+    decoder = json.JSONDecoder()
+    items = []
+    pos = start + 1
+    while True:
+        while pos < len(text) and text[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(text) or text[pos] == ']':
+            break
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break
+        items.append(item)
+    return items, True
+
+
+def finish_reason(response):
+    candidates = getattr(response, 'candidates', None)
+    return getattr(candidates[0], 'finish_reason', None) if candidates else None
+
+
+def generate_ciphers_for_batch(gateway, batch_words: List[str], before_attempt=None) -> Dict:
+    """Sends a batch of words to the LLM for structured cipher generation.
+
+    Returns {"items", "truncated", "prompt_tokens", "output_tokens"}; a
+    response cut off by the token limit yields the items it completed.
+    Raises on API errors or output with no JSON array so the caller can retry.
+    """
 
     prompt = f"Generate a unique cipher and validity flag for each of the following words:\n{', '.join(batch_words)}"
 
+    response = gateway.generate(
+        (MODEL_NAME, FALLBACK_MODEL_NAME), prompt, lambda model: CIPHER_CONFIG, before_attempt)
+
+    items, truncated = parse_items(response.text or '')
+    usage = getattr(response, 'usage_metadata', None)
+    answer_tokens = getattr(usage, 'candidates_token_count', None) or 0
+    # Thinking is spent from the same response token limit as the answer
+    thought_tokens = getattr(usage, 'thoughts_token_count', None) or 0
+    return {
+        "items": items,
+        "truncated": truncated or finish_reason(response) == types.FinishReason.MAX_TOKENS,
+        "prompt_tokens": getattr(usage, 'prompt_token_count', None) or 0,
+        "output_tokens": answer_tokens + thought_tokens,
+    }
+
+
+def process_batch(gateway, batch_words, request_bucket, token_bucket, sizer, stats, sleep=time.sleep):
+    """Generates one batch under the rate limits, retrying failures with backoff.
+
+    Returns the result of generate_ciphers_for_batch(), or None once every
+    attempt has failed.
+    """
+    def take_quota(model):
+        # Every request counts against the quota, fallbacks included
+        request_bucket.acquire(1)
+        token_bucket.acquire(sizer.estimate(len(batch_words)))
+        stats.count_call()
+
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return generate_ciphers_for_batch(gateway, batch_words, take_quota)
+        except Exception as e:
+            print(f"  [Error] Attempt {attempt + 1}/{MAX_ATTEMPTS} failed for batch starting '{batch_words[0]}': {e}")
+            if attempt + 1 < MAX_ATTEMPTS:
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+                sleep(delay * random.uniform(0.5, 1.5))
+    return None
+
+
+def usable(item):
+    """Whether a generated item settles its word: a real cipher, or the model's verdict that the word is invalid."""
+    if item.get('is_valid') is False:
+        return True
+    cipher = item.get('cipher')
+    return item.get('is_valid') is True and isinstance(cipher, str) and len(cipher.strip()) >= MIN_CIPHER_LENGTH
+
+
+def reconcile(batch_words, items, truncated=False):
+    """Matches generated items to the words that were asked for.
+
+    Returns (answered, missing, unreached): the first usable item for each
+    requested word, carrying the requested spelling; the requested words
+    that came back absent, renamed or without a usable cipher; and, for a
+    response cut off at the token limit, the words after the last one
+    answered, which the model never got to.
+    """
+    wanted = {word.strip().lower(): word for word in batch_words}
+    answered = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        key = str(item.get('word', '')).strip().lower()
+        if key in wanted and key not in answered and usable(item):
+            answered[key] = dict(item, word=wanted[key])
+    missing, unreached = [], []
+    for key, word in wanted.items():
+        if key in answered:
+            # Everything missing before an answered word was skipped, not cut off
+            missing += unreached
+            unreached = []
+        else:
+            unreached.append(word)
+    if not truncated or not answered:
+        # A cut-off response with no answer at all made no progress; its words count as missed
+        missing, unreached = missing + unreached, []
+    return list(answered.values()), missing, unreached
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """Returns {word: item} for every word a previous run already finished."""
+    done = {}
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_INSTRUCTION,
-                temperature=0.9,
-                response_mime_type="application/json",
-                # --- CORRECTED JSON SCHEMA FOR ARRAY OF OBJECTS ---
-                response_schema={
-                    "type": "array",
-                    "items": {  # <-- CRITICAL FIX: Defines the structure of each item in the array
-                        "type": "object",
-                        "properties": {
-                            "word": {"type": "string"},
-                            "cipher": {"type": "string"},
-                            "is_valid": {"type": "boolean"}
-                        },
-                        "required": ["word", "cipher", "is_valid"]
-                    }
-                }
-            )
-        )
-
-        return json.loads(response.text)
-
-    except Exception as e:
-        print(f"  [Error] API Error during batch generation: {e}")
-        return []
-
-
-def run_semantic_generator():
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write leaves at most one partial last line
+                    continue
+                for word in record['requested']:
+                    done[word] = None
+                for item in record['items']:
+                    done[item.get('word', '').strip().lower()] = item
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def append_checkpoint(f, settled_words, items):
+    # Only words that got an answer are recorded; missing ones stay pending for the next run
+    f.write(json.dumps({"requested": [w.lower() for w in settled_words], "items": items}) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def cipher_entries(items, archive_words):
+    """Turns valid generated items into archive entries (merge_entries assigns their IDs).
+
+    Words already in archive_words are skipped; new ones are added to it.
+    """
+    entries = []
+    for item in items:
+        # Check for 'is_valid' from the new LLM response and 'cipher'
+        # content
+        if item.get("is_valid") is True and item.get("cipher"):
+            word = item.get('word', '').strip()
+            cipher = item['cipher'].strip()
+
+            if len(cipher) >= MIN_CIPHER_LENGTH and len(word) > 1 and word.lower() not in archive_words:
+                archive_words.add(word.lower())
+                entries.append({
+                    "path": f"/menu/semantic/{word.lower()}",
+                    "content": cipher
+                })
+    return entries
+
+
+def scan_archive(path):
+    """Streams the archive once; returns (semantic words, ArchiveIndex, has /menu/word/ entries)."""
+    archive_words = set()
+    index = ArchiveIndex()
+    has_template_words = False
+    try:
+        for e in iter_archive(path):
+            if e['path'].startswith('/menu/semantic/'):
+                archive_words.add(e['path'][len('/menu/semantic/'):])
+            elif e['path'].startswith('/menu/word/'):
+                has_template_words = True
+            index.add(e)
+    except (FileNotFoundError, json.JSONDecodeError):
+        # If the file is missing or corrupted, we start with an empty archive
+        pass
+    return archive_words, index, has_template_words
+
+
+def run_semantic_generator(client=None, sleep=time.sleep):
     try:
         with open(WORDLIST_FILE, 'r', encoding='utf-8') as f:
             all_words = f.read().splitlines()
@@ -89,64 +404,117 @@ def run_semantic_generator():
     clean_words = [w.strip()
                    for w in all_words if w.strip()][:MAX_WORDS_TO_PROCESS]
 
-    print(
-        f"Starting semantic cipher generation for {len(clean_words)} words...")
+    # Entries are appended to the JSON Lines archive as batches finish,
+    # migrating the legacy JSON array on first use
+    ensure_jsonl_archive(OUTPUT_FILE, LEGACY_OUTPUT_FILE)
+    archive_words, index, has_template_words = scan_archive(OUTPUT_FILE)
+    if has_template_words:
+        # Filter out all template-generated words (those that used the old
+        # /menu/word/ path); a one-off rewrite, later runs only append
+        write_archive(OUTPUT_FILE, (
+            e for e in iter_archive(OUTPUT_FILE) if not e['path'].startswith('/menu/word/')))
+        # IDs keep counting past the removed entries', so none is ever reused
+        next_id = index.next_id
+        index = ArchiveIndex.scan(OUTPUT_FILE)
+        index.next_id = max(index.next_id, next_id)
 
-    # Load original 5 manually created entries first
-    try:
-        with open(OUTPUT_FILE, 'r') as f:
-            initial_entries = json.load(f)
-            # Filter out all template-generated words (those that used the old
-            # /menu/word/ path)
-            final_archive = [
-                e for e in initial_entries if not e['path'].startswith('/menu/word/')]
-    except (FileNotFoundError, json.JSONDecodeError):
-        # If the file is missing or corrupted, we start with an empty list
-        final_archive = []
+    # Skip words already in the archive or finished by an interrupted run,
+    # first recovering any checkpointed ciphers that never reached the archive
+    checkpoint = load_checkpoint(CHECKPOINT_FILE)
+    recovered = merge_entries(
+        OUTPUT_FILE, cipher_entries([item for item in checkpoint.values() if item], archive_words), index)
+    done_words = set(checkpoint) | archive_words
+    pending_words = []
+    for w in clean_words:
+        # A word listed twice would otherwise be asked for, and answered, twice
+        if w.lower() not in done_words:
+            done_words.add(w.lower())
+            pending_words.append(w)
 
-    start_id = 1000
-    successful_ciphers = 0
+    print(
+        f"Starting semantic cipher generation for {len(pending_words)} words "
+        f"({len(clean_words) - len(pending_words)} already done)...")
 
-    for i in range(0, len(clean_words), BATCH_SIZE):
-        batch = clean_words[i:i + BATCH_SIZE]
+    if pending_words and client is None:
+        client = make_client()
+    gateway = make_gateway(client, sleep)
 
-        processed_batch = generate_ciphers_for_batch(batch)
+    # Bursts are limited to one request per worker; the steady rate is the quota
+    request_bucket = TokenBucket(REQUESTS_PER_MINUTE / 60, MAX_WORKERS, sleep=sleep)
+    token_bucket = TokenBucket(TOKENS_PER_MINUTE / 60, TOKENS_PER_MINUTE / 60 * MAX_WORKERS, sleep=sleep)
+    sizer = BatchSizer()
+    stats = GenerationStats()
+    fresh, retry = deque(pending_words), deque()
+    requests_per_word = Counter()
+    failed_batches = 0
+    abandoned = []
+    settled = 0
+    created = recovered['inserted']
 
-        if not processed_batch:
-            print(f"Batch {i//BATCH_SIZE + 1} failed. Skipping...")
+    def next_batch():
+        # Words to ask again wait until the fresh ones are used up, so the
+        # full-size batches come first and the micro-batches are as few as possible
+        if retry and not fresh:
+            queue, size = retry, MICRO_BATCH_SIZE
         else:
-            for item in processed_batch:
-                # Check for 'is_valid' from the new LLM response and 'cipher'
-                # content
-                if item.get("is_valid") is True and item.get("cipher"):
-                    word = item.get('word', '').strip()
-                    cipher = item['cipher'].strip()
-
-                    if len(cipher) > 5 and len(word) > 1:
-                        final_archive.append({
-                            "id": start_id,
-                            "path": f"/menu/semantic/{word.lower()}",
-                            "content": cipher
-                        })
-                        start_id += 1
-                        successful_ciphers += 1
-
-            print(
-                f"  Processed {i + len(batch)}/{len(clean_words)}. Current good entries: {successful_ciphers}")
-
-        # --- THROTTLING MECHANISM (Ensures compliance with RPM limit) ---
-        if i + BATCH_SIZE < len(clean_words):
-            print(
-                f"  Waiting {THROTTLE_DELAY_SECONDS} seconds to comply with API rate limit...")
-            time.sleep(THROTTLE_DELAY_SECONDS)
-
-    # 4. Write the final, high-quality archive
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_archive, f, indent=2)
+            queue, size = fresh, sizer.size()
+        batch = [queue.popleft() for _ in range(min(size, len(queue)))]
+        requests_per_word.update(batch)
+        return batch
+
+    with open(CHECKPOINT_FILE, 'a', encoding='utf-8') as checkpoint_file, \
+            ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        # Batches are cut one at a time as workers free up, so each is sized
+        # by what the responses before it showed
+        in_flight = {}
+        while True:
+            while len(in_flight) < MAX_WORKERS and (fresh or retry):
+                batch = next_batch()
+                future = pool.submit(process_batch, gateway, batch, request_bucket, token_bucket, sizer, stats, sleep)
+                in_flight[future] = batch
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                result = future.result()
+                if result is None:
+                    failed_batches += 1
+                    print(f"  Batch starting '{batch[0]}' failed after {MAX_ATTEMPTS} attempts. "
+                          f"It will be retried on the next run.")
+                    continue
+                stats.count_usage(result)
+                sizer.observe(len(batch), result)
+                items, missing, unreached = reconcile(batch, result['items'], result['truncated'])
+                merged = merge_entries(OUTPUT_FILE, cipher_entries(items, archive_words), index)
+                append_checkpoint(checkpoint_file, [item['word'] for item in items], items)
+                for word in missing:
+                    (retry if requests_per_word[word] < MAX_WORD_REQUESTS else abandoned).append(word)
+                # Words the token limit cut off were never answered, so they
+                # go back to the front of the queue without using up a request
+                requests_per_word.subtract(unreached)
+                fresh.extendleft(reversed(unreached))
+                settled += len(items)
+                created += merged['inserted']
+                stats.entries += merged['inserted']
+                per_call, per_minute = stats.rates()
+                cut_off = " (cut off)" if result['truncated'] else ""
+                print(f"  Settled {settled}/{len(pending_words)}: batch of {len(batch)}{cut_off} answered "
+                      f"{len(items)}, {len(missing) + len(unreached)} to ask again. Good entries: {created} "
+                      f"({per_call:.1f}/call, {per_minute:.0f}/min); next batch size {sizer.size()}")
 
+    per_call, per_minute = stats.rates()
     print(f"\n--- SEMANTIC GENERATION COMPLETE ---")
-    print(f"Total words processed: {len(clean_words)}")
-    print(f"Successful unique entries created: {successful_ciphers}")
+    print(f"Words settled: {settled} of {len(pending_words)}")
+    print(f"Failed batches: {failed_batches}")
+    print(f"Words still missing after {MAX_WORD_REQUESTS} requests: {len(abandoned)}")
+    print(f"Successful unique entries created: {created}")
+    print(f"API calls: {stats.calls} ({stats.prompt_tokens} prompt and {stats.output_tokens} output tokens); "
+          f"{per_call:.1f} entries per call, {per_minute:.0f} per minute; "
+          f"{sizer.truncations} responses cut off")
+    if created or has_template_words:
+        refresh_semantic_index(OUTPUT_FILE)
+        refresh_snapshot(OUTPUT_FILE)
     print("Your Gopher Archive now contains unique, high-quality, thematic ciphers!")
 
 
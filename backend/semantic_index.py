@@ -0,0 +1,323 @@
+"""Offline semantic retrieval over the Gopher Archive.
+
+Entries are embedded with latent semantic analysis: TF-IDF weighted term
+counts projected onto the top singular vectors of the archive's own
+term-document matrix, so ciphers about the same idea land near each other
+even when they share no words. Nothing leaves the machine.
+
+    python semantic_index.py build [source]
+
+writes the model (vocabulary, idf weights, term vectors) to
+gopher_semantic.npz and the unit-length entry vectors to gopher_semantic.npy,
+which the server memory-maps. A query is embedded the same way and scored
+against every entry with one matrix-vector product; argpartition picks the
+top k without sorting the rest. The model also records a digest of the
+entries it was built from; the server folds in entries appended since then
+and rebuilds the index when the ones it was built from have changed.
+
+NumPy is optional: without it the semantic and hybrid modes are unavailable
+and search stays keyword-only.
+"""
+
+import hashlib
+import math
+import os
+import sys
+import threading
+from collections import Counter
+from itertools import islice
+
+from archive_format import iter_archive, resolve_archive_path
+from archive_store import tokenize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEMANTIC_MODEL_PATH = 'gopher_semantic.npz'
+SEMANTIC_VECTORS_PATH = 'gopher_semantic.npy'
+DIMENSIONS = 128
+# Extra random directions and power iterations for the randomized SVD
+OVERSAMPLE = 16
+POWER_ITERATIONS = 2
+# Words seen in a single entry carry no information about relatedness
+MIN_DOC_FREQ = 2
+# Reciprocal rank fusion constant; 60 is the customary choice
+RRF_K = 60
+
+
+def available():
+    return np is not None
+
+
+class _TermMatrix:
+    """Sparse TF-IDF term-document matrix in coordinate form."""
+
+    def __init__(self, rows, cols, values, shape):
+        self.rows = rows
+        self.cols = cols
+        self.values = values
+        self.shape = shape
+
+    @staticmethod
+    def _segment_sum(keys, products, size):
+        out = np.zeros((size, products.shape[1]), dtype=np.float64)
+        if len(keys):
+            order = np.argsort(keys, kind='stable')
+            keys, products = keys[order], products[order]
+            present, starts = np.unique(keys, return_index=True)
+            out[present] = np.add.reduceat(products, starts)
+        return out
+
+    def dot(self, dense):
+        """self @ dense"""
+        return self._segment_sum(self.rows, self.values[:, None] * dense[self.cols], self.shape[0])
+
+    def tdot(self, dense):
+        """self.T @ dense"""
+        return self._segment_sum(self.cols, self.values[:, None] * dense[self.rows], self.shape[1])
+
+
+def _weights(counts, terms, idf):
+    """(term row, (1 + log tf) * idf) pairs for the known terms of one text."""
+    return [(terms[word], (1 + math.log(tf)) * idf[terms[word]])
+            for word, tf in counts.items() if word in terms]
+
+
+def _term_matrix(token_counts, terms, idf):
+    rows, cols, values = [], [], []
+    for position, counts in enumerate(token_counts):
+        for col, weight in _weights(counts, terms, idf):
+            rows.append(position)
+            cols.append(col)
+            values.append(weight)
+    return _TermMatrix(np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64),
+                       np.array(values, dtype=np.float64), (len(token_counts), len(terms)))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def archive_digest(entries):
+    """Fingerprint of an archive's (id, path, content) triples, in order."""
+    digest = hashlib.sha256()
+    for entry_id, path, content in entries:
+        digest.update(f"{entry_id}\0{len(path)}:{path}{len(content)}:{content}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SemanticIndex:
+    """LSA model plus one unit vector per archive entry, in archive order.
+
+    `vectors` covers the entries the model was built from, whose digest is
+    `digest`, and is usually a read-only memory map; vectors for entries
+    appended since are kept apart in `added` so the map is never copied.
+    """
+
+    __slots__ = ('terms', 'idf', 'term_vectors', 'vectors', 'added', 'digest')
+
+    def __init__(self, terms, idf, term_vectors, vectors, digest=None):
+        self.terms = {word: row for row, word in enumerate(terms)}
+        self.idf = idf
+        self.term_vectors = term_vectors
+        self.vectors = vectors
+        self.added = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.vectors) + len(self.added)
+
+    def embed(self, texts):
+        """Unit vectors for texts, one row each; rows of zeros for texts with no known words."""
+        token_counts = [Counter(tokenize(text)) for text in texts]
+        matrix = _term_matrix(token_counts, self.terms, self.idf)
+        return _normalize(matrix.dot(self.term_vectors)).astype(np.float32)
+
+    def fold_in(self, contents):
+        """Appends vectors for entries added to the archive since the model was built."""
+        if contents:
+            self.added = np.concatenate([self.added, self.embed(contents)])
+
+    def top(self, query_vector, limit):
+        """Positions of the `limit` entries most similar to query_vector, best first."""
+        scores = self.vectors @ query_vector
+        if len(self.added):
+            scores = np.concatenate([scores, self.added @ query_vector])
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return []
+        if limit < len(scores):
+            candidates = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            candidates = np.arange(len(scores))
+        # Ties keep archive order, matching the keyword ranking
+        ranked = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [int(p) for p in ranked if scores[p] > 0]
+
+    def rank(self, keywords, limit):
+        """Positions of entries closest in meaning to the keywords, best first."""
+        query_vector = self.embed([' '.join(keywords)])[0]
+        if not query_vector.any():
+            return []
+        return self.top(query_vector, limit)
+
+
+def fit(contents, dimensions=DIMENSIONS, seed=0):
+    """Fits the LSA model to the archive and embeds every entry."""
+    token_counts = [Counter(tokenize(text)) for text in contents]
+    doc_freq = Counter(word for counts in token_counts for word in counts)
+    vocabulary = sorted(word for word, df in doc_freq.items() if df >= MIN_DOC_FREQ)
+    terms = {word: row for row, word in enumerate(vocabulary)}
+    idf = np.array([math.log(len(contents) / doc_freq[word]) for word in vocabulary])
+    matrix = _term_matrix(token_counts, terms, idf)
+
+    rank = min(dimensions, len(contents) - 1, len(vocabulary) - 1)
+    if rank < 1:
+        raise ValueError("The archive is too small to build a semantic index")
+
+    # Randomized range finder (Halko et al.), then an exact SVD of the small projection
+    rng = np.random.default_rng(seed)
+    sample = matrix.dot(rng.standard_normal((len(vocabulary), rank + OVERSAMPLE)))
+    for _ in range(POWER_ITERATIONS):
+        sample = matrix.dot(np.linalg.qr(matrix.tdot(np.linalg.qr(sample)[0]))[0])
+    basis = np.linalg.qr(sample)[0]
+    _, _, components = np.linalg.svd(matrix.tdot(basis).T, full_matrices=False)
+    term_vectors = components[:rank].T
+
+    vectors = _normalize(matrix.dot(term_vectors)).astype(np.float32)
+    return SemanticIndex(vocabulary, idf, term_vectors, vectors)
+
+
+def save(index, model_path=SEMANTIC_MODEL_PATH, vectors_path=SEMANTIC_VECTORS_PATH):
+    """Writes the model and entry vectors, each atomically."""
+    for path, write in (
+            (model_path, lambda f: np.savez(f, terms=np.array(list(index.terms), dtype=str),
+                                            idf=index.idf, term_vectors=index.term_vectors,
+                                            digest=np.array(index.digest or ''))),
+            (vectors_path, lambda f: np.save(f, np.ascontiguousarray(index.vectors)))):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def load(model_path=SEMANTIC_MODEL_PATH, vectors_path=SEMANTIC_VECTORS_PATH):
+    """Loads a saved index; the entry vectors are memory-mapped read-only."""
+    with np.load(model_path) as model:
+        terms, idf, term_vectors = model['terms'].tolist(), model['idf'], model['term_vectors']
+        # Indexes saved before digests were recorded have none and get rebuilt
+        digest = str(model['digest']) if 'digest' in model.files else None
+    return SemanticIndex(terms, idf, term_vectors, np.load(vectors_path, mmap_mode='r'), digest or None)
+
+
+def build_semantic_index(source, model_path=SEMANTIC_MODEL_PATH, vectors_path=SEMANTIC_VECTORS_PATH):
+    """Embeds every entry of the archive at `source`; returns the entry count."""
+    entries = [(e.get('id'), e.get('path', ''), e.get('content', '')) for e in iter_archive(source)]
+    index = fit([content for _, _, content in entries])
+    index.digest = archive_digest(entries)
+    save(index, model_path, vectors_path)
+    return len(index)
+
+
+def refresh_semantic_index(source, model_path=SEMANTIC_MODEL_PATH, vectors_path=SEMANTIC_VECTORS_PATH):
+    """Rebuilds the vectors after a generator run, when NumPy is installed."""
+    if not available():
+        return
+    try:
+        total = build_semantic_index(source, model_path, vectors_path)
+    except ValueError as e:
+        print(f"Semantic index not rebuilt: {e}")
+        return
+    print(f"Semantic index rebuilt for {total} entries ({vectors_path})")
+
+
+def reciprocal_rank_fusion(rankings, limit, k=RRF_K):
+    """Merges ranked position lists, rewarding entries that rank well in any of them."""
+    scores = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda p: (-scores[p], p))[:limit]
+
+
+class SemanticStore:
+    """Keeps the semantic index aligned with the archive snapshot it serves.
+
+    get() returns None when NumPy or the saved index is missing, so callers
+    fall back to keyword search. Entries appended since the build are folded
+    in with the existing model rather than waiting for a refit. When the
+    archive no longer starts with the entries the index was built from
+    (compaction, an edit, a different archive) the index is rebuilt and
+    saved on a background thread; get() returns None until it lands.
+    """
+
+    def __init__(self, model_path=SEMANTIC_MODEL_PATH, vectors_path=SEMANTIC_VECTORS_PATH):
+        self.model_path = model_path
+        self.vectors_path = vectors_path
+        self._lock = threading.Lock()
+        self._archive_key = None
+        self._index = None
+        self._rebuilding = False
+
+    def get(self, archive):
+        key = (archive.mtime, len(archive))
+        if self._archive_key == key:
+            return self._index
+        with self._lock:
+            if self._archive_key != key:
+                self._index = self._load(archive)
+                self._archive_key = key
+            return self._index
+
+    def _load(self, archive):
+        if not available():
+            return None
+        try:
+            index = load(self.model_path, self.vectors_path)
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable semantic index: {e}")
+            return None
+        built = len(index)
+        if built > len(archive) or index.digest != archive_digest(
+                islice(zip(archive.ids, archive.paths, archive.contents), built)):
+            if not self._rebuilding:
+                print("Semantic index was built from a different archive; rebuilding it")
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, args=(archive,), daemon=True).start()
+            return None
+        index.fold_in([archive.contents[p] for p in range(built, len(archive))])
+        return index
+
+    def _rebuild(self, archive):
+        saved = False
+        try:
+            index = fit(archive.contents)
+            index.digest = archive_digest(zip(archive.ids, archive.paths, archive.contents))
+            save(index, self.model_path, self.vectors_path)
+            saved = True
+        except (ValueError, OSError) as e:
+            print(f"Semantic index not rebuilt: {e}")
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                if saved:
+                    # Load what was saved, memory-mapped, on the next get()
+                    self._archive_key = None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'build' or len(sys.argv) > 3:
+        print("Usage: python semantic_index.py build [source]")
+        sys.exit(1)
+    if not available():
+        print("Error: the semantic index needs NumPy (pip install numpy)")
+        sys.exit(1)
+    source = sys.argv[2] if len(sys.argv) > 2 else resolve_archive_path()
+    total = build_semantic_index(source)
+    print(f"Embedded {total} entries from {source} into {SEMANTIC_VECTORS_PATH}")
@@ -0,0 +1,150 @@
+"""Preforking production server for the ASGI or Flask app.
+
+    python serve.py                      # async_agent.app on SERVE_WORKERS processes
+    python serve.py --app wsgi           # the Flask app, threaded, instead
+
+The master binds the port, imports the app and runs agent.warm_up(), so the
+archive, fuzzy and semantic indexes and SDK modules are built once. It then
+freezes the garbage collector's view of those objects and forks the
+workers, which share the pages copy-on-write instead of each loading its
+own copy. Every worker reopens its Gemini client and SQLite handles after
+the fork and prepares its own prompt configs, so no two processes share a
+provider context cache (agent.start_worker()). It then accepts connections
+on the inherited socket.
+
+The master only supervises: it restarts workers that die and passes
+SIGTERM or SIGINT on to them for a graceful shutdown.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+# --- Configuration ---
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "5000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 2)))
+SERVE_BACKLOG = 2048
+# Seconds workers get to finish in-flight requests when asked to stop
+SHUTDOWN_TIMEOUT = 30
+# Pause before replacing a worker that died, so a crash loop cannot spin
+RESPAWN_DELAY = 1.0
+
+
+def listen(host, port, backlog=SERVE_BACKLOG):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_app(kind):
+    """Imports and warms the app in the master; returns the callable to serve."""
+    import agent
+    if kind == 'asgi':
+        import async_agent
+        app = async_agent.app
+    else:
+        app = agent.app
+    agent.warm_up(prompt_configs=False)
+    return app
+
+
+def run_worker(kind, app, sock):
+    import agent
+    agent.start_worker()
+    if kind == 'asgi':
+        import uvicorn
+        config = uvicorn.Config(app, lifespan='on', log_level='warning',
+                                timeout_graceful_shutdown=SHUTDOWN_TIMEOUT)
+        uvicorn.Server(config).run(sockets=[sock])
+        return
+
+    from werkzeug.serving import make_server
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    # shutdown() waits for serve_forever() to return, so it cannot run in the handler itself
+    stop = lambda signum, frame: threading.Thread(target=server.shutdown).start()  # noqa: E731
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.serve_forever()
+
+
+def spawn(kind, app, sock):
+    pid = os.fork()
+    if pid:
+        return pid
+    # Worker: drop the master's signal handlers before the server installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+    try:
+        run_worker(kind, app, sock)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve(kind, host, port, workers):
+    started = time.perf_counter()
+    # Bound first, so a busy port fails before the slow preload
+    sock = listen(host, port)
+    app = load_app(kind)
+    # Objects that exist now are never scanned again by the collector, which
+    # would otherwise touch, and so un-share, their pages in every worker
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded the {kind} app in {time.perf_counter() - started:.2f}s; "
+          f"starting {workers} workers on http://{host}:{port}")
+
+    children = {spawn(kind, app, sock) for _ in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; starting another")
+            time.sleep(RESPAWN_DELAY)
+            children.add(spawn(kind, app, sock))
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', choices=['asgi', 'wsgi'], default='asgi')
+    parser.add_argument('--host', default=SERVE_HOST)
+    parser.add_argument('--port', type=int, default=SERVE_PORT)
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS)
+    args = parser.parse_args()
+    serve(args.app, args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent identical calls into one (thread flavour).
+
+    The first caller for a key runs the function; anyone arriving with the
+    same key while it runs waits for that result instead of making their own
+    call. Exceptions reach every waiter. `coalesced` counts the calls saved.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """Runs fn() once per key at a time; followers wait up to `timeout` seconds."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Timed out after {timeout}s waiting on an identical in-flight call")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """Collapses concurrent identical calls into one (asyncio flavour).
+
+    The shared call is shielded, so a caller that times out or is cancelled
+    does not cancel the upstream request for everyone else still waiting.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+
+    def _forget(self, key, future):
+        self._calls.pop(key, None)
+        if not future.cancelled():
+            # Mark the error as retrieved even if every waiter has gone
+            future.exception()
+
+    async def do(self, key, fn, timeout=None):
+        """Awaits fn() once per key at a time; every caller waits up to `timeout` seconds."""
+        future = self._calls.get(key)
+        if future is None:
+            future = self._calls[key] = asyncio.ensure_future(fn())
+            future.add_done_callback(lambda f: self._forget(key, f))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
@@ -0,0 +1,107 @@
+import json
+import re
+
+OPENING_PHRASE = "Hark, the Gopher nexus coughs up a cipher..."
+
+WORD_OR_SPACE_PATTERN = re.compile(r'\s+|\S+')
+
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event whose data is JSON-encoded."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class WordLimitStream:
+    """Applies the opening-phrase and word-limit rules to a text stream as it arrives.
+
+    Mirrors what finalize_interpretation() does to a finished response: the
+    opening phrase is prepended if the model did not start with it, and the
+    body after it is cut at `max_words` words with a trailing "...". The
+    phrase is always followed by exactly "\n\n", whether it was prepended
+    or the model wrote it with other spacing (or none), as in a truncated
+    finished response. Within the body the model's whitespace is passed
+    through, where enforce_word_limit() joins a truncated body with single
+    spaces, so the two agree on words and cut point, not on every space. A
+    word split across chunks is held back until the next chunk shows where
+    it ends, so the output never depends on chunk boundaries.
+    """
+
+    def __init__(self, max_words=85, opening=OPENING_PHRASE):
+        self.max_words = max_words
+        self.opening = opening
+        self.words = 0
+        self.done = False
+        self._opened = False
+        self._pending = ''
+        self._gap = ''
+        self._emitted = []
+
+    @property
+    def text(self):
+        """Everything emitted so far."""
+        return ''.join(self._emitted)
+
+    def _emit(self, piece):
+        self._emitted.append(piece)
+        return piece
+
+    def _open(self, final):
+        # Wait until we can tell whether the model started with the opening
+        if not final and len(self._pending) < len(self.opening) and \
+                self.opening.startswith(self._pending):
+            return ''
+        self._opened = True
+        if self._pending.startswith(self.opening):
+            self._pending = self._pending[len(self.opening):]
+        return self._emit(f"{self.opening}\n\n")
+
+    def _drain(self, final):
+        out = []
+        pieces = WORD_OR_SPACE_PATTERN.findall(self._pending)
+        # A trailing word may continue in the next chunk
+        if not final and pieces and not pieces[-1].isspace():
+            self._pending = pieces.pop()
+        else:
+            self._pending = ''
+        for piece in pieces:
+            if piece.isspace():
+                if not self.words:
+                    # The separator after the opening phrase is always the "\n\n" sent with it
+                    continue
+                if self.words == self.max_words:
+                    # Only sent if the text ends here; otherwise "..." replaces it
+                    self._gap += piece
+                    continue
+            elif self.words == self.max_words:
+                self.done = True
+                out.append(self._emit("..."))
+                break
+            else:
+                self.words += 1
+            out.append(self._emit(piece))
+        if self.done:
+            self._pending = ''
+        elif final and self._gap:
+            out.append(self._emit(self._gap))
+        return ''.join(out)
+
+    def feed(self, chunk):
+        """Takes the next model chunk and returns the text that may be sent now."""
+        if self.done:
+            return ''
+        self._pending += chunk
+        out = ''
+        if not self._opened:
+            out = self._open(final=False)
+            if not self._opened:
+                return ''
+        return out + self._drain(final=False)
+
+    def close(self):
+        """Flushes whatever is still held back once the model stream ends."""
+        if self.done:
+            return ''
+        out = '' if self._opened else self._open(final=True)
+        out += self._drain(final=True)
+        self.done = True
+        return out
@@ -0,0 +1,50 @@
+"""The token index must match exactly what the old \\bkeyword\\b regex scan matched."""
+
+import pytest
+
+from archive_store import ArchiveSnapshot, tokenize
+
+ENTRIES = [
+    {"id": 1, "path": "/menu/semantic/modem", "content": "The MODEM sings: dial tone, then static."},
+    {"id": 2, "path": "/menu/word/soul_not_found", "content": "ERROR 404: soul_not_found at 127.0.0.1"},
+    {"id": 3, "path": "/phlog/1993/modems", "content": "Modems, modem-like hums and a modem!"},
+    {"id": 4, "path": "/menu/semantic/Café", "content": "café au lait, CAFÉ noir; naïve gophers"},
+    {"id": 5, "path": "/menu/word/x2", "content": "x2 x_2 2x __init__ tab\tseparated\nnew line"},
+    {"path": "/no/id", "content": ""},
+]
+
+# Phrases, punctuation, digits, underscores, non-ASCII letters and misses
+PROBES = ['MODEM', ' modem ', 'dial tone', '127.0.0.1', '127', 'soul_not_found', 'soul', 'modem!',
+          'modem-like', 'CAFÉ', 'naïve', 'x_2', '2x', '__init__', 'init', 'mode', 'odem', 'zzyzx', '']
+
+
+@pytest.fixture
+def archive():
+    return ArchiveSnapshot(ENTRIES)
+
+
+def vocabulary(archive):
+    return sorted({t for text in archive.contents + archive.paths for t in tokenize(text)})
+
+
+@pytest.mark.parametrize('keyword', vocabulary(ArchiveSnapshot(ENTRIES)) + PROBES)
+def test_find_matches_regex_scan(archive, keyword):
+    keyword = keyword.lower().strip()
+    assert archive.find(keyword) == archive.scan(keyword)
+
+
+def test_find_is_case_insensitive(archive):
+    assert archive.find('modem') == archive.find('MODEM') == [0, 2]
+    assert archive.find('CAFÉ') == archive.find('café')
+    assert archive.find('café') == [3]
+
+
+def test_postings_are_in_archive_order(archive):
+    for positions in archive.token_index.values():
+        assert list(positions) == sorted(set(positions))
+
+
+def test_entries_round_trip(archive):
+    assert len(archive) == len(ENTRIES)
+    assert archive.entry(0) == ENTRIES[0]
+    assert archive.entry(5) == {"id": None, "path": "/no/id", "content": ""}
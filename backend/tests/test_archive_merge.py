@@ -0,0 +1,61 @@
+"""Generator reruns must not grow the archive; compaction cleans up after the old blind appends."""
+
+from archive_format import append_entries, iter_archive, write_archive
+from archive_merge import ArchiveIndex, compact, merge_entries
+
+ARCHIVED = [
+    {"id": 1, "path": "/menu/semantic/modem", "content": "The modem sings."},
+    {"id": 2, "path": "/menu/semantic/ghost", "content": "A ghost in the wire."},
+]
+
+
+def archive(tmp_path, entries=ARCHIVED):
+    path = str(tmp_path / "gopher_archive.jsonl")
+    write_archive(path, entries)
+    return path
+
+
+def test_rerun_writes_nothing(tmp_path):
+    path = archive(tmp_path)
+    generated = [{"path": "/menu/semantic/static", "content": "Static on the line."}]
+
+    assert merge_entries(path, generated) == {"inserted": 1, "updated": 0, "unchanged": 0}
+    size = (tmp_path / "gopher_archive.jsonl").stat().st_size
+    assert merge_entries(path, generated) == {"inserted": 0, "updated": 0, "unchanged": 1}
+
+    assert (tmp_path / "gopher_archive.jsonl").stat().st_size == size
+    assert [e["id"] for e in iter_archive(path)] == [1, 2, 3]
+
+
+def test_changed_content_keeps_its_id_and_place(tmp_path):
+    path = archive(tmp_path)
+
+    merged = merge_entries(path, [{"id": 99, "path": "/menu/semantic/MODEM", "content": "The modem hums."}])
+
+    assert merged == {"inserted": 0, "updated": 1, "unchanged": 0}
+    assert list(iter_archive(path))[0] == {"id": 1, "path": "/menu/semantic/MODEM", "content": "The modem hums."}
+
+
+def test_shared_index_tracks_batch_after_batch(tmp_path):
+    path = archive(tmp_path)
+    index = ArchiveIndex.scan(path)
+
+    merge_entries(path, [{"path": "/menu/semantic/a", "content": "a"}], index)
+    merge_entries(path, [{"path": "/menu/semantic/b", "content": "b"},
+                         {"path": "/menu/semantic/a", "content": "a"}], index)
+
+    assert [e["id"] for e in iter_archive(path)] == [1, 2, 3, 4]
+    assert len(index) == 4
+
+
+def test_compact_drops_repeats_and_renumbers_clashes(tmp_path):
+    path = archive(tmp_path)
+    append_entries(path, [dict(ARCHIVED[0]), {"id": 2, "path": "/menu/semantic/static", "content": "Static."}])
+
+    report = compact(path)
+
+    assert report["removed"] == 1 and report["renumbered"] == 1 and report["entries"] == 3
+    assert report["bytes_after"] < report["bytes_before"]
+    assert [(e["id"], e["path"]) for e in iter_archive(path)] == [
+        (1, "/menu/semantic/modem"), (2, "/menu/semantic/ghost"), (3, "/menu/semantic/static")]
+    assert compact(path)["bytes_after"] == report["bytes_after"]
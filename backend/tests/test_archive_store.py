@@ -0,0 +1,73 @@
+"""ArchiveStore reloads: file changes, torn writes and the move to JSON Lines."""
+
+import json
+import os
+
+from archive_format import append_entries, iter_archive, resolve_archive_path
+from archive_snapshot import MappedArchive, compile_snapshot, load_mapped_archive, refresh_snapshot
+from archive_store import ArchiveStore
+
+
+def write_json(path, entries):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f)
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_reloads_when_the_file_changes(tmp_path):
+    path = str(tmp_path / 'archive.json')
+    write_json(path, [{"id": 1, "path": "/a", "content": "modem"}])
+    store = ArchiveStore(path)
+    first = store.get()
+    assert store.get() is first
+    write_json(path, [{"id": 1, "path": "/a", "content": "modem"}, {"id": 2, "path": "/b", "content": "gopher"}])
+    bump_mtime(path)
+    assert [e['path'] for e in store.entries()] == ['/a', '/b']
+
+
+def test_keeps_serving_through_a_torn_write(tmp_path):
+    path = str(tmp_path / 'archive.json')
+    write_json(path, [{"id": 1, "path": "/a", "content": "modem"}])
+    store = ArchiveStore(path)
+    assert len(store.get()) == 1
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[{"id": 1, "pa')
+    bump_mtime(path)
+    assert len(store.get()) == 1
+
+
+def test_follows_the_migration_to_json_lines(tmp_path):
+    legacy, jsonl = str(tmp_path / 'gopher_archive.json'), str(tmp_path / 'gopher_archive.jsonl')
+    write_json(legacy, [{"id": 1, "path": "/a", "content": "modem"}])
+    store = ArchiveStore(lambda: resolve_archive_path(jsonl, legacy))
+    assert [e['path'] for e in store.entries()] == ['/a']
+    # What a generator's first run does: copy the archive over and append to the copy
+    append_entries(jsonl, [{"id": 1, "path": "/a", "content": "modem"},
+                           {"id": 1000, "path": "/menu/semantic/gopher", "content": "It burrows."}])
+    assert [e['path'] for e in store.entries()] == ['/a', '/menu/semantic/gopher']
+
+
+def test_newer_source_wins_over_a_stale_snapshot(tmp_path):
+    source, snapshot = str(tmp_path / 'gopher_archive.jsonl'), str(tmp_path / 'gopher_archive.snapshot')
+    append_entries(source, [{"id": 1, "path": "/a", "content": "modem"}])
+    compile_snapshot(iter_archive(source), snapshot)
+    bump_mtime(snapshot)
+    store = ArchiveStore(snapshot, load_mapped_archive, source=source)
+    assert isinstance(store.get(), MappedArchive)
+
+    append_entries(source, [{"id": 2, "path": "/b", "content": "gopher"}])
+    bump_mtime(source)
+    bump_mtime(source)
+    assert [e['path'] for e in store.entries()] == ['/a', '/b']
+    assert not isinstance(store.get(), MappedArchive)
+
+    refresh_snapshot(source, snapshot)
+    bump_mtime(snapshot)
+    bump_mtime(snapshot)
+    bump_mtime(snapshot)
+    assert isinstance(store.get(), MappedArchive)
+    assert [e['path'] for e in store.entries()] == ['/a', '/b']
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from archive_store import ArchiveSnapshot
+from fuzzy_index import FuzzyIndex, FuzzyStore
+
+WORDS = ['prophecy', 'modem', 'modems', 'modulator', 'gopher', 'connection', 'shadow']
+
+
+def archive(words, mtime):
+    return ArchiveSnapshot([{"id": i, "path": f"/menu/word/{w}", "content": w} for i, w in enumerate(words)],
+                           mtime)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    wordlist = tmp_path / 'wordlist.txt'
+    wordlist.write_text('connection\nshadows\n', encoding='utf-8')
+    return str(tmp_path / 'gopher_fuzzy.index'), str(wordlist)
+
+
+def test_suggestions():
+    index = FuzzyIndex(WORDS + ['menu', 'word'], {'connection', 'shadows'})
+    assert index.suggest('prophecies') == ['prophecy']
+    assert index.suggest('gohper') == ['gopher']
+    assert index.suggest('modu') == ['modulator']
+    # A dictionary word is not treated as a typo of a nearby archive word
+    assert index.suggest('shadows') == ['shadow']
+    assert index.prefixed('mod', 5) == ['modem', 'modems', 'modulator']
+    assert index.prefixed('zz', 5) == []
+
+
+def test_extended_matches_a_full_build():
+    grown = FuzzyIndex(WORDS[:3], ()).extended(WORDS)
+    full = FuzzyIndex(WORDS, ())
+    assert grown.vocabulary == full.vocabulary
+    for probe in ('gohper', 'conection', 'shadw', 'modm', 'mod'):
+        assert grown.suggest(probe) == full.suggest(probe)
+
+
+def test_new_words_are_added_without_a_rebuild(paths, monkeypatch):
+    store = FuzzyStore(*paths)
+    first = store.get(archive(WORDS[:3], 1))
+    builds = []
+    monkeypatch.setattr(FuzzyIndex, '__init__', lambda *a: builds.append(a))
+
+    # New entries with no new words leave the index alone
+    assert store.get(archive(WORDS[:3] * 2, 2)) is first
+    grown = store.get(archive(WORDS, 3))
+    assert builds == []
+    assert grown.suggest('gohper') == ['gopher']
+    assert first.suggest('gohper') == []
+
+
+def test_other_changes_rebuild_in_the_background(paths):
+    store = FuzzyStore(*paths)
+    first = store.get(archive(WORDS, 1))
+
+    # Compaction dropped a word: the old index answers until the rebuild lands
+    assert store.get(archive(WORDS[1:], 2)) is first
+    wait_for(lambda: not store._rebuilding)
+    rebuilt = store.get(archive(WORDS[1:], 2))
+    assert 'prophecy' not in rebuilt.vocabulary_set
+
+
+def test_persisted_index_is_reused(paths, monkeypatch):
+    FuzzyStore(*paths).get(archive(WORDS, 1))
+    monkeypatch.setattr(FuzzyIndex, '__init__', lambda *a: pytest.fail("rebuilt"))
+    # Same vocabulary under a different archive mtime still loads from disk
+    index = FuzzyStore(*paths).get(archive(WORDS, 2))
+    assert index.suggest('gohper') == ['gopher']
@@ -0,0 +1,125 @@
+"""Retries, fallback and circuit breaking in LLMGateway against FakeClient."""
+
+import asyncio
+
+import pytest
+from google.genai.errors import ClientError
+
+from fake_llm import FakeClient, FaultInjector
+from llm_gateway import CircuitOpenError, LLMGateway
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def config_for(model):
+    return None
+
+
+def gateway_for(faults, clock=None, **options):
+    client = FakeClient(faults=faults)
+    options.setdefault('hedge_percentile', 0)
+    gateway = LLMGateway(client, clock=clock or FakeClock(), sleep=lambda seconds: None, **options)
+    return gateway, client
+
+
+def models_called(client):
+    return [call['model'] for call in client.models.calls]
+
+
+def test_transient_error_is_retried():
+    gateway, client = gateway_for(FaultInjector(fail_next=2))
+    assert gateway.generate(['a'], 'hi', config_for).text
+    assert models_called(client) == ['a', 'a', 'a']
+
+
+def test_missing_model_falls_back_without_retrying():
+    gateway, client = gateway_for(FaultInjector(error_code=404, down_models={'a'}))
+    assert gateway.generate(['a', 'b'], 'hi', config_for).text
+    assert models_called(client) == ['a', 'b']
+
+
+def test_request_errors_are_not_retried():
+    gateway, client = gateway_for(FaultInjector(error_code=400, fail_next=1))
+    with pytest.raises(ClientError):
+        gateway.generate(['a', 'b'], 'hi', config_for)
+    assert models_called(client) == ['a']
+
+
+def open_breaker(gateway, faults, clock):
+    faults.fail_next = gateway.breaker_failures
+    with pytest.raises(Exception):
+        gateway.generate(['a'], 'hi', config_for)
+    assert gateway.breaker_states() == {'a': 'open'}
+    with pytest.raises(CircuitOpenError):
+        gateway.generate(['a'], 'hi', config_for)
+    clock.now += gateway.breaker_reset
+
+
+def test_breaker_lets_a_probe_through_after_its_reset():
+    faults, clock = FaultInjector(), FakeClock()
+    gateway, _ = gateway_for(faults, clock, breaker_failures=2, max_attempts=2)
+    open_breaker(gateway, faults, clock)
+    assert gateway.generate(['a'], 'hi', config_for).text
+    assert gateway.breaker_states() == {'a': 'closed'}
+
+
+def test_rejected_probe_settles_the_breaker():
+    faults, clock = FaultInjector(), FakeClock()
+    gateway, _ = gateway_for(faults, clock, breaker_failures=2, max_attempts=2)
+    open_breaker(gateway, faults, clock)
+    faults.error_code, faults.fail_next = 400, 1
+    with pytest.raises(ClientError):
+        gateway.generate(['a'], 'hi', config_for)
+    # The model answered, so the next call goes through
+    assert gateway.generate(['a'], 'hi', config_for).text
+
+
+def test_probe_that_never_reaches_the_model_is_released():
+    faults, clock = FaultInjector(), FakeClock()
+    gateway, _ = gateway_for(faults, clock, breaker_failures=2, max_attempts=2)
+    open_breaker(gateway, faults, clock)
+
+    def refuse(model):
+        raise RuntimeError("no token")
+
+    with pytest.raises(RuntimeError):
+        gateway.generate(['a'], 'hi', config_for, before_attempt=refuse)
+    assert gateway.generate(['a'], 'hi', config_for).text
+
+
+def test_cancelled_async_probe_is_released():
+    faults, clock = FaultInjector(), FakeClock()
+    gateway, client = gateway_for(faults, clock, breaker_failures=2, max_attempts=2)
+    open_breaker(gateway, faults, clock)
+    client.models.delay_seconds = 5
+
+    async def cancelled_probe():
+        task = asyncio.ensure_future(gateway.generate_async(['a'], 'hi', config_for))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancelled_probe())
+    client.models.delay_seconds = 0
+    assert asyncio.run(gateway.generate_async(['a'], 'hi', config_for)).text
+
+
+def test_async_config_may_be_awaitable():
+    gateway, client = gateway_for(None)
+
+    async def awaitable_config(model):
+        return None
+
+    assert asyncio.run(gateway.generate_async(['a'], 'hi', awaitable_config)).text
+
+    async def streamed():
+        return [chunk.text async for chunk in gateway.stream_async(['a'], 'hi', awaitable_config)]
+
+    assert ''.join(asyncio.run(streamed())) == client.models.text
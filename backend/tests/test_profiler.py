@@ -0,0 +1,80 @@
+"""The /admin/profile endpoints: token checks, request tracing in Flask, and the ASGI app's 501."""
+
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import agent
+import async_agent
+from profiler import RequestTracer, collapse, sample
+
+TOKEN = 'swordfish'
+AUTH = {'Authorization': f'Bearer {TOKEN}'}
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(agent, 'ADMIN_TOKEN', TOKEN)
+    monkeypatch.setattr(agent, 'request_tracer', RequestTracer())
+    monkeypatch.setattr(agent.rate_limiter, 'rate', 0)
+    return agent.app.test_client()
+
+
+def asgi(method, path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=async_agent.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(run())
+
+
+def test_endpoints_are_hidden_without_a_token(monkeypatch):
+    monkeypatch.setattr(agent, 'ADMIN_TOKEN', None)
+    assert agent.app.test_client().get('/admin/profile', headers=AUTH).status_code == 404
+    assert asgi('GET', '/admin/profile/requests', headers=AUTH).status_code == 404
+
+
+def test_wrong_token_is_refused(admin):
+    assert admin.get('/admin/profile', headers={'Authorization': 'Bearer guess'}).status_code == 401
+    assert admin.post('/admin/profile/requests', json={"count": 1}).status_code == 401
+    assert asgi('POST', '/admin/profile/requests', json={"count": 1}).status_code == 401
+
+
+def test_flask_traces_the_next_requests(admin):
+    armed = admin.post('/admin/profile/requests', json={"count": 1, "paths": ["/api/learn"]}, headers=AUTH)
+    assert armed.status_code == 202
+    admin.post('/api/learn', json={"query": "What was Gopher?"}).close()
+
+    captured = admin.get('/admin/profile/requests', headers=AUTH)
+
+    assert captured.headers['X-Profiled-Requests'] == '1'
+    assert captured.headers['X-Profile-Remaining'] == '0'
+    assert 'agent.py:learn_endpoint' in captured.get_data(as_text=True)
+
+
+def test_asgi_request_tracing_is_not_implemented(admin):
+    for method in ('GET', 'POST'):
+        response = asgi(method, '/admin/profile/requests', json={"count": 1}, headers=AUTH)
+        assert response.status_code == 501
+        assert response.json() == {"error": async_agent.TRACE_UNSUPPORTED_MESSAGE}
+
+
+def test_sample_sees_other_threads():
+    release = threading.Event()
+
+    def waiting_for_the_modem():
+        release.wait()
+
+    thread = threading.Thread(target=waiting_for_the_modem)
+    thread.start()
+    ticks = iter(range(3))
+    try:
+        stacks = sample(1, clock=lambda: next(ticks) * 0.5, sleep=lambda interval: None)
+    finally:
+        release.set()
+        thread.join()
+
+    assert any('test_profiler.py:waiting_for_the_modem' in stack for stack in stacks)
+    assert collapse(stacks).count('\n') == len(stacks)
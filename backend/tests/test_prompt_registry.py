@@ -0,0 +1,102 @@
+"""Prepared configs and provider context caches across config changes and forked workers."""
+
+import asyncio
+import os
+import threading
+import time
+
+import agent
+from fake_llm import FakeClient
+from prompt_registry import CONTEXT_CACHE_MIN_TOKENS, PromptRegistry, SteeringDocument
+
+PERSONA = "You are the medium. " * (CONTEXT_CACHE_MIN_TOKENS // 4)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+def registry(client, clock):
+    prompts = PromptRegistry(client, context_cache=True, clock=clock)
+    prompts.register('seance', 'model-a', PERSONA, temperature=0.7)
+    return prompts
+
+
+def test_config_is_reused_until_the_cache_is_due_for_refresh():
+    client, clock = FakeClient(), FakeClock()
+    prompts = registry(client, clock)
+    config = prompts.config('seance')
+    assert config.cached_content in client.caches.created
+    assert config.system_instruction is None
+    assert prompts.config('seance') is config
+
+    clock.now += prompts.cache_ttl
+    refreshed = prompts.config('seance')
+    assert refreshed.cached_content != config.cached_content
+    assert client.caches.deleted == [config.cached_content]
+
+
+def test_short_instruction_is_sent_inline():
+    client = FakeClient()
+    prompts = PromptRegistry(client, context_cache=True)
+    prompts.register('learn', 'model-a', "Explain briefly.")
+    assert prompts.config('learn').system_instruction == "Explain briefly."
+    assert client.caches.created == {}
+
+
+def test_steering_document_is_reread_only_after_it_changes(tmp_path):
+    path = tmp_path / 'persona.md'
+    path.write_text('first', encoding='utf-8')
+    clock = FakeClock()
+    document = SteeringDocument(str(path), 'fallback', check_interval=1.0, clock=clock)
+    assert document.get() == 'first'
+
+    path.write_text('second', encoding='utf-8')
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert document.get() == 'first'
+    clock.now += 1.0
+    assert document.get() == 'second'
+
+    path.unlink()
+    clock.now += 1.0
+    assert document.get() == 'fallback'
+
+
+def test_config_async_creates_caches_off_the_event_loop():
+    client, clock = FakeClient(), FakeClock()
+    prompts = registry(client, clock)
+    threads = []
+    create = client.caches.create
+
+    def recording_create(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return create(*args, **kwargs)
+
+    client.caches.create = recording_create
+    config = asyncio.run(prompts.config_async('seance'))
+    assert config.cached_content in client.caches.created
+    assert threads and threads[0] is not threading.main_thread()
+    # A fresh config is returned straight away
+    assert asyncio.run(prompts.config_async('seance')) is config
+    assert len(threads) == 1
+
+
+def test_prefork_master_leaves_context_caches_to_each_worker(monkeypatch):
+    master, worker = FakeClient(), FakeClient()
+    prompts = registry(master, FakeClock())
+    monkeypatch.setattr(agent, 'prompts', prompts)
+    monkeypatch.setattr(agent, 'make_client', lambda: worker)
+    for name in ('client', 'gateway', 'response_cache', 'ready'):
+        monkeypatch.setattr(agent, name, getattr(agent, name))
+
+    # What serve.py runs before forking, then in each worker after the fork
+    agent.warm_up(prompt_configs=False)
+    assert master.caches.created == {}
+    agent.start_worker()
+    assert prompts.config('seance').cached_content in worker.caches.created
+    assert master.caches.created == {}
@@ -0,0 +1,157 @@
+"""Overload behaviour: per-client rate limits and the in-flight cap answer 429 with Retry-After."""
+
+import asyncio
+
+import httpx
+import pytest
+
+import agent
+import async_agent
+from rate_limit import (AdmissionControl, ClientRateLimiter, MemoryBucketStore, SQLiteBucketStore, client_key,
+                        retry_after_header)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Installs a rate limiter and admission cap on the apps; returns a function doing so."""
+    def install(rate=0, burst=1, max_in_flight=0, clock=None):
+        store = MemoryBucketStore(clock=clock) if clock else MemoryBucketStore()
+        monkeypatch.setattr(agent, 'rate_limiter', ClientRateLimiter(rate, burst, store))
+        monkeypatch.setattr(agent, 'admission', AdmissionControl(max_in_flight))
+    return install
+
+
+def seance(flask_client, api_key='client-a'):
+    response = flask_client.post('/api/seance', json={"user_query": "modem"}, headers={'X-API-Key': api_key})
+    # Admission slots are handed back once the response body is closed
+    response.close()
+    return response
+
+
+def test_limit_is_off_unless_configured():
+    limiter = ClientRateLimiter(0, 1)
+    assert all(limiter.check('ip:1.2.3.4') == 0.0 for _ in range(100))
+
+
+def test_bucket_allows_burst_then_reports_wait():
+    clock = FakeClock()
+    limiter = ClientRateLimiter(0.5, 3, MemoryBucketStore(clock=clock))
+    assert [limiter.check('key:a') for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.check('key:a') == pytest.approx(2.0)
+    # Clients do not share buckets
+    assert limiter.check('key:b') == 0.0
+    clock.now += 2.0
+    assert limiter.check('key:a') == 0.0
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'limits.db')
+    clock = FakeClock()
+    first = ClientRateLimiter(1, 2, SQLiteBucketStore(path, clock=clock))
+    second = ClientRateLimiter(1, 2, SQLiteBucketStore(path, clock=clock))
+    assert first.check('key:a') == 0.0
+    assert second.check('key:a') == 0.0
+    assert first.check('key:a') == pytest.approx(1.0)
+
+
+def test_admission_cap_and_retry_after():
+    admission = AdmissionControl(2)
+    tickets = [admission.try_enter(), admission.try_enter()]
+    assert None not in tickets
+    assert admission.try_enter() is None
+    assert admission.retry_after() > 0
+    admission.leave(tickets[0])
+    assert admission.try_enter() is not None
+    assert admission.stats() == {"in_flight": 2, "admitted": 3, "rejected": 1}
+
+
+def test_overloaded_request_keeps_its_token(limits):
+    limits(rate=1, burst=1, max_in_flight=1, clock=FakeClock())
+    held = agent.admission.try_enter()
+    assert agent.admit('key:a')[1][0] == agent.OVERLOADED_MESSAGE
+    agent.admission.leave(held)
+    ticket, rejection = agent.admit('key:a')
+    assert rejection is None
+    agent.admission.leave(ticket)
+
+
+def test_rate_limited_request_hands_its_slot_back(limits):
+    limits(rate=1, burst=1, max_in_flight=1, clock=FakeClock())
+    agent.admission.leave(agent.admit('key:a')[0])
+    assert agent.admit('key:a')[1][0] == agent.RATE_LIMITED_MESSAGE
+    assert agent.admission.stats() == {"in_flight": 0, "admitted": 1, "rejected": 0}
+    assert agent.admit('key:b')[1] is None
+
+
+def test_retry_after_header_is_whole_seconds():
+    assert retry_after_header(0.01) == '1'
+    assert retry_after_header(2.2) == '3'
+
+
+def test_forwarded_for_only_trusted_behind_proxy():
+    assert client_key(None, '9.9.9.9', '10.0.0.1') == 'ip:10.0.0.1'
+    assert client_key(None, '9.9.9.9, 10.0.0.1', '10.0.0.1', trust_proxy=True) == 'ip:9.9.9.9'
+    assert client_key('secret', None, '10.0.0.1').startswith('key:')
+    assert 'secret' not in client_key('secret', None, '10.0.0.1')
+
+
+def test_flask_rate_limit_answers_429_with_retry_after(limits):
+    clock = FakeClock()
+    limits(rate=0.5, burst=2, clock=clock)
+    flask_client = agent.app.test_client()
+    assert [seance(flask_client).status_code for _ in range(2)] == [200, 200]
+    response = seance(flask_client)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    assert response.get_json() == {"error": agent.RATE_LIMITED_MESSAGE}
+    # Another client still gets through, and so does this one once a token is back
+    assert seance(flask_client, 'client-b').status_code == 200
+    clock.now += 2.0
+    assert seance(flask_client).status_code == 200
+
+
+def test_flask_admission_cap_answers_429(limits):
+    limits(max_in_flight=1)
+    held = agent.admission.try_enter()
+    flask_client = agent.app.test_client()
+    response = seance(flask_client)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json() == {"error": agent.OVERLOADED_MESSAGE}
+    agent.admission.leave(held)
+    assert seance(flask_client).status_code == 200
+    # Every admitted request gave its slot back
+    assert agent.admission.stats()['in_flight'] == 0
+
+
+def test_flask_limits_only_api_posts(limits):
+    limits(max_in_flight=1)
+    held = agent.admission.try_enter()
+    flask_client = agent.app.test_client()
+    assert flask_client.get('/ready').status_code in (200, 503)
+    assert flask_client.get('/metrics').status_code == 200
+    agent.admission.leave(held)
+
+
+def test_asgi_answers_429_with_retry_after(limits):
+    limits(rate=1, burst=1, clock=FakeClock())
+
+    async def run():
+        transport = httpx.ASGITransport(app=async_agent.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return [await client.post('/api/seance', json={"user_query": "modem"}, headers={'X-API-Key': 'a'})
+                    for _ in range(2)]
+
+    first, second = asyncio.run(run())
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers['retry-after'] == '1'
+    assert second.json() == {"error": agent.RATE_LIMITED_MESSAGE}
@@ -0,0 +1,113 @@
+"""The answer cache on its own and in front of the model calls, driven by a stub client."""
+
+from types import SimpleNamespace
+
+import pytest
+from google.genai.errors import ClientError
+
+import agent
+from llm_gateway import LLMGateway
+from response_cache import ResponseCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubModels:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+        self.fail = False
+
+    def generate_content(self, model, contents, config=None, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise ClientError(400, {"error": {"message": "rejected", "status": "INVALID_ARGUMENT"}})
+        return SimpleNamespace(text=self.text)
+
+
+class StubClient:
+    def __init__(self, text="Hark, the Gopher nexus coughs up a cipher...\n\nThe modem remembers."):
+        self.models = StubModels(text)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """A stub model client and an empty answer cache installed in agent."""
+    client = StubClient()
+    monkeypatch.setattr(agent, 'client', client)
+    monkeypatch.setattr(agent, 'gateway', LLMGateway(client))
+    monkeypatch.setattr(agent, 'response_cache', ResponseCache())
+    return client.models
+
+
+def test_key_folds_case_and_whitespace_only():
+    key = make_cache_key("What does  the Modem say?", "ctx", "model-a", 0.8)
+    assert key == make_cache_key(" what does the modem SAY? ", "ctx", "model-a", 0.8)
+    assert key != make_cache_key("What does the modem say?", "other ctx", "model-a", 0.8)
+    assert key != make_cache_key("What does the modem say?", "ctx", "model-b", 0.8)
+    assert key != make_cache_key("What does the modem say?", "ctx", "model-a", 0.7)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('A', 'C')
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2}
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(ttl_seconds=10, clock=clock)
+    cache.set('a', 'A')
+    clock.now += 9
+    assert cache.get('a') == 'A'
+    clock.now += 1
+    assert cache.get('a') is None
+
+
+def test_sqlite_backing_survives_restart(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / 'answers.db')
+    ResponseCache(ttl_seconds=10, db_path=path, clock=clock).set('a', 'A')
+    restarted = ResponseCache(ttl_seconds=10, db_path=path, clock=clock)
+    assert restarted.get('a') == 'A'
+    clock.now += 10
+    assert ResponseCache(ttl_seconds=10, db_path=path, clock=clock).get('a') is None
+
+
+def test_repeat_seance_question_skips_the_model(stub):
+    first = agent.interpret_cryptic_message("What does the modem say?", "Matching Ciphers:\nmodem")
+    again = agent.interpret_cryptic_message("what does the MODEM say? ", "Matching Ciphers:\nmodem")
+    assert first == again
+    assert stub.calls == 1
+    # A different archive context is a different answer
+    agent.interpret_cryptic_message("What does the modem say?", "Matching Ciphers:\ngopher")
+    assert stub.calls == 2
+
+
+def test_model_errors_are_not_cached(stub):
+    stub.fail = True
+    failed = agent.interpret_cryptic_message("What does the modem say?", "ctx")
+    stub.fail = False
+    answer = agent.interpret_cryptic_message("What does the modem say?", "ctx")
+    assert answer != failed
+    assert answer.endswith("The modem remembers.")
+
+
+def test_repeat_learn_question_skips_the_model(stub):
+    flask_client = agent.app.test_client()
+    responses = [flask_client.post('/api/learn', json={"query": query})
+                 for query in ("What was Gopher?", "what was  gopher?")]
+    assert [r.status_code for r in responses] == [200, 200]
+    assert responses[0].get_json() == responses[1].get_json()
+    assert stub.calls == 1
@@ -0,0 +1,101 @@
+"""/api/seance/batch on both apps against a stub model answering in the batch JSON format."""
+
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import agent
+import async_agent
+from llm_gateway import LLMGateway
+from response_cache import ResponseCache
+
+
+class StubModels:
+    """Interprets every seance in the prompt except those listed in `skip`."""
+
+    def __init__(self):
+        self.calls = 0
+        self.skip = set()
+
+    def answer(self, contents):
+        self.calls += 1
+        ids = [int(n) for n in re.findall(r'^Seance (\d+)$', contents, re.MULTILINE)]
+        return SimpleNamespace(text=json.dumps(
+            [{"id": n, "interpretation": f"Seance {n} hears the modem."} for n in ids if n not in self.skip]))
+
+    def generate_content(self, model, contents, config=None, **kwargs):
+        return self.answer(contents)
+
+
+class StubAsyncModels:
+    def __init__(self, models):
+        self.models = models
+
+    async def generate_content(self, model, contents, config=None, **kwargs):
+        return self.models.answer(contents)
+
+
+@pytest.fixture
+def models(monkeypatch):
+    models = StubModels()
+    client = SimpleNamespace(models=models, aio=SimpleNamespace(models=StubAsyncModels(models)))
+    monkeypatch.setattr(agent, 'client', client)
+    monkeypatch.setattr(agent, 'gateway', LLMGateway(client, hedge_percentile=0))
+    monkeypatch.setattr(agent, 'response_cache', ResponseCache())
+    return models
+
+
+def flask_batch(queries):
+    response = agent.app.test_client().post('/api/seance/batch', json={"queries": queries})
+    assert response.status_code == 200
+    return response.get_json()["results"]
+
+
+def asgi_batch(queries):
+    async def run():
+        transport = httpx.ASGITransport(app=async_agent.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post('/api/seance/batch', json={"queries": queries})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+@pytest.mark.parametrize('post', [flask_batch, asgi_batch], ids=['flask', 'asgi'])
+def test_one_model_call_answers_the_batch(models, post):
+    results = post(["what does the modem say", "  ", "What does the modem say", "who is the gopher"])
+    assert models.calls == 1
+    assert results[1]["error"]
+    # The repeat is interpreted once and shared
+    assert results[0]["interpretation"] == results[2]["interpretation"]
+    assert results[0]["interpretation"] != results[3]["interpretation"]
+    for i in (0, 2, 3):
+        assert results[i]["interpretation"].startswith(agent.OPENING_PHRASE)
+        assert results[i]["cryptic_response"]
+
+
+@pytest.mark.parametrize('post', [flask_batch, asgi_batch], ids=['flask', 'asgi'])
+def test_seance_left_out_by_the_model_fails_alone(models, post):
+    models.skip = {2}
+    results = post(["what does the modem say", "who is the gopher"])
+    assert "interpretation" in results[0]
+    assert results[1]["error"] == agent.BATCH_MISSING_MESSAGE
+
+
+def test_answers_are_cached_for_the_single_query_endpoint(models):
+    batch = flask_batch(["what does the modem say"])
+    single = agent.app.test_client().post('/api/seance', json={"user_query": "what does the modem say"})
+    assert single.get_json()["interpretation"] == batch[0]["interpretation"]
+    assert models.calls == 1
+
+
+def test_oversized_batch_is_refused(models):
+    response = agent.app.test_client().post(
+        '/api/seance/batch', json={"queries": ["modem"] * (agent.BATCH_MAX_QUERIES + 1)})
+    assert response.status_code == 400
+    assert models.calls == 0
@@ -0,0 +1,78 @@
+"""Conditional /api/seance requests: what goes into the ETag and which answers get one."""
+
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+from archive_format import write_archive
+from archive_store import ArchiveStore
+from fuzzy_index import FuzzyStore
+from llm_gateway import LLMGateway
+from response_cache import ResponseCache
+
+ENTRIES = [
+    {"id": 1, "path": "/menu/semantic/modem", "content": "The modem sings of dial tones."},
+    {"id": 2, "path": "/menu/semantic/ghost", "content": "A ghost lingers in the wire."},
+]
+
+
+class StubModels:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, model, contents, config=None, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(text="Hark, the Gopher nexus coughs up a cipher...\n\nThe modem remembers.")
+
+
+@pytest.fixture
+def seance(tmp_path, monkeypatch):
+    """The Flask app over a two-entry archive, a stub model and an empty answer cache."""
+    path = str(tmp_path / "gopher_archive.jsonl")
+    write_archive(path, ENTRIES)
+    client = SimpleNamespace(models=StubModels())
+    monkeypatch.setattr(agent, 'archive_store', ArchiveStore(path))
+    monkeypatch.setattr(agent, 'fuzzy_store', FuzzyStore(str(tmp_path / "fuzzy.index")))
+    monkeypatch.setattr(agent, 'client', client)
+    monkeypatch.setattr(agent, 'gateway', LLMGateway(client))
+    monkeypatch.setattr(agent, 'response_cache', ResponseCache())
+    monkeypatch.setattr(agent.rate_limiter, 'rate', 0)
+    http = agent.app.test_client()
+    return lambda query, **headers: http.post('/api/seance', json={"user_query": query}, headers=headers)
+
+
+def test_repeat_question_is_answered_with_304(seance):
+    first = seance("What does the modem say?")
+    etag = first.headers['ETag']
+
+    again = seance("what does the MODEM say?", **{'If-None-Match': etag})
+
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+    assert again.get_data() == b''
+
+
+def test_persona_change_changes_the_etag(seance, monkeypatch):
+    etag = seance("What does the modem say?").headers['ETag']
+    monkeypatch.setattr(agent.prompts, 'instruction', lambda name: "A different medium entirely.")
+
+    again = seance("What does the modem say?", **{'If-None-Match': etag})
+
+    assert again.status_code == 200
+    assert again.headers['ETag'] != etag
+
+
+def test_random_fallback_gets_no_etag(seance):
+    response = seance("Tell me about zeppelins")
+
+    assert response.status_code == 200
+    assert response.get_json()["cryptic_response"].startswith(agent.NO_MATCH_PREFIX)
+    assert 'ETag' not in response.headers
+
+
+def test_revalidates_only_real_answers():
+    assert agent.revalidates("Matching Ciphers:\nmodem", "The modem remembers.")
+    assert not agent.revalidates("Matching Ciphers:\nmodem", agent.SPIRITS_ANGERED_MESSAGE)
+    assert not agent.revalidates(f"{agent.NO_MATCH_PREFIX} However...", "The modem remembers.")
+    assert not agent.revalidates(agent.ARCHIVE_UNAVAILABLE_MESSAGE, "The modem remembers.")
@@ -0,0 +1,179 @@
+"""The semantic cipher pipeline against a stub client: concurrent, paced, retried and resumable."""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import semantic_cipher_generator as generator
+from archive_format import iter_archive
+from token_bucket import TokenBucket
+
+WORDS = [f"word{i:03d}" for i in range(250)]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class StubModels:
+    """Answers every batch with one valid cipher per requested word."""
+
+    def __init__(self, fail_first=0, delay=0.0):
+        self.fail_first = fail_first
+        self.delay = delay
+        self.requested = []
+        self.models = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config=None, **kwargs):
+        words = contents.rsplit('\n', 1)[-1].split(', ')
+        with self._lock:
+            self.models.append(model)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            failing = self.fail_first > 0
+            self.fail_first -= failing
+        try:
+            time.sleep(self.delay)
+            if failing:
+                raise ConnectionError("upstream went away")
+            self.requested.extend(words)
+            return SimpleNamespace(text=json.dumps(
+                [{"word": w, "cipher": f"The {w} whispers of the void.", "is_valid": True} for w in words]))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Points the generator at a word list, archive and checkpoint under tmp_path."""
+    (tmp_path / 'wordlist.txt').write_text('\n'.join(WORDS) + '\n', encoding='utf-8')
+    (tmp_path / 'gopher_archive.json').write_text(json.dumps([
+        {"id": 1, "path": "/menu/about", "content": "The original ledger."}]), encoding='utf-8')
+    monkeypatch.setattr(generator, 'WORDLIST_FILE', str(tmp_path / 'wordlist.txt'))
+    monkeypatch.setattr(generator, 'OUTPUT_FILE', str(tmp_path / 'gopher_archive.jsonl'))
+    monkeypatch.setattr(generator, 'LEGACY_OUTPUT_FILE', str(tmp_path / 'gopher_archive.json'))
+    monkeypatch.setattr(generator, 'CHECKPOINT_FILE', str(tmp_path / 'semantic_checkpoint.jsonl'))
+    monkeypatch.setattr(generator, 'MAX_BATCH_SIZE', 25)
+    # The real snapshot and vectors next to the real archive are none of this test's business
+    monkeypatch.setattr(generator, 'refresh_snapshot', lambda source: None)
+    monkeypatch.setattr(generator, 'refresh_semantic_index', lambda source: None)
+    # Quotas generous enough that pacing never waits on the real clock
+    monkeypatch.setattr(generator, 'REQUESTS_PER_MINUTE', 600_000)
+    monkeypatch.setattr(generator, 'TOKENS_PER_MINUTE', 600_000_000)
+    return tmp_path
+
+
+def archive_paths(workspace):
+    return [e['path'] for e in iter_archive(str(workspace / 'gopher_archive.jsonl'))]
+
+
+def run(client_models, sleep=lambda seconds: None):
+    generator.run_semantic_generator(SimpleNamespace(models=client_models), sleep=sleep)
+
+
+def test_every_word_becomes_an_entry(workspace):
+    models = StubModels()
+    run(models)
+    paths = archive_paths(workspace)
+    # Batches are appended as they finish, after the existing entries
+    assert paths[0] == '/menu/about'
+    assert sorted(paths[1:]) == [f"/menu/semantic/{w}" for w in WORDS]
+    assert sorted(models.requested) == WORDS
+
+
+def test_batches_run_concurrently(workspace):
+    models = StubModels(delay=0.05)
+    run(models)
+    assert 1 < models.max_active <= generator.MAX_WORKERS
+
+
+def test_failed_batch_falls_back_then_is_retried_with_backoff(workspace, monkeypatch):
+    monkeypatch.setattr(generator, 'MAX_WORKERS', 1)
+    models = StubModels(fail_first=3)
+    sleeps = []
+    run(models, sleep=sleeps.append)
+    assert len(archive_paths(workspace)) == 1 + len(WORDS)
+    # Both models fail the first attempt; the retry's fallback succeeds
+    assert models.models[:4] == [generator.MODEL_NAME, generator.FALLBACK_MODEL_NAME] * 2
+    assert len(sleeps) == 1
+    assert all(seconds >= generator.BACKOFF_BASE_SECONDS * 0.5 for seconds in sleeps)
+
+
+def test_rerun_skips_finished_words(workspace):
+    run(StubModels())
+    again = StubModels()
+    run(again)
+    assert again.requested == []
+    assert len(archive_paths(workspace)) == 1 + len(WORDS)
+
+
+def test_interrupted_run_resumes_from_checkpoint(workspace):
+    done = WORDS[:100]
+    with open(workspace / 'semantic_checkpoint.jsonl', 'w', encoding='utf-8') as f:
+        generator.append_checkpoint(f, done, [
+            {"word": w, "cipher": f"The {w} whispers of the void.", "is_valid": True} for w in done])
+        # What a crash in the middle of the next write leaves behind
+        f.write('{"requested": ["word1')
+    models = StubModels()
+    run(models)
+    assert sorted(models.requested) == WORDS[100:]
+    assert sorted(archive_paths(workspace)[1:]) == [f"/menu/semantic/{w}" for w in WORDS]
+
+
+def test_batches_are_paced_by_request_and_token_buckets():
+    clock = FakeClock()
+    requests = TokenBucket(1.0, 2, clock=clock, sleep=clock.sleep)
+    tokens = TokenBucket(10_000, 10_000, clock=clock, sleep=clock.sleep)
+    models = StubModels()
+    gateway = generator.make_gateway(SimpleNamespace(models=models), clock.sleep)
+    for batch in (WORDS[:10], WORDS[10:20], WORDS[20:30], WORDS[30:40]):
+        assert generator.process_batch(gateway, batch, requests, tokens, generator.BatchSizer(),
+                                       generator.GenerationStats(clock), sleep=clock.sleep)
+    # Two requests go out in a burst, then one per second
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_cut_off_response_keeps_its_complete_items():
+    items, truncated = generator.parse_items('[{"word": "a", "cipher": "c1"}, {"word": "b", "cipher": "c2"}, {"wo')
+    assert truncated
+    assert [item["word"] for item in items] == ["a", "b"]
+    assert generator.parse_items('[]') == ([], False)
+
+
+def test_reconcile_separates_skipped_from_cut_off_words():
+    cipher = "The word whispers of the void."
+    items = [{"word": "Alpha", "cipher": cipher, "is_valid": True},
+             {"word": "gamma", "cipher": cipher, "is_valid": True},
+             {"word": "delta", "cipher": "", "is_valid": True}]
+    answered, missing, unreached = generator.reconcile(
+        ["alpha", "beta", "gamma", "delta", "epsilon"], items, truncated=True)
+    assert [item["word"] for item in answered] == ["alpha", "gamma"]
+    assert missing == ["beta"]
+    assert unreached == ["delta", "epsilon"]
+
+
+def test_sizer_shrinks_after_a_cut_off_response_and_grows_back():
+    sizer = generator.BatchSizer(size=200, output_budget=100_000, request_budget=10_000_000)
+    sizer.observe(200, {"items": [{}] * 80, "truncated": True, "output_tokens": 4000})
+    # 80 words fit; the cut-off also shows the real response limit
+    assert (sizer.size(), sizer.output_budget) == (60, 4000)
+    sizer.observe(60, {"items": [{}] * 60, "truncated": False, "output_tokens": 3000})
+    assert sizer.ceiling == 60 + generator.BATCH_GROWTH
+    # Now the 4000-token limit at about 40 tokens a word is what holds it back
+    assert sizer.size() == int(4000 * generator.OUTPUT_HEADROOM / sizer.output_per_word) == 74
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from archive_format import append_entries
+from archive_store import ArchiveSnapshot
+
+np = pytest.importorskip('numpy')
+import semantic_index  # noqa: E402
+from semantic_index import SemanticStore, build_semantic_index, fit, save  # noqa: E402
+
+TEXTS = [
+    'The modem hums a dial tone into the night line',
+    'A modem handshake screams across the copper line',
+    'Static on the phone line hides the dial tone',
+    'The gopher burrows under the garden soil',
+    'Soil and roots shelter the gopher from the hawk',
+    'The hawk circles the garden looking for a gopher',
+    'Ghosts whisper through the dial tone at midnight',
+    'Midnight ghosts haunt the copper phone line',
+    'Roots crack the garden wall where the hawk waits',
+    'A whisper of static at midnight on the line',
+]
+
+
+def entries(texts, first_id=1):
+    return [{"id": first_id + i, "path": f"/menu/semantic/e{first_id + i}", "content": t}
+            for i, t in enumerate(texts)]
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def store(tmp_path):
+    source = str(tmp_path / 'gopher_archive.jsonl')
+    model_path, vectors_path = str(tmp_path / 'semantic.npz'), str(tmp_path / 'semantic.npy')
+    append_entries(source, entries(TEXTS))
+    build_semantic_index(source, model_path, vectors_path)
+    return SemanticStore(model_path, vectors_path)
+
+
+def test_appended_entries_are_folded_in_without_copying_the_map(store):
+    archive = ArchiveSnapshot(entries(TEXTS + ['The hawk and the gopher meet in the garden']), 1)
+    index = store.get(archive)
+    assert isinstance(index.vectors, np.memmap)
+    assert len(index.vectors) == len(TEXTS)
+    assert len(index) == len(archive)
+    assert len(TEXTS) in index.rank(['gopher', 'hawk'], len(archive))
+
+
+def test_changed_prefix_is_rebuilt_in_the_background(store):
+    # Same length, but an entry the index was built from was rewritten
+    changed = TEXTS[:3] + ['The hawk guards the modem garden'] + TEXTS[4:]
+    archive = ArchiveSnapshot(entries(changed), 2)
+    assert store.get(archive) is None
+    wait_for(lambda: not store._rebuilding)
+    index = store.get(archive)
+    assert index is not None
+    assert index.digest == semantic_index.archive_digest(zip(archive.ids, archive.paths, archive.contents))
+
+
+def test_renumbered_entries_do_not_match(store):
+    archive = ArchiveSnapshot(entries(TEXTS, first_id=100), 3)
+    assert store.get(archive) is None
+    wait_for(lambda: not store._rebuilding)
+    assert store.get(archive) is not None
+
+
+def test_index_without_a_digest_is_rebuilt(store):
+    index = fit(TEXTS)
+    save(index, store.model_path, store.vectors_path)
+    archive = ArchiveSnapshot(entries(TEXTS), 4)
+    assert store.get(archive) is None
+    wait_for(lambda: not store._rebuilding)
+    assert store.get(archive).digest is not None
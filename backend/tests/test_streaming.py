@@ -0,0 +1,62 @@
+"""WordLimitStream against the rules applied to a finished response."""
+
+import random
+
+import pytest
+
+from agent import enforce_word_limit
+from streaming import OPENING_PHRASE, WordLimitStream
+
+BODIES = [
+    "The modem hums beneath the static.",
+    "  leading spaces,\tthen a tab and\na new line  ",
+    ' '.join(f"word{i}" for i in range(85)),
+    ' '.join(f"word{i}" for i in range(86)),
+    '\n'.join(f"line {i} of the long prophecy" for i in range(40)),
+]
+TEXTS = [body for body in BODIES] + [OPENING_PHRASE + body for body in BODIES] + \
+    [f"{OPENING_PHRASE}\n\n{body}" for body in BODIES] + [f"{OPENING_PHRASE} {body}" for body in BODIES]
+
+
+def finished(text):
+    """What the blocking path makes of a complete model response."""
+    if not text.startswith(OPENING_PHRASE):
+        text = f"{OPENING_PHRASE}\n\n{text}"
+    return enforce_word_limit(text, max_words=85)
+
+
+def streamed(chunks):
+    stream = WordLimitStream(max_words=85)
+    return ''.join(stream.feed(chunk) for chunk in chunks) + stream.close()
+
+
+def random_chunks(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 30))))
+    return [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize('text', TEXTS, ids=range(len(TEXTS)))
+def test_output_does_not_depend_on_chunking(text):
+    rng = random.Random(text)
+    whole = streamed([text])
+    for _ in range(50):
+        assert streamed(random_chunks(text, rng)) == whole
+
+
+@pytest.mark.parametrize('text', TEXTS, ids=range(len(TEXTS)))
+def test_words_and_cut_point_match_finished_response(text):
+    out, expected = streamed([text]), finished(text)
+    assert out.startswith(f"{OPENING_PHRASE}\n\n")
+    # A finished response under the limit keeps whatever the model put after the phrase
+    assert out[len(OPENING_PHRASE):].split() == expected[len(OPENING_PHRASE):].split()
+
+
+@pytest.mark.parametrize('opening', ['', OPENING_PHRASE, f"{OPENING_PHRASE}\n\n", f"{OPENING_PHRASE} "])
+def test_truncated_single_spaced_response_is_identical(opening):
+    text = opening + BODIES[3]
+    assert streamed([text]) == finished(text)
+
+
+def test_model_starting_with_a_word_gets_a_blank_line():
+    assert streamed([OPENING_PHRASE, "Beware"]) == f"{OPENING_PHRASE}\n\nBeware"
+    assert streamed(["Beware"]) == f"{OPENING_PHRASE}\n\nBeware"
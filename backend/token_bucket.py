@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`.
+
+    The clock and sleep functions are injectable so callers can drive it
+    from a fake clock.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount=1):
+        """Takes `amount` tokens if available; otherwise returns the seconds to wait.
+
+        Returns 0.0 on success. Requests larger than the capacity are capped
+        at the capacity, so they can still go through once the bucket is full.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(self.clock())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def acquire(self, amount=1):
+        """Blocks until `amount` tokens could be taken."""
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return
+            self.sleep(wait)
@@ -12,6 +12,11 @@ const BASE_VOLUME = 0.5;
 const CHAOS_MUSIC_VOLUME = 0.7;
 const VOICE_DIM_VOLUME = 0.2;
 
+// Prophecies already received, by question, with the ETag to revalidate them;
+// the server answers a repeated question with 304 and an empty body
+const prophecyCache = new Map();
+const prophecyKey = (query) => query.trim().toLowerCase().split(/\s+/).join(' ');
+
 // --- SCATTERED TEXT COMPONENT ---
 const ScatteredText = ({ text, className = '' }) => {
   return (
@@ -649,19 +654,25 @@ function SeancePage() { // Renamed from App to SeancePage to match file name and
     }
 
     try {
+      const cached = prophecyCache.get(prophecyKey(query));
       const response = await fetch('http://localhost:5000/api/seance', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...(cached ? { 'If-None-Match': cached.etag } : {}),
         },
         body: JSON.stringify({ user_query: query }),
       });
 
-      const data = await response.json();
+      const data = response.status === 304 ? cached.data : await response.json();
 
-      if (!response.ok) {
+      if (!response.ok && response.status !== 304) {
         throw new Error(data.error || 'The nexus rejected the transmission.');
       }
+      const etag = response.headers.get('ETag');
+      if (etag) {
+        prophecyCache.set(prophecyKey(query), { etag, data });
+      }
 
       setResult(data);
       